@@ -0,0 +1,184 @@
+#!/usr/bin/python
+import argparse, json, os, shutil, sys, tempfile, time, urwid
+from fake_songza import FakeSongza
+from fake_player import FakePlayer, SimulatedClock
+from station import Station
+from mixzatape import MixZaTape
+from jukebox import Jukebox
+from metrics import metrics
+from daemon import HeadlessScreen
+
+# percentile(values, p)
+# =====================
+# The p-th percentile of a list of values, or None if it is empty.
+def percentile(values, p):
+	if not values:
+		return None
+
+	values = sorted(values)
+	index = int(round((len(values) - 1) * p / 100.0))
+	return values[index]
+
+# Benchmark
+# =========
+# Drives `Station`, `Jukebox` and `MixZaTape` against a local `FakeSongza` with a
+# `FakePlayer` on a sped-up clock, and measures:
+# * tracks per (simulated) minute
+# * skip-to-audio latency: real time from a skip until the next track starts
+# * UI stall time: how late the main loop runs a heartbeat alarm
+# * app wakeups: number of times the app's timer fired
+# * gaps between tracks, as measured by the app, in simulated time
+class Benchmark:
+	def __init__(self, args):
+		self.args = args
+
+		# heartbeat lateness samples, and skip / track start times (real seconds)
+		self.stalls = []
+		self.skips = []
+		self.starts = []
+		self.ticks = 0
+
+	# run()
+	# =====
+	# Runs the benchmark in a scratch directory, and returns the report.
+	def run(self):
+		args = self.args
+		cwd = os.getcwd()
+		workdir = tempfile.mkdtemp(prefix="mixzatape-bench-")
+		os.chdir(workdir)
+
+		# start without a saved station
+		open(".save", "w").close()
+
+		server = FakeSongza(latency=args.latency, bandwidth=args.bandwidth, bitrate=args.bitrate)
+		server.start()
+
+		try:
+			return self.drive(server)
+		finally:
+			server.stop()
+			os.chdir(cwd)
+			shutil.rmtree(workdir)
+
+	# drive(server)
+	# =============
+	def drive(self, server):
+		args = self.args
+
+		# synthetic audio is sized from the bitrate, so the file gives us the length back
+		clock = SimulatedClock(speed=args.speed)
+		player = FakePlayer(clock, lambda file: os.path.getsize(file) * 8 / args.bitrate)
+		station = Station(player, 0, domain=server.host)
+
+		# note the real time every track starts
+		start = player.start
+		def timed_start(file, at):
+			self.starts.append(time.time())
+			start(file, at)
+		player.start = timed_start
+
+		jukebox = Jukebox()
+		jukebox.queue_depth = args.queue_depth
+		jukebox.handoff_lead = args.handoff
+		jukebox.playback_rate = args.speed
+
+		tick = jukebox.tick
+		def counted_tick(*args):
+			self.ticks += 1
+			tick(*args)
+		jukebox.tick = counted_tick
+
+		urwid.set_encoding("utf-8")
+		screen = HeadlessScreen((80, 40))
+		screen.start()
+		jukebox.setup(player, station, server.fixtures["search"][0]["id"])
+		loop = MixZaTape().setup(jukebox, station, screen)
+
+		heartbeat = .01
+		def schedule_beat():
+			expected = time.time() + heartbeat
+			loop.event_loop.alarm(heartbeat, lambda: beat(expected))
+
+		def beat(expected):
+			self.stalls.append(max(time.time() - expected, 0))
+			schedule_beat()
+
+		def skip():
+			self.skips.append(time.time())
+			jukebox.skip()
+			loop.event_loop.alarm(args.skip_every, skip)
+
+		def finish():
+			raise urwid.ExitMainLoop()
+
+		schedule_beat()
+		if args.skip_every:
+			loop.event_loop.alarm(args.skip_every, skip)
+		loop.event_loop.alarm(args.duration, finish)
+
+		started = clock.time()
+		loop.run()
+		minutes = (clock.time() - started) / 60.0
+
+		jukebox.prefetcher.stop()
+		station.close()
+
+		return self.report(player, screen, server, minutes, list(jukebox.timeline.gaps))
+
+	# skip_latencies()
+	# ================
+	# Real time from each skip to the first track start after it.
+	def skip_latencies(self):
+		latencies = []
+		for skip in self.skips:
+			later = [start for start in self.starts if start >= skip]
+			if later:
+				latencies.append(later[0] - skip)
+
+		return latencies
+
+	# report(player, screen, server, minutes, gaps)
+	# =============================================
+	def report(self, player, screen, server, minutes, gaps):
+		latencies = self.skip_latencies()
+		ms = lambda value: None if value is None else round(value * 1000, 2)
+
+		return {
+			"tracks": len(player.played),
+			"simulated_minutes": round(minutes, 2),
+			"tracks_per_minute": round(len(player.played) / minutes, 3) if minutes else None,
+			"skips": len(self.skips),
+			"skips_without_audio": len(self.skips) - len(latencies),
+			"skip_latency_ms": dict(("p{0}".format(p), ms(percentile(latencies, p))) for p in (50, 90, 99, 100)),
+			"ui_stall_ms": {
+				"p50": ms(percentile(self.stalls, 50)),
+				"p99": ms(percentile(self.stalls, 99)),
+				"max": ms(percentile(self.stalls, 100)),
+				"total": ms(sum(self.stalls))
+			},
+			"gaps": len(gaps),
+			"gap_ms": dict(("p{0}".format(p), ms(percentile(gaps, p))) for p in (50, 99, 100)),
+			"frames": screen.frames,
+			"ticks": self.ticks,
+			"requests": server.requests,
+			"timings_ms": dict(
+				(name, dict((key, ms(summary[key])) for key in ("p50", "p99", "max")))
+				for name, summary in metrics.snapshot()["histograms"].items()
+			)
+		}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Benchmarks mixzatape against a local stand-in for Songza")
+	parser.add_argument("--duration", type=float, default=10, help="Real seconds to run for")
+	parser.add_argument("--speed", type=float, default=100, help="Simulated seconds per real second")
+	parser.add_argument("--queue-depth", type=int, default=2, help="Tracks kept downloaded ahead")
+	parser.add_argument("--handoff", type=int, default=5, help="Seconds before the end of a track to queue the next one, simulated")
+	parser.add_argument("--skip-every", type=float, default=1, help="Real seconds between skips; 0 to never skip")
+	parser.add_argument("--latency", type=float, default=.05, help="Seconds added to every API request")
+	parser.add_argument("--bandwidth", type=int, default=1024 * 1024, help="Bytes per second for audio downloads")
+	parser.add_argument("--bitrate", type=int, default=64000, help="Bits per second of the synthetic audio")
+	args = parser.parse_args()
+
+	report = Benchmark(args).run()
+	json.dump(report, sys.stdout, indent=2, sort_keys=True)
+	print
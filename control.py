@@ -0,0 +1,357 @@
+import errno, json, os, socket
+
+# Control protocol
+# ================
+# A `Jukebox` can be controlled through a UNIX socket, e.g. one running headless
+# as a daemon. Both ways, messages are JSON objects, one per line.
+#
+# Clients send commands:
+# * {"command": "skip"}
+# * {"command": "vote", "up": true}; a downvote also skips
+# * {"command": "station", "id": 1393494, "name": "..."}
+# * {"command": "status"}
+# * {"command": "pause"}, "seek", "volume_up", "volume_down", "replay_last"
+# * {"command": "quit"}: stops the daemon
+#
+# The server sends {"status": {...}} (see `Jukebox.status()`) on connecting, in
+# answer to "status", and whenever the status changes, so clients can keep up
+# without polling; or {"error": "..."} for a command it can't carry out.
+
+# ControlServer
+# =============
+# Listens on a UNIX socket for clients, carries out their commands on a jukebox,
+# and pushes its status to all of them. Runs in the jukebox's main loop.
+class ControlServer:
+	# constructor
+	# * on_quit: called when a client sends "quit"
+	def __init__(self, jukebox, path="./.control.sock", on_quit=None):
+		self.jukebox = jukebox
+		self.path = path
+		self.on_quit = on_quit
+
+		# max_backlog
+		# ===========
+		# Bytes that may wait to be sent to a client that isn't reading them,
+		# before it is disconnected
+		self.max_backlog = 64 * 1024
+
+		# clients
+		# =======
+		# Connected clients, by socket file descriptor
+		self.clients = {}
+
+		self.sock = None
+		self.loop = None
+		self.handle = None
+
+	# start(loop)
+	# ===========
+	# Starts listening, taking over the socket file of a server that is gone.
+	# Raises socket.error if another server is still listening on it.
+	def start(self, loop):
+		if os.path.exists(self.path):
+			probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				probe.connect(self.path)
+			except socket.error:
+				os.remove(self.path)
+			else:
+				raise socket.error(errno.EADDRINUSE, "Already serving on {0}".format(self.path))
+			finally:
+				probe.close()
+
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.bind(self.path)
+		self.sock.listen(5)
+		self.sock.setblocking(0)
+
+		self.loop = loop
+		self.handle = loop.watch_file(self.sock.fileno(), self.on_connect)
+		self.jukebox.listen(self.broadcast)
+
+	# stop()
+	# ======
+	# Disconnects all clients and stops listening.
+	def stop(self):
+		if self.sock is None:
+			return
+
+		self.jukebox.unlisten(self.broadcast)
+		for client in self.clients.values():
+			self.disconnect(client)
+
+		self.loop.remove_watch_file(self.handle)
+		self.sock.close()
+		self.sock = None
+		os.remove(self.path)
+
+	# on_connect()
+	# ============
+	# Accepts a client, and sends it the status to start from.
+	def on_connect(self):
+		try:
+			sock, address = self.sock.accept()
+		except socket.error as ex:
+			if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+			raise
+
+		sock.setblocking(0)
+		client = ControlConnection(sock)
+		client.handle = self.loop.watch_file(sock.fileno(), lambda: self.on_readable(client))
+		self.clients[client.fd] = client
+
+		self.send(client, {"status": self.jukebox.status()})
+
+	# disconnect(client)
+	# ==================
+	def disconnect(self, client):
+		if self.clients.pop(client.fd, None) is not None:
+			self.loop.remove_watch_file(client.handle)
+			client.sock.close()
+
+	# on_readable(client)
+	# ===================
+	# Reads commands from a client, and carries them out.
+	def on_readable(self, client):
+		try:
+			data = client.sock.recv(4096)
+		except socket.error as ex:
+			if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return
+			data = ""
+
+		# the client has gone away
+		if not data:
+			self.disconnect(client)
+			return
+
+		lines = (client.buffer + data).split("\n")
+		client.buffer = lines.pop()
+
+		if len(client.buffer) > self.max_backlog:
+			self.disconnect(client)
+			return
+
+		for line in lines:
+			# a command may have disconnected it
+			if line.strip() and client.fd in self.clients:
+				self.handle_command(client, line)
+
+	# handle_command(client, line)
+	# ============================
+	def handle_command(self, client, line):
+		try:
+			message = json.loads(line)
+			command = message["command"]
+		except (ValueError, TypeError, KeyError):
+			self.send(client, {"error": "Not a command: {0}".format(line)})
+			return
+
+		jukebox = self.jukebox
+		if command == "status":
+			self.send(client, {"status": jukebox.status()})
+		elif command == "skip":
+			jukebox.skip()
+		elif command == "vote":
+			if message.get("up"):
+				jukebox.upvote()
+			else:
+				jukebox.downvote()
+		elif command == "station" and "id" in message:
+			jukebox.change_station(message.get("name"), message["id"])
+		elif command in ("pause", "seek", "volume_up", "volume_down", "replay_last"):
+			getattr(jukebox, command)()
+		elif command == "quit" and self.on_quit is not None:
+			self.on_quit()
+		else:
+			self.send(client, {"error": "Unknown command: {0}".format(command)})
+
+	# broadcast(status)
+	# =================
+	# Pushes the status to every client.
+	def broadcast(self, status):
+		data = json.dumps({"status": status}) + "\n"
+		for client in self.clients.values():
+			self.write(client, data)
+
+	# send(client, message)
+	# =====================
+	def send(self, client, message):
+		self.write(client, json.dumps(message) + "\n")
+
+	# write(client, data)
+	# ===================
+	# Sends as much as the client takes without blocking; the rest goes out with
+	# whatever is sent to it next. A client that falls too far behind is dropped.
+	def write(self, client, data):
+		client.backlog += data
+		try:
+			while client.backlog:
+				sent = client.sock.send(client.backlog)
+				client.backlog = client.backlog[sent:]
+		except socket.error as ex:
+			if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+				self.disconnect(client)
+				return
+
+		if len(client.backlog) > self.max_backlog:
+			self.disconnect(client)
+
+# ControlConnection
+# =================
+# A client connected to a `ControlServer`.
+class ControlConnection:
+	def __init__(self, sock):
+		self.sock = sock
+		self.fd = sock.fileno()
+		self.handle = None
+
+		# partial command read, and data not yet sent
+		self.buffer = ""
+		self.backlog = ""
+
+# ControlClient
+# =============
+# Controls a jukebox through a `ControlServer`; stands in for the `Jukebox` it
+# controls, with the same commands and status, so `MixZaTape` can be a thin
+# client on the socket. The status is kept up to date from what the server
+# pushes, through the main loop.
+class ControlClient:
+	def __init__(self, path="./.control.sock"):
+		self.path = path
+
+		# last_status
+		# ===========
+		# Status last sent by the server
+		self.last_status = {
+			"station_id": None,
+			"station_name": None,
+			"track": None,
+			"remaining": None,
+			"paused": False,
+			"message": "",
+			"rate": 1
+		}
+
+		# listeners
+		# =========
+		# Functions called with the status whenever the server sends it
+		self.listeners = []
+
+		# partial line read from the socket
+		self.buffer = ""
+		self.sock = None
+		self.loop = None
+		self.handle = None
+
+	# connect()
+	# =========
+	# Connects to the server; raises socket.error if there is none.
+	def connect(self):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			self.sock.connect(self.path)
+		except socket.error:
+			self.sock.close()
+			self.sock = None
+			raise
+
+	# start(loop)
+	# ===========
+	# Reads what the server sends through the specified main loop.
+	def start(self, loop):
+		self.loop = loop
+		if self.sock is not None:
+			self.handle = loop.watch_file(self.sock.fileno(), self.on_readable)
+
+	# close()
+	# =======
+	# Disconnects, leaving the jukebox playing.
+	def close(self):
+		if self.handle is not None:
+			self.loop.remove_watch_file(self.handle)
+			self.handle = None
+
+		if self.sock is not None:
+			self.sock.close()
+			self.sock = None
+
+	def listen(self, listener):
+		self.listeners.append(listener)
+
+	def unlisten(self, listener):
+		self.listeners.remove(listener)
+
+	def status(self):
+		return self.last_status
+
+	# on_readable()
+	# =============
+	# Reads whatever the server has sent, and tells the listeners about new status.
+	def on_readable(self):
+		try:
+			data = self.sock.recv(4096)
+		except socket.error:
+			data = ""
+
+		# the server has gone away
+		if not data:
+			self.close()
+			self.update(dict(self.last_status, paused=True, message="Disconnected from {0}".format(self.path)))
+			return
+
+		lines = (self.buffer + data).split("\n")
+		self.buffer = lines.pop()
+
+		for line in lines:
+			if not line:
+				continue
+
+			message = json.loads(line)
+			if "status" in message:
+				self.update(message["status"])
+			elif "error" in message:
+				self.update(dict(self.last_status, message=message["error"]))
+
+	# update(status)
+	# ==============
+	def update(self, status):
+		self.last_status = status
+		for listener in list(self.listeners):
+			listener(status)
+
+	# send(command, **args)
+	# =====================
+	# Sends a command to the server; nothing happens if disconnected.
+	def send(self, command, **args):
+		if self.sock is not None:
+			args["command"] = command
+			self.sock.sendall(json.dumps(args) + "\n")
+
+	def skip(self):
+		self.send("skip")
+
+	def upvote(self):
+		self.send("vote", up=True)
+
+	def downvote(self):
+		self.send("vote", up=False)
+
+	def change_station(self, station_name, station_id):
+		self.send("station", id=station_id, name=station_name)
+
+	def pause(self):
+		self.send("pause")
+
+	def seek(self):
+		self.send("seek")
+
+	def volume_up(self):
+		self.send("volume_up")
+
+	def volume_down(self):
+		self.send("volume_down")
+
+	def replay_last(self):
+		self.send("replay_last")
@@ -0,0 +1,106 @@
+import os, signal, urwid
+from control import ControlServer
+
+# HeadlessScreen
+# ==============
+# An urwid screen that takes no input and renders every frame but draws it
+# nowhere, to run a main loop without a terminal.
+# * size: columns and rows of the screen
+class HeadlessScreen(urwid.BaseScreen):
+	def __init__(self, size=(1, 1)):
+		urwid.BaseScreen.__init__(self)
+		self.size = size
+
+		# frames
+		# ======
+		# Number of frames rendered so far
+		self.frames = 0
+
+	def get_cols_rows(self):
+		return self.size
+
+	def get_input_descriptors(self):
+		return []
+
+	def get_input_nonblocking(self):
+		return None, [], []
+
+	def set_mouse_tracking(self, enable=True):
+		pass
+
+	def draw_screen(self, size, canvas):
+		for row in canvas.content():
+			pass
+		self.frames += 1
+
+# Daemon
+# ======
+# Runs a jukebox without a screen, controlled through a `ControlServer`, and
+# optionally detached from the terminal so playback carries on after it closes.
+# Stops on SIGTERM or SIGINT, or the "quit" command, saving the state.
+class Daemon:
+	def __init__(self, jukebox, socket_path="./.control.sock"):
+		self.jukebox = jukebox
+		self.socket_path = socket_path
+		self.loop = None
+		self.server = None
+
+		# write end of the pipe that hands signals to the main loop
+		self.pipe = None
+
+	# detach()
+	# ========
+	# Moves into the background as a daemon: forks twice, so no terminal is ever
+	# reattached, and redirects the standard streams to /dev/null. Call it before
+	# any threads are started; only the calling thread survives a fork.
+	def detach(self):
+		if os.fork():
+			os._exit(0)
+
+		os.setsid()
+		if os.fork():
+			os._exit(0)
+
+		null = os.open(os.devnull, os.O_RDWR)
+		for fd in (0, 1, 2):
+			os.dup2(null, fd)
+		os.close(null)
+
+	# run(player, station, station_id)
+	# ================================
+	# Plays until stopped; raises socket.error if another daemon is already
+	# serving on the socket.
+	def run(self, player, station, station_id=None):
+		self.jukebox.setup(player, station, station_id)
+
+		try:
+			screen = HeadlessScreen()
+			screen.start()
+			self.loop = urwid.MainLoop(urwid.SolidFill(), screen=screen, handle_mouse=False)
+			self.server = ControlServer(self.jukebox, self.socket_path, self.stop)
+			self.server.start(self.loop)
+			self.jukebox.start(self.loop)
+
+			# stop from the main loop, not from whatever the signal interrupted
+			self.pipe = self.loop.watch_pipe(self.on_signal)
+			for signum in (signal.SIGTERM, signal.SIGINT):
+				signal.signal(signum, lambda signum, frame: os.write(self.pipe, "x"))
+		except:
+			# e.g. another daemon has the socket; stop the threads setup started
+			self.jukebox.close()
+			raise
+
+		self.loop.run()
+
+	# on_signal(data)
+	# ===============
+	def on_signal(self, data):
+		self.stop()
+
+	# stop()
+	# ======
+	# Disconnects the clients, stops the music and saves the state, then leaves the main loop.
+	def stop(self):
+		self.server.stop()
+		self.jukebox.close()
+		raise urwid.ExitMainLoop()
@@ -0,0 +1,201 @@
+import itertools, json, os, threading, time, Queue
+from metrics import metrics
+
+# EventLog
+# ========
+# Structured debug log: each record is one JSON object per line, with the time,
+# level, source (e.g. "station") and event name, plus any fields given. Records
+# are handed to a background thread that formats and writes them, so logging
+# never makes the caller wait on the disk; if the thread falls behind, records
+# are dropped (and counted) rather than queued without bound.
+#
+# The file is rotated once it reaches `max_bytes`, keeping `backups` old ones
+# (".1" being the newest), and events that come in at a high rate can be
+# sampled, keeping one record in every so many.
+class EventLog:
+	# constructor
+	# * capacity: records that may wait to be written before new ones are dropped
+	def __init__(self, path="./.debug.log", max_bytes=1024 * 1024, backups=2, capacity=10000):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.backups = backups
+		self.queue = Queue.Queue(capacity)
+
+		# sampling
+		# ========
+		# "source.event" => keep one record in this many
+		self.sampling = {}
+
+		# counts
+		# ======
+		# "source.event" => running count of the records of a sampled event
+		self.counts = {}
+
+		self.thread = None
+		self.file = None
+		self.size = 0
+		self.lock = threading.Lock()
+
+	# logger(source, enabled)
+	# =======================
+	# Returns a logger for records from the specified source, opening the log if
+	# it is enabled; a disabled logger drops everything.
+	def logger(self, source, enabled=True):
+		if enabled:
+			self.open()
+
+		return Logger(self, source, enabled)
+
+	# sample(event, every)
+	# ====================
+	# Keeps only one in every so many records of a "source.event"; the records
+	# kept say how many they stand for in their "sampled" field.
+	def sample(self, event, every):
+		self.sampling[event] = every
+		self.counts[event] = itertools.count()
+
+	# open()
+	# ======
+	# Starts the writer thread, unless already running.
+	def open(self):
+		with self.lock:
+			if self.thread is not None:
+				return
+
+			self.thread = threading.Thread(target=self.run, name="eventlog")
+			self.thread.daemon = True
+			self.thread.start()
+
+	# close()
+	# =======
+	# Writes out the records still queued, and stops the writer thread.
+	def close(self):
+		with self.lock:
+			thread, self.thread = self.thread, None
+
+		if thread is not None:
+			self.queue.put(None)
+			thread.join()
+
+	# emit(level, source, event, fields)
+	# ==================================
+	# Queues a record; never blocks.
+	def emit(self, level, source, event, fields):
+		if self.thread is None:
+			return
+
+		name = source + "." + event
+		every = self.sampling.get(name)
+		if every is not None:
+			# itertools.count is safe to advance from any thread
+			if next(self.counts[name]) % every:
+				return
+
+			fields["sampled"] = every
+
+		try:
+			self.queue.put_nowait((time.time(), level, source, event, fields))
+		except Queue.Full:
+			metrics.increment("log.dropped")
+
+	# run()
+	# =====
+	# Writes records as they come in, everything queued at once, until closed.
+	def run(self):
+		running = True
+		while running:
+			records = [self.queue.get()]
+			try:
+				while True:
+					records.append(self.queue.get_nowait())
+			except Queue.Empty:
+				pass
+
+			lines = []
+			for record in records:
+				if record is None:
+					running = False
+					break
+
+				lines.append(self.format(record))
+
+			try:
+				self.write(lines)
+			except (IOError, OSError):
+				metrics.increment("log.errors")
+
+		if self.file is not None:
+			self.file.close()
+			self.file = None
+
+	# format(record)
+	# ==============
+	# Returns a queued record as a line of JSON.
+	def format(self, record):
+		at, level, source, event, fields = record
+		data = {"time": round(at, 6), "level": level, "source": source, "event": event}
+		for key, value in fields.items():
+			data.setdefault(key, value)
+
+		return json.dumps(data, default=repr) + "\n"
+
+	# write(lines)
+	# ============
+	# Appends lines to the log file, rotating it whenever it gets too big.
+	def write(self, lines):
+		if self.file is None:
+			self.file = open(self.path, "a")
+			self.size = self.file.tell()
+
+		for line in lines:
+			if self.size and self.size + len(line) > self.max_bytes:
+				self.rotate()
+
+			self.file.write(line)
+			self.size += len(line)
+
+		self.file.flush()
+
+	# rotate()
+	# ========
+	# Moves the log file aside as backup ".1", shifting older backups along and
+	# deleting the oldest, and starts a new file.
+	def rotate(self):
+		self.file.close()
+
+		for i in range(self.backups - 1, 0, -1):
+			older = "{0}.{1}".format(self.path, i)
+			if os.path.exists(older):
+				os.rename(older, "{0}.{1}".format(self.path, i + 1))
+
+		if self.backups > 0:
+			os.rename(self.path, self.path + ".1")
+		else:
+			os.remove(self.path)
+
+		self.file = open(self.path, "a")
+		self.size = 0
+
+# Logger
+# ======
+# Logs records for one source through an `EventLog`; see `EventLog.logger()`.
+class Logger:
+	def __init__(self, log, source, enabled=True):
+		self.log = log
+		self.source = source
+		self.enabled = enabled
+
+	# debug(event, **fields)
+	# ======================
+	def debug(self, event, **fields):
+		if self.enabled:
+			self.log.emit("debug", self.source, event, fields)
+
+	# error(event, **fields)
+	# ======================
+	def error(self, event, **fields):
+		if self.enabled:
+			self.log.emit("error", self.source, event, fields)
+
+# the log shared by the whole app
+log = EventLog()
@@ -0,0 +1,174 @@
+import time
+from player import Player
+
+# SimulatedClock
+# ==============
+# A clock that runs at a multiple of real time, and can be moved forward by hand.
+# With a speed of 0 it only moves when `advance()` is called, which makes it
+# fully deterministic.
+class SimulatedClock:
+	def __init__(self, speed=1.0, start=0):
+		self.speed = speed
+		self.start = start
+		self.real_start = time.time()
+		self.offset = 0
+
+	# time()
+	# ======
+	# The current simulated time, in seconds.
+	def time(self):
+		return self.start + self.offset + (time.time() - self.real_start) * self.speed
+
+	# advance(seconds)
+	# ================
+	# Moves the clock forward.
+	def advance(self, seconds):
+		self.offset += seconds
+
+# FakePlayer
+# ==========
+# An in-process player that plays nothing. Tracks "play" on a simulated clock,
+# so the streaming and UI logic can be exercised (and benchmarked faster than
+# real time) on a box without an audio stack. Queueing follows VLC: once the
+# queue runs dry the player stops, and enqueueing does not restart it.
+class FakePlayer(Player):
+	# constructor
+	# * clock: a SimulatedClock; defaults to one running at real time
+	# * track_length: length of every track in seconds, or a function taking a
+	#   filename and returning its length (e.g. from the file size)
+	def __init__(self, clock=None, track_length=180, debug=False):
+		self.clock = clock if clock is not None else SimulatedClock()
+		self.track_length = track_length
+
+		self.opened = False
+		self.is_paused = False
+		self.volume = 256
+
+		# current & queue
+		# ===============
+		# The file playing now (None when stopped), and the files queued after it
+		self.current = None
+		self.queue = []
+
+		# length
+		# ======
+		# Length of the current track, taken when it started playing
+		self.length = 0
+
+		# started_at
+		# ==========
+		# Clock time at which the current track would have been at position 0
+		self.started_at = 0
+
+		# paused_at
+		# =========
+		# Position in the current track when it was paused
+		self.paused_at = 0
+
+		# played
+		# ======
+		# (clock time, filename) for every track that started playing
+		self.played = []
+
+	# length_of(file)
+	# ===============
+	# Length of the specified file, in seconds.
+	def length_of(self, file):
+		if callable(self.track_length):
+			return self.track_length(file)
+
+		return self.track_length
+
+	# start(file, at)
+	# ===============
+	# Starts playing a file from the beginning at the specified clock time.
+	def start(self, file, at):
+		self.current = file
+		self.length = self.length_of(file)
+		self.started_at = at
+		self.played.append((at, file))
+
+	# update()
+	# ========
+	# Moves through the queue for every track that has ended on the clock.
+	def update(self):
+		if self.is_paused:
+			return
+
+		now = self.clock.time()
+		while self.current is not None:
+			ends_at = self.started_at + self.length
+			if now < ends_at:
+				return
+
+			if self.queue:
+				self.start(self.queue.pop(0), ends_at)
+			else:
+				self.current = None
+
+	def is_open(self):
+		return self.opened
+
+	def play(self, file):
+		if self.is_open():
+			self.enqueue(file)
+		else:
+			self.opened = True
+			self.start(file, self.clock.time())
+
+	def enqueue(self, file):
+		self.update()
+		self.queue.append(file)
+
+	def skip(self):
+		self.update()
+		if self.queue:
+			self.start(self.queue.pop(0), self.clock.time())
+			self.paused_at = 0
+		else:
+			self.current = None
+
+	def pause(self):
+		self.update()
+		if self.is_paused:
+			self.started_at = self.clock.time() - self.paused_at
+		else:
+			self.paused_at = self.clock.time() - self.started_at
+		self.is_paused = not self.is_paused
+
+	def seek(self, seconds):
+		self.update()
+		if self.is_paused:
+			self.paused_at = seconds
+		else:
+			self.started_at = self.clock.time() - seconds
+
+	def volume_up(self):
+		self.volume += 32
+
+	def volume_down(self):
+		self.volume = max(self.volume - 32, 0)
+
+	def get_volume(self):
+		return self.volume
+
+	def stop(self):
+		self.opened = False
+		self.current = None
+		self.queue = []
+
+	def get_time(self):
+		self.update()
+		if self.current is None:
+			return 0
+		if self.is_paused:
+			return int(self.paused_at)
+
+		return int(self.clock.time() - self.started_at)
+
+	def time_remaining(self):
+		self.update()
+		if self.current is None:
+			return -1
+
+		return self.length - self.get_time()
@@ -0,0 +1,200 @@
+#!/usr/bin/python
+import BaseHTTPServer, SocketServer, argparse, json, os, re, threading, time, urlparse
+
+# recorded API responses replayed by the server
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# FakeSongzaHandler
+# =================
+# Answers requests for the Songza API endpoints used by `Station`, plus the
+# synthetic audio files the tracks point to.
+class FakeSongzaHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	# keep-alive, like the real thing
+	protocol_version = "HTTP/1.1"
+
+	routes = [
+		("POST", re.compile(r"^/api/1/station/(\d+)/next$"), "next"),
+		("GET", re.compile(r"^/api/1/search/station$"), "search"),
+		("POST", re.compile(r"^/api/1/station/(\d+)/song/(\d+)/vote/(up|down)$"), "vote"),
+		("GET", re.compile(r"^/audio/(\d+)\.mp4$"), "audio")
+	]
+
+	def do_GET(self):
+		self.route("GET")
+
+	def do_POST(self):
+		self.route("POST")
+
+	# route(method)
+	# =============
+	# Dispatches the request to the matching handler method.
+	def route(self, method):
+		url = urlparse.urlparse(self.path)
+
+		# throw away any request body
+		length = int(self.headers.getheader("Content-Length") or 0)
+		if length:
+			self.rfile.read(length)
+
+		for route_method, regex, name in self.routes:
+			match = regex.match(url.path)
+			if route_method == method and match:
+				self.server.count(name)
+				time.sleep(self.server.latency)
+				getattr(self, "handle_" + name)(urlparse.parse_qs(url.query), *match.groups())
+				return
+
+		self.send_body(404, "{}")
+
+	# send_body(status, body, content_type)
+	# =====================================
+	def send_body(self, status, body, content_type="application/json"):
+		self.send_response(status)
+		self.send_header("Content-Type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def handle_next(self, query, station_id):
+		song = self.server.next_song()
+		self.send_body(200, json.dumps({
+			"station_id": int(station_id),
+			"listen_url": "http://{0}/audio/{1}.mp4".format(self.server.host, song["id"]),
+			"song": song
+		}))
+
+	def handle_search(self, query, *args):
+		text = query.get("query", [""])[0].lower()
+		stations = [s for s in self.server.fixtures["search"] if text in s["name"].lower()]
+		self.send_body(200, json.dumps(stations))
+
+	def handle_vote(self, query, station_id, song_id, direction):
+		self.send_body(200, "{}")
+
+	# handle_audio(query, song_id)
+	# ============================
+	# Sends `duration * bitrate` bytes of filler, throttled to the server bandwidth.
+	def handle_audio(self, query, song_id):
+		song = self.server.songs.get(int(song_id))
+		if song is None:
+			self.send_body(404, "")
+			return
+
+		size = int(song["duration"] * self.server.bitrate / 8)
+		self.send_response(200)
+		self.send_header("Content-Type", "audio/mp4")
+		self.send_header("Content-Length", str(size))
+		self.end_headers()
+
+		chunk_size = 16 * 1024
+		chunk = "\0" * chunk_size
+		start = time.time()
+		sent = 0
+		while sent < size:
+			n = min(chunk_size, size - sent)
+			self.wfile.write(chunk[:n])
+			sent += n
+
+			# sleep until we are back under the bandwidth limit
+			if self.server.bandwidth:
+				ahead = sent * 1.0 / self.server.bandwidth - (time.time() - start)
+				if ahead > 0:
+					time.sleep(ahead)
+
+	def log_message(self, *args):
+		if self.server.verbose:
+			BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+# FakeSongza
+# ==========
+# A local stand-in for the Songza API. Replays the recorded JSON responses in
+# `fixtures/`, and serves synthetic audio files with configurable latency and
+# bandwidth, so the client can be tested and benchmarked offline.
+class FakeSongza(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	daemon_threads = True
+	allow_reuse_address = True
+
+	# constructor
+	# * port: port to listen on; 0 picks a free one
+	# * latency: seconds added to every request
+	# * bandwidth: bytes per second for audio downloads, or None for unlimited
+	# * bitrate: bits per second of the synthetic audio
+	def __init__(self, port=0, latency=0, bandwidth=None, bitrate=64000, fixtures=None, verbose=False):
+		BaseHTTPServer.HTTPServer.__init__(self, ("127.0.0.1", port), FakeSongzaHandler)
+		self.latency = latency
+		self.bandwidth = bandwidth
+		self.bitrate = bitrate
+		self.verbose = verbose
+
+		# host
+		# ====
+		# Host and port to point `Station` at
+		self.host = "127.0.0.1:{0}".format(self.server_address[1])
+
+		if fixtures is None:
+			fixtures = FIXTURES
+
+		self.fixtures = {}
+		for name in ("next", "search"):
+			with open(os.path.join(fixtures, name + ".json")) as file:
+				self.fixtures[name] = json.load(file)
+
+		self.songs = dict((song["id"], song) for song in self.fixtures["next"])
+		self.song_index = 0
+
+		# requests
+		# ========
+		# Number of requests served, by endpoint
+		self.requests = {}
+		self.lock = threading.Lock()
+		self.thread = None
+
+	# handle_error(request, client_address)
+	# ======================================
+	# Clients hanging up mid-download is normal (e.g. on exit); only report errors when verbose.
+	def handle_error(self, request, client_address):
+		if self.verbose:
+			BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+	# count(name)
+	# ===========
+	def count(self, name):
+		with self.lock:
+			self.requests[name] = self.requests.get(name, 0) + 1
+
+	# next_song()
+	# ===========
+	# Returns the next recorded song, cycling through the fixtures.
+	def next_song(self):
+		with self.lock:
+			song = self.fixtures["next"][self.song_index % len(self.fixtures["next"])]
+			self.song_index += 1
+			return song
+
+	# start()
+	# =======
+	# Serves requests on a background thread.
+	def start(self):
+		self.thread = threading.Thread(target=self.serve_forever, name="fake-songza")
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop()
+	# ======
+	def stop(self):
+		if self.thread is not None:
+			self.shutdown()
+			self.thread = None
+		self.server_close()
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="Serves a local stand-in for the Songza API")
+	parser.add_argument("--port", type=int, default=8080)
+	parser.add_argument("--latency", type=float, default=0, help="Seconds added to every request")
+	parser.add_argument("--bandwidth", type=int, default=None, help="Bytes per second for audio downloads")
+	parser.add_argument("--bitrate", type=int, default=64000, help="Bits per second of the synthetic audio")
+	args = parser.parse_args()
+
+	server = FakeSongza(args.port, args.latency, args.bandwidth, args.bitrate, verbose=True)
+	print "Serving on {0}; run mixzatape.py --api {0}".format(server.host)
+	server.serve_forever()
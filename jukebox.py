@@ -0,0 +1,545 @@
+import time
+from prefetch import Prefetcher
+from votes import VoteQueue
+from state import StateStore
+from timeline import Timeline, monotonic
+
+# Jukebox
+# =======
+# Plays a station: keeps tracks downloading ahead, hands them to the player in
+# time, sends votes and saves the app state. It runs in an urwid main loop, with
+# or without a screen, and tells its listeners (the screen of `MixZaTape`, or the
+# clients of a `ControlServer`) whenever its status has changed, so none of them
+# need to poll the player.
+class Jukebox:
+	def __init__(self):
+		# save_file
+		# =========
+		# Used to save & persist app data between sessions
+		self.save_file = "./.save"
+
+		# history_size
+		# ============
+		# Number of played tracks remembered in the saved state
+		self.history_size = 100
+
+		# queue_depth
+		# ===========
+		# Number of tracks kept downloaded ahead of the one playing; with 0, each
+		# track is only fetched once it has to be, to be ready in time
+		self.queue_depth = 2
+
+		# fetch_margin & default_fetch_lead
+		# =================================
+		# Factor of the measured fetch time to allow for a just in time fetch, and
+		# seconds to allow before anything was measured
+		self.fetch_margin = 2
+		self.default_fetch_lead = 30
+
+		# handoff_lead
+		# ============
+		# Seconds before the end of the current track to hand the next one to the player
+		self.handoff_lead = 5
+
+		# stream_interval & ui_interval
+		# =============================
+		# Seconds between checks on the stream when the player can't tell how much
+		# of the track is left, and between updates of the buffering progress
+		self.stream_interval = 1
+		self.ui_interval = .5
+
+		# retry_interval & flush_delay
+		# ============================
+		# Seconds before retrying a failed fetch, and before writing changed state to disk
+		self.retry_interval = 5
+		self.flush_delay = 1
+
+		# drift
+		# =====
+		# Seconds of playback the predicted end of a track may move by before
+		# listeners are told the new time remaining
+		self.drift = .5
+
+		# playback_rate
+		# =============
+		# Seconds of playback per real second; only differs from 1 with a simulated clock
+		self.playback_rate = 1
+
+		# loop & alarm
+		# ============
+		# The main loop, and the handle of the one alarm set by `schedule()`
+		self.loop = None
+		self.alarm = None
+
+		# skip_pending
+		# ============
+		# True if a skip was requested before any upcoming track finished downloading
+		self.skip_pending = False
+
+		# message
+		# =======
+		# Status line for the user, e.g. the progress of a skip
+		self.message = ""
+
+		# listeners
+		# =========
+		# Functions called with the status (see `status()`) whenever it changes
+		self.listeners = []
+
+		# reported_end
+		# ============
+		# Timeline time the current track was to end, as of the last status reported
+		self.reported_end = None
+
+	# setup(player, station, station_id)
+	# ==================================
+	# Wires up the player and station, and loads the saved state.
+	# * station_id: station to play; defaults to the one saved by the last session
+	def setup(self, player, station, station_id=None):
+		self.player = player
+		self.station = station
+
+		# assorted app data persisted between sessions
+		self.state = StateStore(self.save_file)
+		if not self.state.load():
+			self.message = "Unable to read the saved state; starting afresh"
+		self.station.files.load(self.state.get("tracks"))
+
+		self.prefetcher = Prefetcher(self.station, self.on_track_ready)
+
+		# where playback is, in seconds of playback
+		self.timeline = Timeline(lambda: monotonic() * self.playback_rate, self.player.time_resolution)
+
+		# ran_dry_at
+		# ==========
+		# Timeline time the last track ended with nothing queued after it, until the next one plays
+		self.ran_dry_at = None
+
+		# votes are sent in the background; ones not sent before exiting are sent next time
+		self.votes = VoteQueue(self.station, self.state, timeout=self.station.pool.timeout)
+		self.votes.load()
+
+		# start streaming music, if station id was provided
+		# the first track is played as soon as the prefetcher has it
+		if station_id:
+			self.station.station_id = station_id
+			self.fill_queue()
+
+	# start(loop)
+	# ===========
+	# Starts playing in the specified main loop.
+	def start(self, loop):
+		self.loop = loop
+		self.prefetcher.start(loop)
+		self.votes.start()
+		self.player.attach(loop)
+
+		# go back to the saved station once the main loop is running,
+		# so startup never waits on it
+		if not self.station.station_id:
+			loop.set_alarm_in(0, self.load_state)
+		self.schedule()
+
+	# close()
+	# =======
+	# Stops the music, and saves the state.
+	def close(self):
+		if self.alarm is not None:
+			self.loop.remove_alarm(self.alarm)
+			self.alarm = None
+
+		self.prefetcher.stop()
+		self.votes.stop()
+		self.player.stop()
+		self.station.close()
+		self.state.set("tracks", self.station.files.index())
+		self.state.close()
+
+	# listen(listener)
+	# ================
+	# Calls the specified function with the status whenever it changes.
+	def listen(self, listener):
+		self.listeners.append(listener)
+
+	# unlisten(listener)
+	# ==================
+	def unlisten(self, listener):
+		self.listeners.remove(listener)
+
+	# status()
+	# ========
+	# Returns what the user is shown, as a dictionary that can be sent as JSON:
+	# * station_id & station_name: the station playing, or None
+	# * track: id, title, artist and duration of the track playing, or None
+	# * remaining: seconds of playback left in the track, or None if unknown
+	# * paused: True while paused
+	# * message: status line
+	# * rate: seconds of playback per real second
+	def status(self):
+		track = None
+		if bool(self.station.current_track):
+			current = self.station.current_track
+			track = {
+				"id": current["id"],
+				"title": current.get("title"),
+				"artist": current.get("artist", {}).get("name"),
+				"duration": current.get("duration")
+			}
+
+		remaining = self.time_remaining() if track is not None else -1
+
+		return {
+			"station_id": self.station.station_id or None,
+			"station_name": self.state.get("station_name"),
+			"track": track,
+			"remaining": remaining if remaining >= 0 else None,
+			"paused": self.is_paused(),
+			"message": self.message,
+			"rate": self.playback_rate
+		}
+
+	# notify()
+	# ========
+	# Tells the listeners the status has changed, and reschedules, as what
+	# changed it may have changed what happens when.
+	def notify(self):
+		status = self.status()
+		self.reported_end = self.timeline.end()
+		for listener in list(self.listeners):
+			listener(status)
+
+		self.schedule()
+
+	# set_status_line(message)
+	# ========================
+	def set_status_line(self, message):
+		if message != self.message:
+			self.message = message
+			self.notify()
+
+	# tick(loop, user_data)
+	# ======================
+	# The one timer of the jukebox: keeps the music streaming, tells the
+	# listeners about progress and writes changed state to disk, then works out
+	# when to run next.
+	def tick(self, loop=None, user_data=None):
+		self.alarm = None
+		self.stream()
+
+		# let the user know how far along a skip is
+		if self.skip_pending:
+			self.set_status_line(self.buffering_text())
+
+		# the end of the track moved, e.g. the player reported where it is for the first time
+		end = self.timeline.end()
+		if (end is None) != (self.reported_end is None) or (end is not None and abs(end - self.reported_end) > self.drift):
+			self.notify()
+
+		# everything saved since the last tick goes out in one write
+		self.state.flush()
+
+		self.schedule()
+
+	# schedule()
+	# ==========
+	# Sets the timer for the next moment `tick()` has something to do, replacing
+	# any timer already set; call it whenever that moment may have moved.
+	def schedule(self):
+		if self.loop is None:
+			return
+
+		if self.alarm is not None:
+			self.loop.remove_alarm(self.alarm)
+			self.alarm = None
+
+		delay = self.next_tick()
+		if delay is not None:
+			self.alarm = self.loop.set_alarm_in(delay, self.tick)
+
+	# next_tick()
+	# ===========
+	# Returns the seconds until the next moment worth waking up for, or None if
+	# there is none (e.g. while paused); the earliest of:
+	# * the player's position reaching the next whole second, while a track plays;
+	#   sampling it then narrows down when the track ends
+	# * the next track being due in the player, or the current one ending
+	# * the buffering progress changing, while a skip waits
+	# * a failed fetch being retried
+	# * changed state being written to disk
+	def next_tick(self):
+		delays = []
+
+		if self.state.changes:
+			delays.append(self.flush_delay)
+
+		if self.skip_pending:
+			delays.append(self.ui_interval)
+
+		# fewer tracks on their way than wanted means a fetch failed
+		if self.station.station_id and len(self.station.upcoming) + self.prefetcher.pending < self.wanted_tracks():
+			delays.append(self.retry_interval)
+
+		if bool(self.station.current_track) and not self.is_paused():
+			time_left = self.time_remaining()
+			if time_left <= 0:
+				delays.append(self.stream_interval)
+			else:
+				# just after the whole second reported changes, and right at the end of the track
+				moments = [time_left % 1 or 1, time_left]
+				if self.station.next_track is None:
+					moments.append(time_left - self.handoff_lead)
+					if not self.queue_depth:
+						moments.append(time_left - self.fetch_lead())
+
+				delay = min(moment for moment in moments if moment > 0) + .01
+				delays.append(delay / self.playback_rate)
+
+		return min(delays) if delays else None
+
+	# buffering_text()
+	# ================
+	# Describes the progress of the download the user is waiting on.
+	def buffering_text(self):
+		progress = self.prefetcher.progress
+		if progress is None:
+			return "Buffering..."
+
+		read, total = progress
+		if total:
+			return "Buffering: {0}%".format(read * 100 / total)
+
+		return "Buffering: {0} KB".format(read / 1024)
+
+	# stream()
+	# ========
+	# Called on every tick to continuously stream music
+	def stream(self):
+		if not self.is_paused() and bool(self.station.current_track):
+			# see where the player is
+			position, remaining = self.player.get_time(), self.player.time_remaining()
+			if not self.timeline.sample(position, remaining):
+				# it moved on to the next track before we expected it to
+				if self.station.next_track is not None:
+					self.update_track_info(self.timeline.end())
+				else:
+					self.timeline.begin()
+				self.timeline.sample(position, remaining)
+
+			# check if current song is almost done
+			time_left = self.timeline.remaining()
+
+			# unable to tell how much is left, usually due to seeking (time == -1)
+			if time_left is not None:
+				if (time_left <= self.handoff_lead and self.station.next_track == None):
+					self.play_next()
+
+				if self.station.next_track is not None:
+					# the player is on the next track now
+					if time_left <= 0:
+						self.update_track_info(self.timeline.end())
+				elif time_left <= 0 and remaining <= 0 and not self.skip_pending:
+					# the track ended before the next one was downloaded; play it as soon as it is
+					self.ran_dry_at = self.timeline.end()
+					self.skip_pending = True
+
+		# retry fetches that failed
+		if self.station.station_id:
+			self.fill_queue()
+
+	# change_station(station_name, station_id)
+	# ========================================
+	# * resume: song to play first, if its audio is still cached
+	def change_station(self, station_name, station_id, resume=None):
+		self.station.change_station(station_name, station_id)
+
+		# tracks fetched for the old station are no longer wanted
+		self.prefetcher.cancel()
+		self.station.drop_upcoming()
+		if resume is not None:
+			self.station.requeue(resume)
+
+		# save current station info
+		self.state.set("station_id", station_id)
+		self.state.set("station_name", station_name)
+
+		self.skip()
+		self.notify()
+
+	# load_state(loop, user_data)
+	# ===========================
+	# Tunes back in to the station saved by the last session, picking up the
+	# track that was playing straight from the audio cache.
+	def load_state(self, loop=None, user_data=None):
+		station_id = self.state.get("station_id")
+		if station_id is not None:
+			self.change_station(self.state.get("station_name"), station_id, self.state.get("current_track"))
+
+	# the below functions are wrappers for the station and player classes
+
+	# fill_queue()
+	# ============
+	# Requests tracks from the prefetcher until `queue_depth` are downloaded or on their way.
+	# With a `queue_depth` of 0, the next track is requested once it is needed, or
+	# once it has to start downloading to be ready before the current one ends.
+	def fill_queue(self):
+		wanted = self.wanted_tracks()
+		while len(self.station.upcoming) + self.prefetcher.pending < wanted:
+			self.prefetcher.request()
+
+	# wanted_tracks()
+	# ===============
+	# Number of tracks that should be downloaded or on their way right now.
+	def wanted_tracks(self):
+		if self.queue_depth or self.station.next_track is not None:
+			return self.queue_depth
+
+		if self.skip_pending or not bool(self.station.current_track) or self.time_remaining() <= self.fetch_lead():
+			return 1
+
+		return 0
+
+	# fetch_lead()
+	# ============
+	# Seconds of playback before the end of a track to start fetching the next one
+	# just in time, from the measured download throughput.
+	def fetch_lead(self):
+		fetch_time = self.prefetcher.fetch_time()
+		if fetch_time is None:
+			return self.default_fetch_lead
+
+		return fetch_time * self.fetch_margin * self.playback_rate + self.handoff_lead
+
+	# play_next()
+	# ===========
+	# Hands the first downloaded track to the player, and fetches another in its place.
+	# Returns False if no track was downloaded yet.
+	def play_next(self):
+		queued = self.station.queue_next()
+		self.fill_queue()
+		return queued
+
+	# on_track_ready(song, filename, error)
+	# =====================================
+	# Called in the main loop when the prefetcher has downloaded a track.
+	def on_track_ready(self, song, filename, error):
+		if error is not None:
+			self.set_status_line("Unable to fetch next track: {0}".format(error))
+			self.schedule()
+			return
+
+		self.station.buffer_track(song, filename)
+
+		# nothing was playing, or the user is waiting on a skip
+		if not self.player.is_open():
+			self.play_next()
+			self.update_track_info()
+			self.skip_pending = False
+			self.set_status_line("")
+		elif self.skip_pending:
+			self.skip()
+
+		self.schedule()
+
+	def skip(self):
+		# TODO some sort of status indicator on skip? Or limit skips?
+		# play the next downloaded track right away if we have one,
+		# otherwise skip as soon as one has been downloaded
+		was_open = self.player.is_open()
+		if self.station.next_track is not None or self.play_next():
+			if was_open:
+				self.player.skip()
+
+			# after running dry, this is the track that should have followed
+			self.update_track_info(self.ran_dry_at)
+			self.ran_dry_at = None
+
+			if self.skip_pending:
+				self.skip_pending = False
+				self.set_status_line("")
+		else:
+			self.skip_pending = True
+			self.fill_queue()
+
+		self.schedule()
+
+	# update_track_info(ended_at)
+	# ===========================
+	# Moves on to the next track.
+	# * ended_at: timeline time the previous track ended, or None if it was cut short
+	def update_track_info(self, ended_at=None):
+		self.station.update_track_info()
+		self.timeline.begin(ended_at)
+
+		# remembered, so a restart can resume it
+		track = self.station.current_track
+		if bool(track):
+			self.state.set("current_track", track)
+			self.state.push("history", {
+				"id": track["id"],
+				"title": track.get("title"),
+				"artist": track.get("artist", {}).get("name"),
+				"played_at": int(time.time())
+			}, self.history_size)
+			self.state.set("tracks", self.station.files.index())
+
+		self.notify()
+
+	# replay_last()
+	# =============
+	# Plays the previous track again from the audio cache; if the next track was
+	# already handed to the player, it plays after that one.
+	def replay_last(self):
+		if bool(self.station.previous_track) and self.station.requeue(self.station.previous_track):
+			self.skip()
+		else:
+			self.set_status_line("Nothing to replay")
+
+	def volume_up(self):
+		self.player.volume_up()
+
+	def volume_down(self):
+		self.player.volume_down()
+
+	def pause(self):
+		self.player.pause()
+		self.timeline.reset()
+		self.notify()
+
+	def is_paused(self):
+		return self.player.is_paused
+
+	# time_remaining()
+	# ================
+	# Seconds left in the current track, or -1 if unknown.
+	def time_remaining(self):
+		time_left = self.timeline.remaining()
+		if time_left is None:
+			return self.player.time_remaining()
+
+		return time_left
+
+	def seek(self):
+		self.timeline.reset()
+		self.player.seek(self.player.get_time() + 5)
+		self.notify()
+
+	# upvote current track
+	def upvote(self):
+		if bool(self.station.current_track):
+			self.votes.vote(self.station.current_track["id"], True)
+
+			# keep liked songs cached the longest, to hear again without downloading
+			self.station.files.touch(self.station.current_file)
+
+			# show status
+			self.set_status_line("Upvoted: {0}".format(self.station.current_track["title"]))
+			self.schedule()
+
+	# downvote current track
+	# and skip it
+	def downvote(self):
+		if bool(self.station.current_track):
+			self.votes.vote(self.station.current_track["id"], False)
+			# show status
+			self.set_status_line("Downvoted: {0}".format(self.station.current_track["title"]))
+			self.skip()
@@ -0,0 +1,168 @@
+import json, math, os, threading
+from timeline import monotonic
+
+# Histogram
+# =========
+# Counts recorded values (e.g. durations in seconds) in logarithmic buckets, each
+# split into `precision` linear steps, like an HDR histogram: memory stays small
+# and fixed no matter how many values are recorded, and any percentile is known
+# to within 1 / `precision` of its value.
+class Histogram:
+	def __init__(self, precision=32):
+		self.precision = precision
+
+		# buckets
+		# =======
+		# bucket index => number of values in it
+		self.buckets = {}
+
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+	# bucket(value)
+	# =============
+	# Returns the index of the bucket the value falls into.
+	def bucket(self, value):
+		if value <= 0:
+			return None
+
+		mantissa, exponent = math.frexp(value)
+		return exponent * self.precision + int((mantissa - .5) * 2 * self.precision)
+
+	# value(bucket)
+	# =============
+	# Returns the value in the middle of a bucket.
+	def value(self, bucket):
+		if bucket is None:
+			return 0.0
+
+		exponent, step = divmod(bucket, self.precision)
+		return math.ldexp(.5 + (step + .5) / (2.0 * self.precision), exponent)
+
+	# record(value)
+	# =============
+	def record(self, value):
+		bucket = self.bucket(value)
+		self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+		self.count += 1
+		self.total += value
+		self.min = value if self.min is None else min(self.min, value)
+		self.max = value if self.max is None else max(self.max, value)
+
+	# percentile(p)
+	# =============
+	# Returns the value below which p percent of the recorded values fall, or None if empty.
+	def percentile(self, p):
+		if not self.count:
+			return None
+
+		if p >= 100:
+			return self.max
+
+		rank = max(int(math.ceil(self.count * p / 100.0)), 1)
+		seen = 0
+		for bucket in sorted(self.buckets, key=lambda b: -1 if b is None else b):
+			seen += self.buckets[bucket]
+			if seen >= rank:
+				return min(max(self.value(bucket), self.min), self.max)
+
+		return self.max
+
+	# summary()
+	# =========
+	# Returns the count, mean, extremes and usual percentiles as a dictionary.
+	def summary(self):
+		summary = {"count": self.count, "min": self.min, "max": self.max}
+		summary["mean"] = self.total / self.count if self.count else None
+		for p in (50, 90, 99, 99.9):
+			summary["p{0:g}".format(p)] = self.percentile(p)
+
+		return summary
+
+# Metrics
+# =======
+# A registry of named counters and histograms, so the time spent in the network,
+# the player and drawing the screen can be seen (see `MixZaTape.show_metrics`)
+# and dumped for later. Safe to record into from any thread.
+class Metrics:
+	def __init__(self):
+		self.counters = {}
+		self.histograms = {}
+		self.lock = threading.Lock()
+
+	# increment(name, amount)
+	# =======================
+	def increment(self, name, amount=1):
+		with self.lock:
+			self.counters[name] = self.counters.get(name, 0) + amount
+
+	# record(name, value)
+	# ===================
+	# Records a value (e.g. seconds taken) in the named histogram.
+	def record(self, name, value):
+		with self.lock:
+			histogram = self.histograms.get(name)
+			if histogram is None:
+				histogram = self.histograms[name] = Histogram()
+
+			histogram.record(value)
+
+	# timer(name)
+	# ===========
+	# Returns a context manager that records the seconds spent in its block.
+	def timer(self, name):
+		return Timer(self, name)
+
+	# wrap(obj, method, name)
+	# =======================
+	# Replaces a method of an object with one that records the seconds every call
+	# takes, e.g. to time code that isn't ours.
+	def wrap(self, obj, method, name):
+		function = getattr(obj, method)
+
+		def timed(*args, **kwargs):
+			with self.timer(name):
+				return function(*args, **kwargs)
+
+		setattr(obj, method, timed)
+
+	# snapshot()
+	# ==========
+	# Returns every counter and histogram summary as a dictionary.
+	def snapshot(self):
+		with self.lock:
+			return {
+				"counters": dict(self.counters),
+				"histograms": dict((name, histogram.summary()) for name, histogram in self.histograms.items())
+			}
+
+	# dump(path)
+	# ==========
+	# Writes the snapshot to a JSON file; the file is replaced atomically.
+	def dump(self, path):
+		temp = "{0}.{1}.tmp".format(path, os.getpid())
+		with open(temp, "w") as file:
+			json.dump(self.snapshot(), file, indent=2, sort_keys=True)
+		os.rename(temp, path)
+
+# Timer
+# =====
+# Records the seconds spent in a `with` block; see `Metrics.timer()`.
+class Timer:
+	def __init__(self, metrics, name):
+		self.metrics = metrics
+		self.name = name
+
+	def __enter__(self):
+		self.started = monotonic()
+		return self
+
+	def __exit__(self, type, value, traceback):
+		self.metrics.record(self.name, monotonic() - self.started)
+		if type is not None:
+			self.metrics.increment(self.name + ".errors")
+
+# the registry shared by the whole app
+metrics = Metrics()
@@ -1,8 +1,19 @@
 #!/usr/bin/python
 # coding=utf8
-import argparse, json, curses, sys, time, urwid
+import argparse, json, curses, os, socket, sys, time, urwid
 from station import Station
 from player import VlcPlayer
+from mpv_player import MpvPlayer
+from fake_player import FakePlayer
+from jukebox import Jukebox
+from control import ControlClient
+from daemon import Daemon
+from search import StationSearch
+from search_cache import SearchCache
+from station_index import StationIndex
+from timeline import monotonic
+from metrics import metrics
+from eventlog import log
 from mixzatape_ui import StationSearchBox
 
 # the songza terminal player
@@ -10,11 +21,12 @@ from mixzatape_ui import StationSearchBox
 
 # TODO:
 # * add volume display
-# * add replay last song feature
 
 # MixZaTape
 # =========
-# A Songza player for your terminal, with a nifty (?) urwid interface.
+# A Songza player for your terminal, with a nifty (?) urwid interface. The music
+# is played by a `Jukebox`, either right here or in a daemon this is a client
+# of (see `ControlClient`); the screen shows the status the jukebox reports.
 class MixZaTape:
 	def __init__(self):
 		# key handlers are set here
@@ -22,16 +34,24 @@ class MixZaTape:
 		self.key_handlers = {
 			# ESC key
 			"esc": ("Exit", self.exit),
-			"f9": ("Skip", self.skip),
-			"+": ("Volume Up", self.volume_up),
-			"-": ("Volume Down", self.volume_down),
+			"f9": ("Skip", lambda: self.jukebox.skip()),
+			"f7": ("Replay Last", lambda: self.jukebox.replay_last()),
+			"+": ("Volume Up", lambda: self.jukebox.volume_up()),
+			"-": ("Volume Down", lambda: self.jukebox.volume_down()),
 			# space bar
-			"f8": ("Pause", self.pause),
-			"f10": ("Seek", self.seek),
+			"f8": ("Pause", lambda: self.jukebox.pause()),
+			"f10": ("Seek", lambda: self.jukebox.seek()),
 			"f1": ("Help", self.show_help),
 			"f2": ("Station Search", self.show_search),
-			">": ("Upvote", self.upvote),
-			"<": ("Downvote", self.downvote),
+			">": ("Upvote", lambda: self.jukebox.upvote()),
+			"<": ("Downvote", lambda: self.jukebox.downvote()),
+		}
+
+		# hidden_keys
+		# ===========
+		# Key handlers left out of the help screen
+		self.hidden_keys = {
+			"f12": ("Metrics", self.show_metrics)
 		}
 
 		# UI text
@@ -39,19 +59,55 @@ class MixZaTape:
 			"current_track":	"Playing:  ",
 			"last_track":		"Previous: ",
 			"select_station":	"Select a Station",
+			"searching":		"Searching...",
+			"no_stations":		"No stations found",
 			"help_controls":	"Controls",
+			"metrics":			"Metrics",
 			"current_station":	"Station: "
 		}
 
 		# save_file
 		# =========
-		# Used to save & persist app data between sessions
+		# Where the jukebox saves app data between sessions; search results and the
+		# stations seen are kept next to it
 		self.save_file = "./.save"
 
-		# save_data
-		# =========
-		# Assorted app data that we want to be persisted
-		self.save_data = {}
+		# players
+		# =======
+		# Player backends that can be picked with --player
+		self.players = {
+			"vlc": VlcPlayer,
+			"mpv": MpvPlayer,
+			"fake": FakePlayer
+		}
+
+		# socket_path
+		# ===========
+		# Control socket of the daemon, for --daemon and --connect
+		self.socket_path = "./.control.sock"
+
+		# metrics_file
+		# ============
+		# File the metrics are dumped to on exit, as JSON; None to not dump them
+		self.metrics_file = None
+
+		# jukebox
+		# =======
+		# Plays the music: a `Jukebox`, or a `ControlClient` of one in a daemon
+		self.jukebox = None
+
+		# status & status_at
+		# ==================
+		# Status last reported by the jukebox (see `Jukebox.status()`), and the
+		# local clock time it was reported at, to count the time remaining down from
+		self.status = None
+		self.status_at = None
+
+		# loop & alarm
+		# ============
+		# The main loop, and the handle of the alarm set by `schedule()`
+		self.loop = None
+		self.alarm = None
 
 	# setup_screen()
 	# ==============
@@ -92,16 +148,20 @@ class MixZaTape:
 		
 		# build frame
 		self.ui["container"] = urwid.Frame(window, self.ui["logo"], self.ui["footer"], focus_part="body")
-
-		# attempt to load any previously saved app data
-		self.load_state()
 		
 	# exit()
 	# ======
-	# Exits the app, cleaning up GUI elements and stopping the player.
+	# Exits the app, cleaning up GUI elements and stopping the player; a daemon
+	# this is a client of plays on.
 	def exit(self):
 		# stop the music
-		self.player.stop()
+		self.searcher.stop()
+		self.search_cache.save()
+		self.station_index.save()
+		self.jukebox.close()
+		if self.metrics_file is not None:
+			metrics.dump(self.metrics_file)
+		log.close()
 		urwid.ExitMainLoop();
 
 		sys.exit()
@@ -111,23 +171,79 @@ class MixZaTape:
 	# Bootstraps by parsing arguments and such.
 	# Starts the main run loop and binds event handlers.
 	def start(self):
+		jukebox = Jukebox()
+
 		# parse arguments
 		parser = argparse.ArgumentParser(description="Plays music from Songza in your terminal")
 		# parser.add_argument("--query", metavar="Query Text", help="Query text used to search for stations; the app will start with query results pre-populated")
 		parser.add_argument("--station_id", metavar="1234567", help="This is the station ID used internally by Songza")
-		parser.add_argument("--debug", action="store_true", help="Add this flag to dump debug info to a file.")
+		parser.add_argument("--debug", action="store_true", help="Add this flag to log debug info to ./.debug.log")
+		parser.add_argument("--player", choices=sorted(self.players.keys()), default="vlc", help="Player backend used to play tracks (\"fake\" plays nothing)")
+		parser.add_argument("--api", metavar="songza.com", default="songza.com", help="Host (and port) of the Songza API, e.g. a local fake_songza.py server")
+		parser.add_argument("--queue-depth", metavar="2", type=int, default=jukebox.queue_depth, help="Number of tracks to keep downloaded ahead, for instant skips; 0 fetches each track just in time")
+		parser.add_argument("--cache-mb", metavar="256", type=int, default=256, help="Megabytes of track audio to keep cached on disk")
+		parser.add_argument("--handoff", metavar="5", type=int, default=jukebox.handoff_lead, help="Seconds before the end of a track to queue the next one in the player")
+		parser.add_argument("--metrics", metavar="metrics.json", help="File to dump timings and counters to on exit, as JSON")
+		parser.add_argument("--daemon", action="store_true", help="Play in the background, without a screen, controlled through the socket")
+		parser.add_argument("--foreground", action="store_true", help="With --daemon, stay attached to the terminal")
+		parser.add_argument("--connect", action="store_true", help="Control the daemon listening on the socket, instead of playing here")
+		parser.add_argument("--socket", metavar=self.socket_path, default=self.socket_path, help="Control socket of the daemon")
 
 		args = parser.parse_args()
+		self.metrics_file = args.metrics
+
+		# no threads may be running yet to detach
+		daemon = Daemon(jukebox, args.socket)
+		if args.daemon and not args.foreground:
+			daemon.detach()
+
+		# instatiate a player and station; a client only searches with the station,
+		# the daemon plays
+		player = None if args.connect else self.players[args.player](debug=args.debug)
+		station = Station(player, 0, args.debug, args.api)
+		station.files.max_bytes = args.cache_mb * 1024 * 1024
+		jukebox.queue_depth = max(args.queue_depth, 0)
+		jukebox.handoff_lead = args.handoff
+
+		if args.daemon:
+			try:
+				daemon.run(player, station, args.station_id)
+			finally:
+				if self.metrics_file is not None:
+					metrics.dump(self.metrics_file)
+				log.close()
+			return
+
+		if args.connect:
+			jukebox = ControlClient(args.socket)
+			try:
+				jukebox.connect()
+			except socket.error as ex:
+				sys.exit("Unable to connect to {0}: {1}".format(args.socket, ex))
+		else:
+			jukebox.setup(player, station, args.station_id)
 
-		# instatiate a player and station
-		self.player = VlcPlayer(args.debug)
-		self.station = Station(self.player, 0, args.debug)
+		# start the run loop
+		loop = self.setup(jukebox, station)
+		loop.run()
+
+	# setup(jukebox, station, screen)
+	# ===============================
+	# Builds the screen and the main loop around a jukebox that is set up, and
+	# starts it. Returns the main loop, ready to run.
+	# * station: used to search for stations
+	# * screen: urwid screen to draw on; defaults to the terminal
+	def setup(self, jukebox, station, screen=None):
+		self.jukebox = jukebox
+		self.station = station
 
-		# start streaming music, if station id was provided
-		if args.station_id:
-			self.station.station_id = args.station_id
-			self.play_next()
-			self.station.update_track_info()
+		# search results are cached next to the save file
+		self.search_cache = SearchCache(os.path.join(os.path.dirname(self.save_file), ".search_cache"))
+		self.search_cache.load()
+
+		# every station seen, for suggestions while typing a search; loaded on first use
+		self.station_index = StationIndex(os.path.join(os.path.dirname(self.save_file), ".station_index"))
+		self.searcher = StationSearch(self.station, self.on_stations_found, self.search_cache)
 
 		# build out the screen
 		self.setup_screen()
@@ -138,50 +254,122 @@ class MixZaTape:
 			("logo", "default", "black")
 		]
 
-		# start the run loop
-		loop = urwid.MainLoop(self.ui["container"], palette, unhandled_input=self.handle_input)
-		loop.set_alarm_in(1, self.stream)
-		loop.set_alarm_in(.5, self.update_player_ui)
-		loop.run()
+		loop = urwid.MainLoop(self.ui["container"], palette, screen, unhandled_input=self.handle_input)
+		self.loop = loop
+
+		# have the terminal show each frame whole, where it can
+		if isinstance(loop.screen, urwid.raw_display.Screen):
+			loop.screen.set_terminal_properties(synchronized_update=True)
+
+		# time the drawing of the screen, from building the canvas to writing it out
+		metrics.wrap(loop, "draw_screen", "ui.draw_screen")
+		metrics.wrap(loop.screen, "draw_screen", "screen.draw_screen")
+
+		self.searcher.start(loop)
+
+		# show what the jukebox is up to, as it changes
+		self.jukebox.listen(self.on_status)
+		self.jukebox.start(loop)
+		self.on_status(self.jukebox.status())
+
+		return loop
 
 	# handle_input(key)
 	# =================
 	def handle_input(self, key):
 		# fire handler for the input key
-		handler = self.key_handlers.get(key)
+		handler = self.key_handlers.get(key) or self.hidden_keys.get(key)
 		if (handler is not None):
 			handler[1]()
 
-	# update_player_ui(loop, user_data)
-	# =================================
+	# on_status(status)
+	# =================
+	# Called with the jukebox status whenever it changes.
+	def on_status(self, status):
+		self.status = status
+		self.status_at = monotonic()
+		self.update_player_ui()
+		self.schedule()
+
+	# refresh(loop, user_data)
+	# ========================
+	# Counts the time remaining down on screen.
+	def refresh(self, loop=None, user_data=None):
+		self.alarm = None
+		self.update_player_ui()
+		self.schedule()
+
+	# schedule()
+	# ==========
+	# Sets the timer for the time remaining on screen to change next, replacing
+	# any timer already set; none while paused, or with nothing playing.
+	def schedule(self):
+		if self.loop is None:
+			return
+
+		if self.alarm is not None:
+			self.loop.remove_alarm(self.alarm)
+			self.alarm = None
+
+		time_left = self.time_remaining()
+		if time_left is not None and time_left > 0 and not self.status["paused"]:
+			# just after the whole second shown changes
+			delay = (time_left % 1 or 1) + .01
+			self.alarm = self.loop.set_alarm_in(delay / self.status["rate"], self.refresh)
+
+	# time_remaining()
+	# ================
+	# Seconds left in the current track, counted down from the last status, or
+	# None if unknown.
+	def time_remaining(self):
+		status = self.status
+		if status is None or status["track"] is None or status["remaining"] is None:
+			return None
+
+		if status["paused"]:
+			return status["remaining"]
+
+		return max(status["remaining"] - (monotonic() - self.status_at) * status["rate"], 0)
+
+	# update_player_ui()
+	# ==================
 	# Updates the player UI (current track, progress, etc).
-	def update_player_ui(self, loop, user_data):
-		# set a new timer
-		loop.set_alarm_in(.5, self.update_player_ui)
+	def update_player_ui(self):
+		status = self.status
+		self.set_status_line(status["message"])
+
+		if status["station_id"] is not None:
+			self.ui["station_info"].set_text(
+				"{0}{1} ({2})".format(
+					self.ui_text["current_station"],
+					status["station_name"],
+					status["station_id"]
+				)
+			)
 
 		# don't redraw if currently paused	
-		if self.is_paused():
+		if status["paused"]:
 			return
 
 		# show the current track if not null or empty
 		# remember that the cursor positon moves with the text by default
-		if (bool(self.station.current_track)):
+		track = status["track"]
+		if track is not None:
 			track_text = [
 				self.ui_text["current_track"],
-				("bold", unicode(self.station.current_track["title"] + " ")),
-				unicode(self.station.current_track["artist"]["name"])
+				("bold", unicode(track["title"] + " ")),
+				unicode(track["artist"])
 			]
 
 			self.ui["track_info"].set_text(track_text)
 
-			# show time remaining
-			seconds = int(self.time_remaining())
-
-			# Occasionally, seconds remaining can be negative, especially immediately
-			# after un-pausing. Skip this update if that is the case.
-			if (seconds < 0):
+			# show time remaining, once known
+			time_left = self.time_remaining()
+			if time_left is None:
 				return
-			duration = int(self.station.current_track["duration"])
+
+			seconds = int(time_left)
+			duration = int(track["duration"])
 			self.ui["time_left"].set_text("{0}:{1:02d} / {2}:{3:02d}".format(
 				seconds / 60,
 				seconds % 60,
@@ -192,7 +380,6 @@ class MixZaTape:
 			self.ui["progress_bar"].set_text(self.draw_progress_bar(3, 0, duration - seconds, duration, 50, u"\u2588"))
 		else:
 			self.ui["track_info"].set_text("")
-
 	# draw_progress_bar(current, startY, startX, total, size, chr)
 	# ============================================================
 	# Draws a progress bar of the specified size.
@@ -209,24 +396,6 @@ class MixZaTape:
 		bar += gap
 		return u"{0}{1}{0}".format(u"|", bar)
 
-	# stream(loop, user_data)
-	# =======================
-	# The stream() callback is fired in the main run loop to continuously stream music
-	def stream(self, loop, user_data):
-		if not self.is_paused():
-			# check if current song is almost done
-			time_left = self.time_remaining()
-			
-			# unable to accurately read time remaining, usually due to seeking (time == -1)
-			if time_left > 0:
-				if (time_left <= 5 and self.station.next_track == None):
-					self.play_next()
-
-				if (time_left <= 1 and self.station.next_track is not None):
-					self.update_track_info()
-
-		loop.set_alarm_in(1, self.stream)
-
 	# build_logo()
 	# ============
 	def build_logo(self):
@@ -238,22 +407,46 @@ class MixZaTape:
 	# build_station_list(query)
 	# ========================
 	# Fires off a query for stations with the specified query test
-	# and builds a select list of stations.
+	# and builds a select list of stations, which fills in as results arrive.
 	def build_station_list(self, query):
-		# build menu options
-		# flatten down to just name => id dictionary
-		menu_opts = {}
-		stations = self.station.query_station(query)
+		self.ui["search_status"] = urwid.Text(self.ui_text["searching"])
+		self.ui["station_walker"] = urwid.SimpleFocusListWalker([
+			urwid.Text(self.ui_text["select_station"]),
+			urwid.Divider(),
+			self.ui["search_status"]
+		])
+
+		# station names already listed
+		self.station_names = set()
+		self.searcher.search(query)
+
+		return urwid.BoxAdapter(urwid.ListBox(self.ui["station_walker"]), 20)
+
+	# on_stations_found(query, stations, done, error)
+	# ===============================================
+	# Called in the main loop as search results are parsed; adds them to the station list.
+	def on_stations_found(self, query, stations, done, error):
+		walker = self.ui["station_walker"]
+		self.station_index.add(stations)
+		if done:
+			self.station_index.save()
+
 		for station in stations:
-			menu_opts[station["name"]] = station["id"]
+			name = station["name"]
+			if name in self.station_names:
+				continue
+			self.station_names.add(name)
+
+			button = urwid.Button(name)
+			urwid.connect_signal(button, "click", self.on_station_selected, (name, station["id"]))
 
-		body = [urwid.Text(self.ui_text["select_station"]), urwid.Divider()]
-		for k in menu_opts.keys():
-			button = urwid.Button(k)
-			urwid.connect_signal(button, "click", self.on_station_selected, (k, menu_opts[k]))
-			body.append(urwid.AttrMap(button, None, focus_map="reversed"))
+			# keep the status line at the bottom
+			walker.insert(len(walker) - 1, urwid.AttrMap(button, None, focus_map="reversed"))
 
-		return urwid.BoxAdapter(urwid.ListBox(urwid.SimpleFocusListWalker(body)), 20)
+		if error is not None:
+			self.ui["search_status"].set_text("Search failed: {0}".format(error))
+		elif done:
+			self.ui["search_status"].set_text("" if self.station_names else self.ui_text["no_stations"])
 
 	# build_help_screen()
 	# ===================
@@ -276,17 +469,32 @@ class MixZaTape:
 	def build_search_screen(self):
 		input = StationSearchBox("Station Search: ", "")
 		urwid.connect_signal(input, "keypress", self.on_search_keypress)
+		urwid.connect_signal(input, "change", self.on_search_changed)
+
+		# suggestions from stations we already know, updated as the user types
+		self.suggestion_walker = urwid.SimpleFocusListWalker([])
 
 		body = [
-			input
+			input,
+			urwid.BoxAdapter(urwid.ListBox(self.suggestion_walker), 10)
 		]
 
 		return urwid.Pile(body)
 		
 
+	# handler for edits to the search box; shows local suggestions
+	def on_search_changed(self, widget, text):
+		buttons = []
+		for station in self.station_index.suggest(text):
+			button = urwid.Button(station["name"])
+			urwid.connect_signal(button, "click", self.on_station_selected, (station["name"], station["id"]))
+			buttons.append(urwid.AttrMap(button, None, focus_map="reversed"))
+
+		self.suggestion_walker[:] = buttons
+
 	# handler for selected station
 	def on_station_selected(self, button, key_value):
-		self.change_station(key_value[0], key_value[1])
+		self.jukebox.change_station(key_value[0], key_value[1])
 
 	# custom keypress handler for the station list
 	def on_search_keypress(self, widget, size, key):
@@ -312,115 +520,47 @@ class MixZaTape:
 	def show_help(self):
 		self.show_screen(self.ui["help_screen"])
 
+	# show_metrics()
+	# ==============
+	# Display the metrics collected so far: counters, and the call count and
+	# percentiles of each timing, in milliseconds. Shows them as of the key press.
+	def show_metrics(self):
+		snapshot = metrics.snapshot()
+		body = [urwid.Text(("bold", self.ui_text["metrics"])), urwid.Divider()]
+
+		for name in sorted(snapshot["histograms"]):
+			summary = snapshot["histograms"][name]
+			body.append(urwid.Text("{0}: {1} calls, p50 {2:.1f} ms, p99 {3:.1f} ms, max {4:.1f} ms".format(
+				name,
+				summary["count"],
+				summary["p50"] * 1000,
+				summary["p99"] * 1000,
+				summary["max"] * 1000
+			)))
+
+		for name in sorted(snapshot["counters"]):
+			body.append(urwid.Text("{0}: {1}".format(name, snapshot["counters"][name])))
+
+		self.show_screen(urwid.Pile(body))
+
 	# show_search()
 	# =============
 	# Display the search screen.
 	def show_search(self):
-		self.show_screen(self.ui["search_screen"])
+		if not self.station_index.loaded:
+			self.station_index.load()
+			self.station_index.add(self.search_cache.stations())
 
-	# change_station(station_name, station_id)
-	# ========================================
-	def change_station(self, station_name, station_id):
-		# set ui components with new station info
-		self.ui["station_info"].set_text(
-			"{0}{1} ({2})".format(
-				self.ui_text["current_station"],
-				station_name,
-				station_id
-			)
-		)
-		self.station.change_station(station_name, station_id)
-		self.skip()
-
-		# save current station info
-		self.save_data["station_id"] = station_id
-		self.save_data["station_name"] = station_name
-		self.save_state()
+		self.show_screen(self.ui["search_screen"])
 
 	# set_status_line(message)
 	# ========================
 	# Sets the status in the footer.
 	def set_status_line(self, message):
 		self.ui["footer"].set_text(message)
-		
-
-	# save_state()
-	# ============
-	# Saves the current state of the app to file
-	def save_state(self):
-		with open(self.save_file, "w") as file:
-			file.write(json.dumps(self.save_data))
-
-	# load_state()
-	# ============
-	# Loads the current state of the app from file
-	def load_state(self):
-		# attempt to load file
-		try:
-			with open(self.save_file, "r") as file:
-				text = file.read()
-				if len(text) > 0:
-					self.save_data = json.loads(text)
-					self.change_station(self.save_data["station_name"], self.save_data["station_id"])
-		except Exception as ex:
-			print(str(ex))
-
-		
-	# the below functions are wrappers for the station and player classes
-
-	def play_next(self):
-		self.station.play_next()
-
-	def skip(self):
-		# TODO some sort of status indicator on skip? Or limit skips?
-		self.play_next()
-		self.player.skip()
-		self.update_track_info()
-
-	def update_track_info(self):
-		self.station.update_track_info()
-
-	def replay_last(self):
-		# TODO: implement this
-		self.station.play_next()
-
-	def volume_up(self):
-		self.player.volume_up()
-
-	def volume_down(self):
-		self.player.volume_down()
-
-	def pause(self):
-		self.player.pause()
-
-	def is_paused(self):
-		return self.player.is_paused
-
-	def time_remaining(self):
-		# return self.station.time_remaining()
-		return self.player.time_remaining()
-
-	def seek(self):
-		return self.player.seek(self.player.get_time() + 5)
-
-	# upvote current track
-	def upvote(self):
-		if bool(self.station.current_track):
-			self.station.vote(self.station.current_track["id"], True)
-
-			# show status
-			self.set_status_line("Upvoted: {0}".format(self.station.current_track["title"]))
-
-	# downvote current track
-	# and skip it
-	def downvote(self):
-		if bool(self.station.current_track):
-			self.station.vote(self.station.current_track["id"], False)
-			# show status
-			self.set_status_line("Downvoted: {0}".format(self.station.current_track["title"]))
-			self.skip()
 
 # ---------------------------------------------------------- #
 
-mixtape = MixZaTape()
-mixtape.start()
+if __name__ == "__main__":
+	mixtape = MixZaTape()
+	mixtape.start()
@@ -0,0 +1,228 @@
+import subprocess, socket, json, os, time, errno
+from player import Player
+from timeline import monotonic
+
+# MpvPlayer
+# =========
+# Drives mpv through its JSON IPC socket; assumes that "mpv" is in your path.
+# Instead of polling, the player subscribes to property changes, and mpv pushes
+# the position, length, pause state and volume to us as they change. Replies and
+# events are read from the socket by the urwid event loop once attached, or
+# drained without blocking whenever the status is asked for otherwise.
+class MpvPlayer(Player):
+	# constructor
+	# * socket_path: path of the IPC socket
+	# * spawn: start mpv ourselves; if False, connect to an already running player
+	def __init__(self, debug=False, socket_path="./.mpv.sock", spawn=True):
+		self.socket_path = socket_path
+		self.spawn = spawn
+		self.debug = debug
+
+		self.process = None
+		self.sock = None
+		self.is_paused = False
+
+		# properties
+		# ==========
+		# Last values pushed by mpv for the properties we observe
+		self.properties = {"time-pos": None, "duration": None, "volume": None}
+
+		# sampled_at
+		# ==========
+		# `monotonic()` time at which "time-pos" was last pushed
+		self.sampled_at = 0
+
+		# partial line read from the socket
+		self.buffer = ""
+		self.loop = None
+		self.handle = None
+
+		# seconds to wait for a spawned mpv to create its socket
+		self.connect_timeout = 5
+
+	# attach(loop)
+	# ============
+	# Reads events from the socket through the specified main loop.
+	def attach(self, loop):
+		self.loop = loop
+		self.watch()
+
+	def watch(self):
+		if self.loop is not None and self.handle is None and self.sock is not None:
+			self.handle = self.loop.watch_file(self.sock.fileno(), self.on_readable)
+
+	def unwatch(self):
+		if self.handle is not None:
+			self.loop.remove_watch_file(self.handle)
+			self.handle = None
+
+	# open()
+	# ======
+	# Starts mpv (if spawning) and connects to its IPC socket.
+	def open(self):
+		if self.spawn:
+			if os.path.exists(self.socket_path):
+				os.remove(self.socket_path)
+
+			with open(os.devnull, "w") as devnull:
+				self.process = subprocess.Popen(["mpv", "--idle=yes", "--no-video", "--no-terminal",
+												"--input-ipc-server=" + self.socket_path],
+												shell=False,
+												stdout=devnull,
+												stderr=devnull)
+
+		deadline = time.time() + self.connect_timeout
+		while True:
+			sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			try:
+				sock.connect(self.socket_path)
+				break
+			except socket.error:
+				sock.close()
+				if time.time() > deadline:
+					raise
+				time.sleep(.05)
+
+		sock.setblocking(False)
+		self.sock = sock
+
+		for i, name in enumerate(sorted(self.properties.keys())):
+			self.send_command("observe_property", i + 1, name)
+		self.send_command("observe_property", 0, "pause")
+
+		self.watch()
+
+	# send_command(*args)
+	# ===================
+	# Sends a command to mpv; replies are picked up with the other events.
+	def send_command(self, *args):
+		if self.sock is None:
+			return
+
+		data = json.dumps({"command": list(args)}) + "\n"
+
+		# the socket is non-blocking, but commands are tiny; wait out a full buffer
+		while data:
+			try:
+				sent = self.sock.send(data)
+				data = data[sent:]
+			except socket.error as ex:
+				if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+					raise
+				time.sleep(.001)
+
+	# on_readable()
+	# =============
+	# Reads whatever mpv has sent, and updates the property snapshot.
+	def on_readable(self):
+		try:
+			data = self.sock.recv(4096)
+		except socket.error as ex:
+			if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+				return False
+			raise
+
+		# the player has gone away
+		if not data:
+			self.close()
+			return False
+
+		lines = (self.buffer + data).split("\n")
+		self.buffer = lines.pop()
+
+		for line in lines:
+			if line:
+				self.parse(json.loads(line))
+
+		return True
+
+	# poll()
+	# ======
+	# Drains pending events without blocking, when not attached to a main loop.
+	def poll(self):
+		if self.sock is not None and self.handle is None:
+			while self.sock is not None and self.on_readable():
+				pass
+
+	# parse(message)
+	# ==============
+	# Updates the snapshot from a single event or reply.
+	def parse(self, message):
+		if message.get("event") != "property-change":
+			return
+
+		name = message.get("name")
+		value = message.get("data")
+
+		if name == "pause":
+			self.is_paused = bool(value)
+		elif name in self.properties:
+			self.properties[name] = value
+			if name == "time-pos":
+				self.sampled_at = monotonic()
+
+	# close()
+	# =======
+	# Disconnects from the socket.
+	def close(self):
+		self.unwatch()
+		if self.sock is not None:
+			self.sock.close()
+			self.sock = None
+
+	def is_open(self):
+		return self.sock is not None
+
+	def play(self, file):
+		if not self.is_open():
+			self.open()
+
+		# "append-play" starts playback if the player is idle
+		self.send_command("loadfile", file, "append-play")
+
+	def enqueue(self, file):
+		self.send_command("loadfile", file, "append")
+
+	def skip(self):
+		self.send_command("playlist-next", "force")
+
+	def pause(self):
+		self.is_paused = not self.is_paused
+		self.send_command("set_property", "pause", self.is_paused)
+
+	def seek(self, seconds):
+		self.send_command("seek", seconds, "absolute")
+		self.properties["time-pos"] = seconds
+		self.sampled_at = monotonic()
+
+	def volume_up(self):
+		self.send_command("add", "volume", 5)
+
+	def volume_down(self):
+		self.send_command("add", "volume", -5)
+
+	def get_volume(self):
+		self.poll()
+		return self.properties["volume"]
+
+	def stop(self):
+		self.send_command("quit")
+		self.close()
+		self.process = None
+
+	def get_time(self):
+		self.poll()
+		position = self.properties["time-pos"]
+		if position is None:
+			return 0
+		if self.is_paused:
+			return int(position)
+
+		return int(position + monotonic() - self.sampled_at)
+
+	def time_remaining(self):
+		self.poll()
+		if self.properties["duration"] is None or self.properties["time-pos"] is None:
+			return -1
+
+		return max(int(self.properties["duration"]) - self.get_time(), 0)
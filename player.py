@@ -1,9 +1,288 @@
-import subprocess, os, sys, logging, re
+import subprocess, os, sys, re, collections
+from metrics import metrics
+from eventlog import log
+from timeline import monotonic
+
+# Player
+# ======
+# The interface every player backend implements. `Station` and `MixZaTape` only
+# talk to players through these methods, so backends can be swapped freely:
+# * VlcPlayer: drives VLC over its rc interface
+# * MpvPlayer: drives mpv over its JSON IPC socket (see mpv_player.py)
+# * FakePlayer: plays nothing, on a simulated clock (see fake_player.py)
+class Player:
+	# is_paused
+	# =========
+	# True if playback is currently paused
+	is_paused = False
+
+	# time_resolution
+	# ===============
+	# Seconds between the positions `get_time()` can report
+	time_resolution = 1
+
+	# attach(loop)
+	# ============
+	# Lets the player read its status through the specified urwid main loop.
+	def attach(self, loop):
+		pass
+
+	# is_open()
+	# =========
+	# Returns true if the player is currently open.
+	def is_open(self):
+		raise NotImplementedError()
+
+	# play(file)
+	# ==========
+	# Plays the file, opening the player if needed; queues it if already open.
+	def play(self, file):
+		raise NotImplementedError()
+
+	# enqueue(file)
+	# =============
+	# Adds a file to the end of the play queue.
+	def enqueue(self, file):
+		raise NotImplementedError()
+
+	# skip()
+	# ======
+	# Skips to the next queued file.
+	def skip(self):
+		raise NotImplementedError()
+
+	# pause()
+	# =======
+	# Toggles pause.
+	def pause(self):
+		raise NotImplementedError()
+
+	# seek(seconds)
+	# =============
+	# Moves to the specified position in the current track.
+	def seek(self, seconds):
+		raise NotImplementedError()
+
+	# volume_up() & volume_down()
+	# ===========================
+	def volume_up(self):
+		raise NotImplementedError()
+
+	def volume_down(self):
+		raise NotImplementedError()
+
+	# stop()
+	# ======
+	# Stops all playback, shutting down the player.
+	def stop(self):
+		raise NotImplementedError()
+
+	# get_time()
+	# ==========
+	# The position in the current track, in whole seconds.
+	def get_time(self):
+		raise NotImplementedError()
+
+	# time_remaining()
+	# ================
+	# The time remaining on the current track in seconds, or -1 if unknown.
+	def time_remaining(self):
+		raise NotImplementedError()
+
+	# get_volume()
+	# ============
+	# The current volume, or None if unknown.
+	def get_volume(self):
+		return None
+
+	# get_status()
+	# ============
+	# A snapshot of the player status as a dictionary.
+	def get_status(self):
+		position = self.get_time()
+		remaining = self.time_remaining()
+
+		return {
+			"open": self.is_open(),
+			"paused": self.is_paused,
+			"time": position,
+			"length": position + remaining if remaining >= 0 else -1,
+			"volume": self.get_volume()
+		}
+
+# VlcStatus
+# =========
+# Reads VLC's rc output without blocking, and keeps a snapshot of the player status.
+# The stdout pipe is watched by the urwid event loop; queries are written to VLC
+# and their replies are parsed whenever they arrive, so callers only ever read
+# the cached snapshot and never wait on the pipe.
+class VlcStatus:
+	def __init__(self, player):
+		self.player = player
+
+		# time & length
+		# =============
+		# Last reported position and length of the current track, in seconds
+		self.time = 0
+		self.length = 0
+
+		# volume
+		# ======
+		# Last reported volume, or None if not yet known
+		self.volume = None
+
+		# sampled_at
+		# ==========
+		# `monotonic()` time at which `time` was last reported
+		self.sampled_at = 0
+
+		# how often to ask VLC for fresh values, in seconds
+		self.refresh_interval = 1
+
+		# expected
+		# ========
+		# Names of the numeric replies we are still waiting on, oldest first
+		self.expected = collections.deque()
+		self.requested_at = 0
+
+		# partial line read from the pipe
+		self.buffer = ""
+		self.loop = None
+		self.handle = None
+
+		# regex used to pick numeric replies out of VLC's output
+		# sometimes we get extra prompt characters that need to be trimmed
+		self.reply_regex = re.compile(r"^[> ]*(\d*)$")
+		self.volume_regex = re.compile(r"audio volume: (\d+)")
+
+	# attach(loop)
+	# ============
+	# Starts watching the player output in the specified main loop.
+	def attach(self, loop):
+		self.loop = loop
+		self.watch()
+
+	# watch()
+	# =======
+	# Registers the player's stdout with the main loop, if both are available.
+	def watch(self):
+		if self.loop is not None and self.handle is None and self.player.is_open():
+			self.buffer = ""
+			self.expected.clear()
+			self.handle = self.loop.watch_file(self.player.process.stdout.fileno(), self.on_readable)
+
+	# unwatch()
+	# =========
+	# Stops watching the player output.
+	def unwatch(self):
+		if self.handle is not None:
+			self.loop.remove_watch_file(self.handle)
+			self.handle = None
+
+	# is_watching()
+	# =============
+	# Returns true if the player output is being read by the main loop.
+	def is_watching(self):
+		return self.handle is not None
+
+	# refresh()
+	# =========
+	# Asks VLC for the current length and position, unless a query is already
+	# outstanding. The replies are picked up by `on_readable()`.
+	def refresh(self):
+		now = monotonic()
+
+		# give up on replies that never arrived (e.g. VLC was busy seeking)
+		if self.expected and now - self.requested_at < 2 * self.refresh_interval:
+			return
+
+		self.expected.clear()
+		self.expected.extend(["length", "time"])
+		self.requested_at = now
+		self.player.send_command("get_length\nget_time\n")
+
+	# on_readable()
+	# =============
+	# Called by the main loop when VLC has written something.
+	def on_readable(self):
+		data = os.read(self.player.process.stdout.fileno(), 4096)
+
+		# the player has gone away
+		if not data:
+			self.unwatch()
+			return
+
+		lines = (self.buffer + data).split("\n")
+		self.buffer = lines.pop()
+
+		for line in lines:
+			self.parse(line.rstrip("\r"))
+
+	# parse(line)
+	# ===========
+	# Updates the snapshot from a single line of VLC output.
+	def parse(self, line):
+		match = self.reply_regex.match(line)
+		if match:
+			if self.expected:
+				name = self.expected.popleft()
+				value = match.group(1)
+
+				# VLC replies with a blank line when nothing is playing
+				if value:
+					if name == "time":
+						self.time = int(value)
+						self.sampled_at = monotonic()
+					else:
+						self.length = int(value)
+			return
+
+		# status change: ( new input: file:///... )
+		if "new input:" in line:
+			self.time = 0
+			self.length = 0
+			self.sampled_at = monotonic()
+			return
+
+		match = self.volume_regex.search(line)
+		if match:
+			self.volume = int(match.group(1))
+
+	# set_time(seconds)
+	# =================
+	# Moves the estimated position, e.g. after a seek, until VLC reports back.
+	def set_time(self, seconds):
+		self.time = seconds
+		self.sampled_at = monotonic()
+
+	# get_time()
+	# ==========
+	# The estimated position in the current track, in whole seconds.
+	def get_time(self):
+		if self.player.is_paused or not self.sampled_at:
+			return self.time
+
+		return self.time + int(monotonic() - self.sampled_at)
+
+	# time_remaining()
+	# ================
+	# The estimated time remaining on the current track, or -1 if unknown.
+	def time_remaining(self):
+		if monotonic() - self.requested_at >= self.refresh_interval:
+			self.refresh()
+
+		if self.length <= 0:
+			return -1
+
+		return max(self.length - self.get_time(), 0)
 
 # Many thanks to PyRadio (https://github.com/coderholic/pyradio)
 # for the media playing code (borrowed & remixed here; gotta love open source)
 # Wraps VLC player; assumes that "vlc" is in your path
-class VlcPlayer:
+class VlcPlayer(Player):
+	# positions are whole seconds, extrapolated from replies up to a second old
+	time_resolution = 2
+
 	def __init__(self, debug=False):
 		self.process = None
 
@@ -20,19 +299,26 @@ class VlcPlayer:
 		# sometimes we get extra prompt characters that need to be trimmed
 		self.time_remaining_regex = r"[> ]*(\d*)\r\n"
 
-		# setup logger
-		# clear log on startup
-		logpath = "./.player.log"
-		if os.path.exists(logpath):
-			os.remove(logpath)
-
-		if self.debug:
-			self.logger = logging.getLogger("player")
-			handler = logging.FileHandler(logpath)
-			formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-			handler.setFormatter(formatter)
-			self.logger.addHandler(handler)
-			self.logger.setLevel(logging.DEBUG)
+		# status
+		# ======
+		# Non-blocking view of the player status, once attached to a main loop
+		self.status = VlcStatus(self)
+
+		# logger
+		# ======
+		# Debug records, written in the background; see `EventLog`. Commands are
+		# sent every few seconds, and a player that can't be understood once usually
+		# can't be for a while, so only some of those are logged.
+		self.logger = log.logger("player", debug)
+		log.sample("player.command", 20)
+		log.sample("player.unparsed", 10)
+
+	# attach(loop)
+	# ============
+	# Reads player status through the specified urwid main loop from now on,
+	# instead of blocking on the player's output.
+	def attach(self, loop):
+		self.status.attach(loop)
 
 	#def __del__(self):
 		#self.process.close()
@@ -49,10 +335,12 @@ class VlcPlayer:
 	# Sends the specified command to the player, and returns on line of response from STDOUT
 	def send_command_readline(self, command):
 		if self.process is not None:
-			self.process.stdin.write(command.encode("utf-8"))
-		
-			# make sure to forward to the end	
-			return self.process.stdout.readline()
+			self.logger.debug("command", command=command.strip())
+			with metrics.timer("vlc.readline"):
+				self.process.stdin.write(command.encode("utf-8"))
+			
+				# make sure to forward to the end	
+				return self.process.stdout.readline()
 
 		return None
 
@@ -62,29 +350,49 @@ class VlcPlayer:
 	def is_open(self):
 		return bool(self.process)	
 
+	# get_volume()
+	# ============
+	# The last volume reported by VLC, or None if unknown.
+	def get_volume(self):
+		return self.status.volume
+
 	# volume_up()
 	# ===========
 	# Raises the volume.
 	def volume_up(self):
-		self.send_command_readline("volup\n")
+		self.send_volume_command("volup\n")
 
 	# volume_down()
 	# ============
 	# Lowers the volume.
 	def volume_down(self):
-		self.send_command_readline("voldown\n")
+		self.send_volume_command("voldown\n")
+
+	# send_volume_command(command)
+	# ============================
+	# Volume commands reply with the new volume; leave that to the status reader if we have one.
+	def send_volume_command(self, command):
+		if self.status.is_watching():
+			self.send_command(command)
+		else:
+			self.send_command_readline(command)
 
 	# pause()
 	# =======
 	# Pauses playback.
 	def pause(self):
+		# freeze (or restart) the estimated position where it is now
+		position = self.status.get_time()
 		self.is_paused = not self.is_paused
+		self.status.set_time(position)
+
 		self.send_command("pause\n")
 
 	# stop()
 	# ======
 	# Stops all playback, shutting down the player.
 	def stop(self):
+		self.status.unwatch()
 		self.send_command("shutdown\n")
 		self.process = None
 
@@ -106,6 +414,7 @@ class VlcPlayer:
 	# Skips the current track
 	def seek(self, seconds):
 		self.send_command("seek {0}\n".format(seconds))
+		self.status.set_time(seconds)
 		# update time value
 		# self.time += seconds
 
@@ -113,6 +422,9 @@ class VlcPlayer:
 	# ==========
 	# Gets the running time in for the current track.
 	def get_time(self):
+		if self.status.is_watching():
+			return self.status.get_time()
+
 		try:
 			# buffer the current time value
 			self.time = int(self.send_command_readline("get_time\n")[2:])
@@ -139,8 +451,12 @@ class VlcPlayer:
 											stdin=subprocess.PIPE,
 											stderr=subprocess.STDOUT)
 
-			self.process.stdout.readline()
-			self.process.stdout.readline()
+			# let the status reader skip over the startup banner,
+			# otherwise read past it here
+			self.status.watch()
+			if not self.status.is_watching():
+				self.process.stdout.readline()
+				self.process.stdout.readline()
 
 	# time_remaining()
 	# ================
@@ -148,6 +464,9 @@ class VlcPlayer:
 	def time_remaining(self):
 		default = -1
 
+		if self.status.is_watching():
+			return self.status.time_remaining()
+
 		if (self.is_open()):	
 			try:
 				
@@ -159,7 +478,7 @@ class VlcPlayer:
 				if match_dur:
 					duration = int(match_dur.group(1))
 				else:
-					self.logger.debug("unable to parse time remaining text: {0}", response_text)
+					self.logger.debug("unparsed", text=response_text)
 
 				# attempt to read current time elasped
 				response_text = self.send_command_readline("get_time\n")
@@ -168,7 +487,7 @@ class VlcPlayer:
 				if match_rem:
 					remaining = int(match_rem.group(1))
 				else:
-					self.logger.debug("unable to parse time remaining text: {0}", response_text)
+					self.logger.debug("unparsed", text=response_text)
 
 				#duration = int(self.send_command_readline("get_length\n")[2:])
 				#remaining = int(self.send_command_readline("get_time\n")[2:])
@@ -179,7 +498,7 @@ class VlcPlayer:
 					return default
 
 			except Exception, ex:
-				self.logger.error("error: " + str(ex))
+				self.logger.error("time_remaining", error=str(ex))
 				return default
 
 		return default
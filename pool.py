@@ -0,0 +1,146 @@
+import httplib, select, socket, threading, time
+
+# IDEMPOTENT
+# ==========
+# Methods that have the same effect sent twice as once, so are safe to retry
+# even if the server may have acted on the first attempt
+IDEMPOTENT = frozenset(["GET", "HEAD", "PUT", "DELETE", "OPTIONS", "TRACE"])
+
+# ConnectionPool
+# ==============
+# A small pool of keep-alive HTTP connections to a single host.
+# Connections are reused between requests, so API calls don't pay for TCP setup
+# every time, and are closed when the pool is full or the server hangs up.
+# Safe to share between the UI thread and the prefetch thread.
+class ConnectionPool:
+	# constructor
+	# * host: host name (and optional port) to connect to
+	# * size: maximum number of idle connections kept around
+	# * timeout: socket timeout in seconds for each request
+	# * retries: number of times a failed request is retried
+	# * backoff: seconds to wait before the first retry; doubled on each retry after that
+	def __init__(self, host, size=2, timeout=10, retries=2, backoff=0.5):
+		self.host = host
+		self.size = size
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+
+		# idle
+		# ====
+		# Connections that are open and not currently in use
+		self.idle = []
+		self.lock = threading.Lock()
+
+	# connect()
+	# =========
+	# Creates a new connection to the host.
+	def connect(self):
+		return httplib.HTTPConnection(self.host, timeout=self.timeout)
+
+	# acquire()
+	# =========
+	# Returns an idle connection, or a new one if none are available.
+	def acquire(self):
+		while True:
+			with self.lock:
+				if not self.idle:
+					break
+				conn = self.idle.pop()
+
+			if not self.dropped(conn):
+				return conn
+			conn.close()
+
+		return self.connect()
+
+	# dropped(conn)
+	# =============
+	# True if the server has hung up on an idle connection, e.g. at the end of
+	# its keep-alive timeout; an idle connection has nothing else to read.
+	def dropped(self, conn):
+		if conn.sock is None:
+			return False
+
+		try:
+			return bool(select.select([conn.sock], [], [], 0)[0])
+		except (select.error, socket.error, ValueError):
+			return True
+
+	# release(conn)
+	# =============
+	# Returns a connection to the pool, closing it if the pool is already full.
+	def release(self, conn):
+		with self.lock:
+			if len(self.idle) < self.size:
+				self.idle.append(conn)
+				return
+
+		conn.close()
+
+	# close()
+	# =======
+	# Closes all idle connections.
+	def close(self):
+		with self.lock:
+			idle, self.idle = self.idle, []
+
+		for conn in idle:
+			conn.close()
+
+	# open(method, path, body, headers)
+	# =================================
+	# Sends a request, and returns a tuple of the connection and the response,
+	# for callers that want to read the body as it arrives. Pass both to
+	# `finish()` once done with them. Requests that fail at the socket or HTTP
+	# level are retried with backoff; ones that aren't idempotent (e.g. a vote,
+	# or POST /next, which skips a track) only if they failed before anything
+	# was sent.
+	def open(self, method, path, body=None, headers={}):
+		attempt = 0
+
+		while True:
+			conn = self.acquire()
+			sent = False
+			try:
+				if conn.sock is None:
+					conn.connect()
+
+				sent = True
+				conn.request(method, path, body, headers)
+				return (conn, conn.getresponse())
+			except (httplib.HTTPException, socket.error):
+				conn.close()
+
+				if attempt >= self.retries or (sent and method not in IDEMPOTENT):
+					raise
+
+				time.sleep(self.backoff * (2 ** attempt))
+				attempt += 1
+
+	# finish(conn, response)
+	# ======================
+	# Returns the connection to the pool if the response was read in full,
+	# otherwise closes it.
+	def finish(self, conn, response):
+		if response.will_close or not response.isclosed():
+			response.close()
+			conn.close()
+		else:
+			self.release(conn)
+
+	# request(method, path, body, headers)
+	# ====================================
+	# Sends a request, and returns a tuple of the response status and body.
+	def request(self, method, path, body=None, headers={}):
+		conn, response = self.open(method, path, body, headers)
+
+		# the body must be read in full before the connection can be reused
+		try:
+			data = response.read()
+		except (httplib.HTTPException, socket.error):
+			conn.close()
+			raise
+
+		self.finish(conn, response)
+		return (response.status, data)
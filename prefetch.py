@@ -0,0 +1,177 @@
+import os, threading, time, Queue
+
+# Stopped
+# =======
+# Raised on the worker thread to abandon the download in flight once the
+# prefetcher is stopped.
+class Stopped(Exception):
+	pass
+
+# Prefetcher
+# ==========
+# Fetches upcoming tracks for a station on a background thread, so the UI never
+# blocks on the network. Finished downloads are handed back to the thread running
+# the urwid main loop through a pipe created with `MainLoop.watch_pipe`.
+# Several fetches can be requested at once; they run one after another.
+class Prefetcher:
+	# constructor
+	# * station: the station to fetch tracks from
+	# * callback: called from the main loop as callback(song, filename, error)
+	def __init__(self, station, callback):
+		self.station = station
+		self.callback = callback
+
+		# pending
+		# =======
+		# Number of fetches requested but not yet handed back
+		self.pending = 0
+
+		# generation
+		# ==========
+		# Incremented by `cancel()`; tracks fetched for an older generation are dropped
+		self.generation = 0
+
+		# requests & results
+		# ==================
+		# Work handed to the worker thread, and tracks handed back from it
+		self.requests = Queue.Queue()
+		self.results = Queue.Queue()
+
+		# progress
+		# ========
+		# (bytes_read, total_bytes) of the download in flight, or None;
+		# replaced wholesale by the worker, so it is safe to read from the main loop
+		self.progress = None
+
+		# throughput & track_bytes
+		# ========================
+		# Moving averages of the bytes per second fetched (including the API call),
+		# and of the size of a track; None until a track has been downloaded
+		self.throughput = None
+		self.track_bytes = None
+
+		# write end of the pipe watched by the main loop
+		self.pipe = None
+		self.thread = None
+		self.stopped = False
+
+	# start(loop)
+	# ===========
+	# Starts the worker thread, and hooks its results into the specified main loop.
+	# Requests made before the worker is started are picked up once it runs.
+	def start(self, loop):
+		self.loop = loop
+		self.stopped = False
+		self.pipe = loop.watch_pipe(self.on_results)
+
+		self.thread = threading.Thread(target=self.run, name="prefetch")
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop()
+	# ======
+	# Stops the worker thread, and closes the main loop pipe. The download in
+	# flight is abandoned at its next chunk, and the worker is waited for, so it
+	# neither writes to a closed pipe nor touches the station's files afterwards.
+	def stop(self):
+		if self.thread is not None:
+			self.stopped = True
+			self.requests.put(None)
+			self.thread.join()
+			self.loop.remove_watch_pipe(self.pipe)
+			os.close(self.pipe)
+			self.pipe = None
+			self.thread = None
+
+	# request()
+	# =========
+	# Asks for one more track to be fetched.
+	def request(self):
+		self.pending += 1
+		self.requests.put(self.generation)
+
+	# cancel()
+	# ========
+	# Drops every pending fetch, e.g. after changing stations; the download in
+	# flight, if any, is thrown away once done.
+	def cancel(self):
+		self.generation += 1
+		self.pending = 0
+
+	# run()
+	# =====
+	# The worker thread; downloads one track per request.
+	def run(self):
+		while True:
+			generation = self.requests.get()
+			if generation is None or self.stopped:
+				return
+
+			# skip fetches that were cancelled before we got to them
+			if generation != self.generation:
+				continue
+
+			try:
+				started = time.time()
+				read = [0]
+				def progress(bytes_read, total):
+					if self.stopped:
+						raise Stopped()
+					read[0] = bytes_read
+					self.on_progress(bytes_read, total)
+
+				song, filename = self.station.fetch_next(progress)
+
+				# tracks that came from the cache say nothing about the network
+				if read[0]:
+					self.measure(read[0], time.time() - started)
+
+				self.results.put((generation, song, filename, None))
+			except Exception as ex:
+				self.results.put((generation, None, None, ex))
+
+			# wake up the main loop
+			try:
+				os.write(self.pipe, "!")
+			except OSError:
+				return
+
+	# measure(size, seconds)
+	# ======================
+	# Updates the throughput averages with a track fetched from the network.
+	def measure(self, size, seconds):
+		average = lambda old, new: new if old is None else old * .7 + new * .3
+		self.throughput = average(self.throughput, size / max(seconds, .001))
+		self.track_bytes = average(self.track_bytes, size)
+
+	# fetch_time()
+	# ============
+	# Expected seconds to fetch a track, or None until one was downloaded.
+	def fetch_time(self):
+		if self.throughput is None:
+			return None
+
+		return self.track_bytes / self.throughput
+
+	# on_progress(read, total)
+	# ========================
+	# Called on the worker thread as the download progresses.
+	def on_progress(self, read, total):
+		self.progress = (read, total)
+
+	# on_results(data)
+	# ================
+	# Called in the main loop when the worker has finished fetching.
+	def on_results(self, data):
+		while not self.results.empty():
+			generation, song, filename, error = self.results.get_nowait()
+			self.progress = None
+
+			if generation != self.generation:
+				self.station.files.release(filename)
+				continue
+
+			self.pending -= 1
+			self.callback(song, filename, error)
+
+		return True
@@ -0,0 +1,142 @@
+import os, threading, Queue
+
+# StationSearch
+# =============
+# Runs station searches on a background thread, so typing never waits on the
+# network. Stations are handed back to the main loop in batches as they are
+# parsed, through a pipe created with `MainLoop.watch_pipe`. Starting a new
+# search cancels the one in flight; batches from older searches are dropped.
+# Completed searches are kept in a `SearchCache`, so repeating one doesn't touch
+# the network at all.
+class StationSearch:
+	# constructor
+	# * station: the station used to query Songza
+	# * callback: called from the main loop as callback(query, stations, done, error)
+	# * cache: optional SearchCache for completed searches
+	def __init__(self, station, callback, cache=None):
+		self.station = station
+		self.callback = callback
+		self.cache = cache
+
+		# found
+		# =====
+		# Stations found so far by the current search
+		self.found = []
+
+		# generation
+		# ==========
+		# Incremented for every search; only the latest one is current
+		self.generation = 0
+
+		# requests & results
+		# ==================
+		# Queries handed to the worker thread, and batches handed back from it
+		self.requests = Queue.Queue()
+		self.results = Queue.Queue()
+
+		# write end of the pipe watched by the main loop
+		self.pipe = None
+		self.thread = None
+
+	# start(loop)
+	# ===========
+	# Starts the worker thread, and hooks its results into the specified main loop.
+	def start(self, loop):
+		self.loop = loop
+		self.pipe = loop.watch_pipe(self.on_results)
+
+		self.thread = threading.Thread(target=self.run, name="search")
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop()
+	# ======
+	# Stops the worker thread, and closes the main loop pipe. The search in flight
+	# is abandoned at its next chunk, and the worker is waited for, so it never
+	# writes to the pipe once closed.
+	def stop(self):
+		if self.thread is not None:
+			self.cancel()
+			self.requests.put(None)
+			self.thread.join()
+			self.loop.remove_watch_pipe(self.pipe)
+			os.close(self.pipe)
+			self.pipe = None
+			self.thread = None
+
+	# search(query)
+	# =============
+	# Starts searching for stations, cancelling any search still in flight.
+	def search(self, query):
+		self.generation += 1
+		self.found = []
+
+		if self.cache is not None:
+			stations = self.cache.get(query)
+			if stations is not None:
+				self.callback(query, stations, True, None)
+				return
+
+			# show what we already know, while asking for the rest
+			stations = self.cache.get_prefix(query)
+			if stations:
+				self.callback(query, stations, False, None)
+
+		self.requests.put((self.generation, query))
+
+	# cancel()
+	# ========
+	# Cancels the search in flight, if any.
+	def cancel(self):
+		self.generation += 1
+
+	# run()
+	# =====
+	# The worker thread; runs one search per request.
+	def run(self):
+		while True:
+			request = self.requests.get()
+			if request is None:
+				return
+
+			generation, query = request
+			cancelled = lambda: generation != self.generation
+
+			# skip searches that were replaced before we got to them
+			if cancelled():
+				continue
+
+			try:
+				for stations in self.station.iter_query_station(query, cancelled):
+					self.post((generation, query, stations, False, None))
+				self.post((generation, query, [], True, None))
+			except Exception as ex:
+				self.post((generation, query, [], True, ex))
+
+	# post(result)
+	# ============
+	# Hands a result to the main loop.
+	def post(self, result):
+		self.results.put(result)
+		try:
+			os.write(self.pipe, "!")
+		except OSError:
+			pass
+
+	# on_results(data)
+	# ================
+	# Called in the main loop when the worker has parsed more stations.
+	def on_results(self, data):
+		while not self.results.empty():
+			generation, query, stations, done, error = self.results.get_nowait()
+			if generation != self.generation:
+				continue
+
+			self.found.extend(stations)
+			if done and error is None and self.cache is not None:
+				self.cache.put(query, self.found)
+				self.cache.save()
+
+			self.callback(query, stations, done, error)
+
+		return True
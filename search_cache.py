@@ -0,0 +1,162 @@
+import json, os, re, time, collections
+
+# SearchCache
+# ===========
+# An LRU cache of station search results, keyed by normalized query.
+# Entries expire after `ttl` seconds, and at most `size` queries are kept.
+# The cache is mirrored to a small JSON file, so results survive restarts and
+# are shared by every client using the same directory.
+class SearchCache:
+	# constructor
+	# * path: file the cache is persisted to, or None to keep it in memory only
+	# * size: maximum number of queries kept
+	# * ttl: seconds before cached results are considered stale
+	def __init__(self, path=None, size=200, ttl=6 * 60 * 60):
+		self.path = path
+		self.size = size
+		self.ttl = ttl
+
+		# entries
+		# =======
+		# normalized query => (time cached, stations), least recently used first
+		self.entries = collections.OrderedDict()
+
+		# dirty
+		# =====
+		# True if there are entries that have not been saved yet
+		self.dirty = False
+
+		# modification time of the file when last loaded or saved
+		self.mtime = None
+
+	# normalize(query)
+	# ================
+	# Folds case and whitespace, so equivalent queries share an entry.
+	def normalize(self, query):
+		return re.sub(r"\s+", " ", query.strip().lower())
+
+	# is_fresh(entry)
+	# ===============
+	def is_fresh(self, entry):
+		return time.time() - entry[0] < self.ttl
+
+	# get(query)
+	# ==========
+	# Returns the cached stations for the query, or None if missing or stale.
+	def get(self, query):
+		key = self.normalize(query)
+		entry = self.entries.get(key)
+
+		# another client may have searched for it since
+		if entry is None and self.refresh():
+			entry = self.entries.get(key)
+
+		if entry is None:
+			return None
+
+		if not self.is_fresh(entry):
+			del self.entries[key]
+			return None
+
+		# mark as most recently used
+		del self.entries[key]
+		self.entries[key] = entry
+		return entry[1]
+
+	# get_prefix(query)
+	# =================
+	# Returns the cached stations for the longest fresh query that is a prefix of
+	# this one, narrowed down to the stations whose name contains the query; or
+	# None if there is no such query. The result may be incomplete.
+	def get_prefix(self, query):
+		key = self.normalize(query)
+
+		for i in range(len(key) - 1, 0, -1):
+			entry = self.entries.get(key[:i])
+			if entry is not None and self.is_fresh(entry):
+				return [station for station in entry[1] if key in station["name"].lower()]
+
+		return None
+
+	# stations()
+	# ==========
+	# Returns every cached station.
+	def stations(self):
+		return [station for cached_at, stations in self.entries.values() for station in stations]
+
+	# put(query, stations)
+	# ====================
+	# Caches the stations found for the query, evicting the least recently used
+	# query if the cache is full.
+	def put(self, query, stations, cached_at=None):
+		key = self.normalize(query)
+		if key in self.entries:
+			del self.entries[key]
+
+		# only keep what the station list needs
+		stations = [{"id": station["id"], "name": station["name"]} for station in stations]
+		self.entries[key] = (cached_at or time.time(), stations)
+
+		while len(self.entries) > self.size:
+			self.entries.popitem(last=False)
+
+		self.dirty = True
+
+	# load()
+	# ======
+	# Merges the entries saved on disk into the cache, keeping the newest of each query.
+	def load(self):
+		if self.path is None or not os.path.exists(self.path):
+			return
+
+		try:
+			self.mtime = os.path.getmtime(self.path)
+			with open(self.path, "r") as file:
+				saved = json.load(file)
+		except (IOError, OSError, ValueError):
+			return
+
+		# entries from disk don't need saving again
+		dirty = self.dirty
+
+		for key, cached_at, stations in saved:
+			entry = self.entries.get(key)
+			if (entry is None or entry[0] < cached_at) and time.time() - cached_at < self.ttl:
+				self.put(key, stations, cached_at)
+
+		self.dirty = dirty
+
+	# refresh()
+	# =========
+	# Loads the file again if another client saved it since; returns True if it did.
+	def refresh(self):
+		try:
+			mtime = os.path.getmtime(self.path) if self.path is not None else None
+		except OSError:
+			return False
+
+		if mtime is None or mtime == self.mtime:
+			return False
+
+		self.load()
+		return True
+
+	# save()
+	# ======
+	# Writes the cache to disk, merged with whatever other clients saved meanwhile.
+	# The file is replaced atomically, so readers never see a partial write.
+	def save(self):
+		if self.path is None or not self.dirty:
+			return
+
+		self.load()
+
+		saved = [[key, entry[0], entry[1]] for key, entry in self.entries.items() if self.is_fresh(entry)]
+		temp = "{0}.{1}.tmp".format(self.path, os.getpid())
+		with open(temp, "w") as file:
+			json.dump(saved, file, separators=(",", ":"))
+		os.rename(temp, self.path)
+
+		self.mtime = os.path.getmtime(self.path)
+
+		self.dirty = False
@@ -0,0 +1,214 @@
+import json, os, threading
+
+# StateStore
+# ==========
+# Persists the app state (current station, listening history, cache index,
+# pending votes, ...) as a JSON snapshot plus an append-only journal.
+#
+# Changes are only kept in memory until `flush()`, which appends all of them to
+# the journal in one write, so many changes in a row cost a single small write.
+# Once the journal grows past `journal_limit` entries it is folded into a new
+# snapshot, written to a temporary file and renamed into place. Every journal
+# entry carries a sequence number, and the snapshot records the last one it
+# includes, so a crash at any point loses at most the changes not yet flushed,
+# and a torn last line is ignored. Safe to change from any thread.
+class StateStore:
+	# version of the snapshot format written by `compact()`
+	version = 1
+
+	# constructor
+	# * path: snapshot file; the journal is kept next to it, or None to keep state in memory only
+	# * journal_limit: number of journal entries that triggers a new snapshot
+	def __init__(self, path=None, journal_limit=100):
+		self.path = path
+		self.journal = path + ".journal" if path is not None else None
+		self.journal_limit = journal_limit
+
+		# data
+		# ====
+		# The state itself
+		self.data = {}
+
+		# seq
+		# ===
+		# Sequence number of the last change made
+		self.seq = 0
+
+		# changes & journaled
+		# ===================
+		# Journal entries not flushed yet, and number of entries in the journal file
+		self.changes = []
+		self.journaled = 0
+
+		self.lock = threading.Lock()
+
+	# get(key, default)
+	# =================
+	def get(self, key, default=None):
+		with self.lock:
+			return self.data.get(key, default)
+
+	# set(key, value)
+	# ===============
+	# Changes a value; the change is written on the next `flush()`.
+	def set(self, key, value):
+		with self.lock:
+			if self.data.get(key) == value and key in self.data:
+				return
+
+			self.data[key] = value
+			self.change({"op": "set", "key": key, "value": value})
+
+	# push(key, value, limit)
+	# =======================
+	# Appends a value to a list, dropping the oldest ones past `limit`.
+	def push(self, key, value, limit=None):
+		with self.lock:
+			self.apply({"op": "push", "key": key, "value": value, "limit": limit})
+			self.change({"op": "push", "key": key, "value": value, "limit": limit})
+
+	# change(entry)
+	# =============
+	# Queues a journal entry for the next flush; call with the lock held.
+	def change(self, entry):
+		self.seq += 1
+		entry["seq"] = self.seq
+
+		# a later value replaces an earlier unflushed one
+		if entry["op"] == "set":
+			self.changes = [e for e in self.changes if e["op"] != "set" or e["key"] != entry["key"]]
+		self.changes.append(entry)
+
+	# apply(entry)
+	# ============
+	# Applies a journal entry to the data.
+	def apply(self, entry):
+		if entry["op"] == "set":
+			self.data[entry["key"]] = entry["value"]
+		elif entry["op"] == "push":
+			values = self.data.setdefault(entry["key"], [])
+			values.append(entry["value"])
+			if entry.get("limit") is not None:
+				del values[:-entry["limit"]]
+
+	# load()
+	# ======
+	# Reads the snapshot, and replays the journal on top of it.
+	# Returns False if the snapshot could not be read; the state then starts out empty.
+	# A snapshot in an unknown format, e.g. written by a newer version, isn't read,
+	# and its journal is emptied rather than replayed.
+	def load(self):
+		if self.path is None:
+			return True
+
+		ok = True
+		known = True
+		snapshot_seq = 0
+		try:
+			with open(self.path, "r") as file:
+				text = file.read()
+			if text:
+				saved = json.loads(text)
+				if "version" in saved and "state" in saved:
+					if saved["version"] == self.version:
+						self.data = saved["state"]
+						snapshot_seq = saved.get("seq", 0)
+					else:
+						ok = known = False
+				else:
+					# before the snapshot format, the state was saved as is
+					self.data = saved
+		except IOError:
+			pass
+		except (ValueError, TypeError):
+			ok = False
+
+		self.seq = snapshot_seq
+		self.journaled = 0
+		if not known:
+			open(self.journal, "w").close()
+			return ok
+
+		try:
+			with open(self.journal, "r") as file:
+				text = file.read()
+		except IOError:
+			text = ""
+
+		# end of the last whole entry
+		good = 0
+		for line in text.splitlines(True):
+			try:
+				if not line.endswith("\n"):
+					raise ValueError("No end of line")
+				entry = json.loads(line)
+			except ValueError:
+				# a write torn by a crash; nothing after it made it either
+				break
+
+			good += len(line)
+			self.journaled += 1
+			if entry["seq"] > snapshot_seq:
+				self.apply(entry)
+				self.seq = entry["seq"]
+
+		# cut the torn write off, or the next flush would be appended to it
+		if good < len(text):
+			with open(self.journal, "r+") as file:
+				file.truncate(good)
+
+		return ok
+
+	# flush()
+	# =======
+	# Appends the changes made since the last flush to the journal, in one write,
+	# and syncs it to disk.
+	def flush(self):
+		if self.path is None:
+			return
+
+		with self.lock:
+			if not self.changes:
+				return
+
+			changes, self.changes = self.changes, []
+			data = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in changes)
+
+			fd = os.open(self.journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+			try:
+				while data:
+					data = data[os.write(fd, data):]
+				os.fsync(fd)
+			finally:
+				os.close(fd)
+
+			self.journaled += len(changes)
+			if self.journaled >= self.journal_limit:
+				self.compact()
+
+	# compact()
+	# =========
+	# Writes a new snapshot, and empties the journal; call with the lock held.
+	def compact(self):
+		temp = "{0}.{1}.tmp".format(self.path, os.getpid())
+		with open(temp, "w") as file:
+			json.dump({"version": self.version, "seq": self.seq, "state": self.data}, file, separators=(",", ":"))
+			file.flush()
+			os.fsync(file.fileno())
+		os.rename(temp, self.path)
+
+		# entries up to `seq` are in the snapshot now
+		open(self.journal, "w").close()
+		self.journaled = 0
+
+	# close()
+	# =======
+	# Flushes the remaining changes, and folds the journal into the snapshot.
+	def close(self):
+		if self.path is None:
+			return
+
+		self.flush()
+		with self.lock:
+			if self.journaled:
+				self.compact()
@@ -1,4 +1,8 @@
-import httplib, urllib, urllib2, argparse, json, os, threading, time, logging, os
+import httplib, urllib, urllib2, argparse, json, os, threading, time, os, collections
+from pool import ConnectionPool
+from tracks import TrackFiles
+from metrics import metrics
+from eventlog import log
 
 # Station
 # =======
@@ -6,15 +10,12 @@ import httplib, urllib, urllib2, argparse, json, os, threading, time, logging, o
 # the specified player (VLC only at the moment)
 class Station:
 	# constructor
-	def __init__(self, player, station_id=0, debug=False):
+	def __init__(self, player, station_id=0, debug=False, domain="songza.com"):
 		# set station_id
 		self.station_id = int(station_id)
 
-		# set the player for this station
-		if player is None:
-			raise Error("A player must be specified when creating a new station")
-		else:
-			self.player = player
+		# set the player for this station; None for one only used to search
+		self.player = player
 
 		# previous_track
 		# =============
@@ -36,27 +37,35 @@ class Station:
 		# Time the current track started
 		self.track_start = 0
 
-		# flip
-		# Keeps track which side of the tape we're on :D
-		# Seriously though, we use this to alternate files when streaming data.
-		self.flip = True
+		# previous_file, current_file & next_file
+		# ========================================
+		# Audio files of the previous, current and next tracks
+		self.previous_file = None
+		self.current_file = None
+		self.next_file = None
+
+		# upcoming
+		# ========
+		# Tracks downloaded ahead, as (song, filename) tuples, not yet handed to the player
+		self.upcoming = collections.deque()
+
+		# files
+		# =====
+		# Downloaded track audio, cached on disk; files the tracks above refer to are never evicted
+		self.files = TrackFiles()
+
+		# chunk_size
+		# ==========
+		# Number of bytes copied at a time when downloading track audio
+		self.chunk_size = 64 * 1024
 
 		# turn debugging on
 		self.debug = debug
 
-		# setup logger
-		# clear log on startup
-		logpath = "./.station.log"
-		if os.path.exists(logpath):
-			os.remove(logpath)
-
-		if self.debug:
-			self.logger = logging.getLogger("station")
-			handler = logging.FileHandler(logpath)
-			formatter = logging.Formatter("%(asctime)s %(levelname)s %(message)s")
-			handler.setFormatter(formatter)
-			self.logger.addHandler(handler)
-			self.logger.setLevel(logging.DEBUG)
+		# logger
+		# ======
+		# Debug records, written in the background; see `EventLog`
+		self.logger = log.logger("station", debug)
 
 		# HTTP headers used for requests
 		# fake the user agent so we're not rejected
@@ -65,18 +74,35 @@ class Station:
 			"Accept": "application/json, text/javascript, */*; q=0.01",
 			"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/27.0.1453.93 Safari/537.36"
 		}
+
+		# pool
+		# ====
+		# Keep-alive connections to songza, shared by all API calls
+		self.pool = ConnectionPool(domain)
 		
 
-	# connect()
-	# =========
-	# Returns a HTTP connection to the specified station.
-	# This method serves as the basis for most requests.
-	def connect(self):
-		# create connection to songza
-		domain = "songza.com"
-		conn = httplib.HTTPConnection(domain)
+	# request(method, path, body)
+	# ===========================
+	# Sends a request to songza over a pooled connection, and returns the response body.
+	# This method serves as the basis for all API calls.
+	def request(self, method, path, body=None):
+		status, data = self.pool.request(method, path, body, self.headers)
+
+		if status >= 400:
+			raise httplib.HTTPException("{0} {1} returned {2}".format(method, path, status))
+
+		return data
+
+	# close()
+	# =======
+	# Closes any open connections to songza, and lets go of the downloaded tracks.
+	def close(self):
+		self.pool.close()
 
-		return conn
+		self.drop_upcoming()
+		for filename in (self.previous_file, self.current_file, self.next_file):
+			self.files.release(filename)
+		self.previous_file = self.current_file = self.next_file = None
 
 	# get_station_path()
 	# ==================
@@ -95,51 +121,137 @@ class Station:
 	# Get the next track information from the server,
 	# and decode the JSON response.
 	def next(self):
-		# create connection
-		conn = self.connect()
-
 		# create post body
 		params = urllib.urlencode({"cover_size": "m", "format": "aac", "buffer": 0 })
-		conn.request("POST", self.get_station_path() + "/next", params, self.headers)
-
-		response = conn.getresponse()
-		json_data = response.read()
+		with metrics.timer("station.next"):
+			json_data = self.request("POST", self.get_station_path() + "/next", params)
 
-		if self.debug:
-			self.logger.debug("next() data: " + json_data)
+		self.logger.debug("next", bytes=len(json_data))
 
 		# decode json data
 		return json.loads(json_data)
 	
-	# play_next()
-	# ===========
-	# Get and play the next track.
-	# Also sets the `current_track` property with the current track information.
-	def play_next(self):
+	# download(url, filename, progress)
+	# =================================
+	# Streams the file at the specified URL to disk in `chunk_size` pieces,
+	# so memory use stays flat no matter how long the track is.
+	# The file is flushed and closed before this returns.
+	# * progress: optional function called as progress(bytes_read, total_bytes);
+	#   total_bytes is None if the server did not send a length
+	def download(self, url, filename, progress=None):
+		with metrics.timer("station.download"):
+			read = self.copy(url, filename, progress)
+
+		metrics.increment("station.download.bytes", read)
+		return read
+
+	# copy(url, filename, progress)
+	# =============================
+	# Does the work for `download()`.
+	def copy(self, url, filename, progress=None):
+		response = urllib2.urlopen(url, timeout=self.pool.timeout)
+
+		try:
+			total = int(response.info().getheader("Content-Length"))
+		except (TypeError, ValueError):
+			total = None
+
+		read = 0
+		with open(filename, "wb") as track:
+			while True:
+				chunk = response.read(self.chunk_size)
+				if not chunk:
+					break
+
+				track.write(chunk)
+				read += len(chunk)
+
+				if progress is not None:
+					progress(read, total)
+
+			track.flush()
+			os.fsync(track.fileno())
+
+		response.close()
+		return read
+
+	# fetch_next(progress)
+	# ====================
+	# Get the next track and download its audio, without handing it to the player.
+	# Returns a tuple of the song data and the local filename.
+	# This is safe to call from a worker thread (see `Prefetcher`).
+	# * progress: passed through to `download()`
+	def fetch_next(self, progress=None):
 		# get the next track
 		track_data = self.next()
 
-		if self.debug:
-			self.logger.debug("next track: " + track_data["listen_url"])
-
-		# track_data -> listen_url
-		# download the file specified in the response
-		response = urllib2.urlopen(track_data["listen_url"])
-
-		# remember info about the current track
-		self.next_track = track_data["song"]
-	
-		# self.previous_track = self.current_track
-		# self.current_track = track_data["song"]
-	
-		# overwrite the same files repeatedly
-		# (we're not pirates) ;)
-		filename = ( "a" if self.flip else "b") + "-side.mp4"
-		track = open(filename, "w")	
-		track.write(response.read())
-
-		# flip the side
-		self.flip = not self.flip
+		self.logger.debug("track", song_id=track_data["song"]["id"], url=track_data["listen_url"])
+
+		# every song gets its own file, so nothing the player is reading is
+		# overwritten; a song we already have doesn't need downloading again
+		song = track_data["song"]
+		filename, complete = self.files.acquire(song)
+		metrics.increment("tracks.cached" if complete else "tracks.downloaded")
+
+		if not complete:
+			# track_data -> listen_url
+			# download the file specified in the response
+			try:
+				self.files.store(filename, lambda temp: self.download(track_data["listen_url"], temp, progress))
+			except:
+				self.files.release(filename)
+				raise
+
+		return (song, filename)
+
+	# buffer_track(song, filename)
+	# ============================
+	# Adds a downloaded track to the end of the `upcoming` queue.
+	def buffer_track(self, song, filename):
+		self.upcoming.append((song, filename))
+
+	# queue_next()
+	# ============
+	# Hands the first upcoming track to the player.
+	# Returns False if there were no upcoming tracks.
+	def queue_next(self):
+		if not self.upcoming:
+			return False
+
+		song, filename = self.upcoming.popleft()
+		self.queue_track(song, filename)
+		return True
+
+	# requeue(song)
+	# =============
+	# Puts a song whose audio is still cached at the front of the `upcoming` queue,
+	# e.g. to hear it again. Returns False if the audio is no longer cached.
+	def requeue(self, song):
+		filename, complete = self.files.acquire(song)
+		if not complete:
+			self.files.release(filename)
+			return False
+
+		self.upcoming.appendleft((song, filename))
+		return True
+
+	# drop_upcoming()
+	# ===============
+	# Throws away the upcoming tracks, e.g. after changing stations.
+	def drop_upcoming(self):
+		while self.upcoming:
+			song, filename = self.upcoming.popleft()
+			self.files.release(filename)
+
+	# queue_track(song, filename)
+	# ===========================
+	# Hands an already downloaded track to the player.
+	# Also sets the `next_track` property with the track information.
+	# The station takes over the reference to the file.
+	def queue_track(self, song, filename):
+		# remember info about the next track
+		self.next_track = song
+		self.next_file = filename
 
 		# remember time the track was started
 		self.track_start = time.time()
@@ -149,6 +261,13 @@ class Station:
 		# filename = os.path.dirname(os.path.abspath(__file__)) + "/" + filename
 		self.player.play(filename)
 
+	# play_next()
+	# ===========
+	# Get and play the next track, blocking until it has been downloaded.
+	def play_next(self):
+		song, filename = self.fetch_next()
+		self.queue_track(song, filename)
+
 	# tune_in()
 	# =========
 	# Tune in and stream music
@@ -169,46 +288,129 @@ class Station:
 	# * previous_track => current_track
 	# * current_track => next_track
 	# * next_track => None
+	# The file of the track that was previous before is released.
 	def update_track_info(self):
 		if (self.next_track != None):
+			self.files.release(self.previous_file)
+
 			self.previous_track = self.current_track
 			self.current_track = self.next_track
 			self.next_track = None
 
+			self.previous_file = self.current_file
+			self.current_file = self.next_file
+			self.next_file = None
+
 	# query_station()
 	# ===============
 	# Searches Songza for new stations by name
 	def query_station(self, query):
-		# create connection
-		conn = self.connect()
-
-		# create request body
-		conn.request("GET", "/api/1/search/station?query=" + query, None, self.headers)
-
-		response = conn.getresponse()
-		json_data = response.read()
-
-		if self.debug:
-			self.logger.debug("station query results: " + json_data)
-
-		# decode json data
-		return json.loads(json_data)
+		return [station for stations in self.iter_query_station(query) for station in stations]
+
+	# iter_query_station(query, cancelled)
+	# ====================================
+	# Searches Songza for new stations by name, yielding lists of stations as
+	# they are parsed out of the response, instead of waiting for all of it.
+	# * cancelled: optional function; the search is abandoned once it returns True
+	def iter_query_station(self, query, cancelled=None):
+		# create request
+		if isinstance(query, unicode):
+			query = query.encode("utf-8")
+		params = urllib.urlencode({"query": query})
+		path = "/api/1/search/station?" + params
+
+		conn, response = self.pool.open("GET", path, None, self.headers)
+		try:
+			if response.status >= 400:
+				raise httplib.HTTPException("GET {0} returned {1}".format(path, response.status))
+
+			count = 0
+			parser = JsonArrayParser()
+			while not parser.done:
+				chunk = response.read(self.chunk_size)
+				if not chunk or (cancelled is not None and cancelled()):
+					break
+
+				stations = parser.feed(chunk)
+				count += len(stations)
+				if stations:
+					yield stations
+		finally:
+			self.pool.finish(conn, response)
+
+		self.logger.debug("search", query=query, results=count)
 		
-	# vote(song_id, up)
-	# =================
+	# vote(song_id, up, station_id)
+	# =============================
 	# Up or downvotes the specified song
 	# * up: True for upvote, False for downvote
-	def vote(self, song_id, up):
-		# create connection
-		conn = self.connect()
+	# * station_id: station the song was played on; defaults to the current one
+	def vote(self, song_id, up, station_id=None):
+		if station_id is None:
+			station_id = self.station_id
 
 		# create request body
 		direction = "up" if up else "down"
-		url = "/api/1/station/{0}/song/{1}/vote/{2}".format(self.station_id, song_id, direction)
-
-		if self.debug:
-			self.logger.debug("{0}voted: {1}".format(direction, url))
-
-		conn.request("POST", url, None, self.headers)
-
-		response = conn.getresponse()
+		url = "/api/1/station/{0}/song/{1}/vote/{2}".format(station_id, song_id, direction)
+
+		self.logger.debug("vote", station_id=station_id, song_id=song_id, direction=direction)
+
+		self.request("POST", url)
+
+
+# JsonArrayParser
+# ===============
+# Incrementally decodes the items of a JSON array as its text arrives in pieces.
+class JsonArrayParser:
+	def __init__(self):
+		self.decoder = json.JSONDecoder()
+		self.buffer = ""
+		self.started = False
+
+		# done
+		# ====
+		# True once the closing bracket has been seen
+		self.done = False
+
+	# feed(data)
+	# ==========
+	# Adds text to the buffer, and returns the list of items completed by it.
+	def feed(self, data):
+		self.buffer += data
+		items = []
+
+		while not self.done:
+			text = self.buffer.lstrip(" \t\r\n,")
+
+			if not self.started:
+				if not text:
+					break
+				if text[0] != "[":
+					raise ValueError("expected a JSON array")
+				self.started = True
+				text = text[1:].lstrip(" \t\r\n,")
+
+			if text.startswith("]"):
+				self.done = True
+				text = text[1:]
+			elif text:
+				try:
+					item, end = self.decoder.raw_decode(text)
+				except ValueError:
+					# the item is not complete yet
+					self.buffer = text
+					break
+
+				# a number can be cut off at the end of a piece
+				if end == len(text) and isinstance(item, (int, long, float)):
+					self.buffer = text
+					break
+
+				items.append(item)
+				text = text[end:]
+
+			self.buffer = text
+			if not text:
+				break
+
+		return items
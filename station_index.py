@@ -0,0 +1,180 @@
+import json, os, re
+
+# StationIndex
+# ============
+# A local prefix index over every station the client has seen, for instant
+# type-ahead suggestions while the user types a search.
+#
+# Each word of a station name is indexed under its first 1..`prefix_length`
+# characters. Posting lists are sorted by rank (shorter names first, then
+# alphabetically), so a lookup walks them in order and stops as soon as it has
+# enough suggestions, no matter how many stations are indexed. Lists are
+# appended to as stations are added, and only sorted again when next looked up.
+class StationIndex:
+	# constructor
+	# * path: file the known stations are persisted to, or None to keep them in memory only
+	# * prefix_length: longest prefix indexed; longer query words are checked against the names
+	def __init__(self, path=None, prefix_length=4):
+		self.path = path
+		self.prefix_length = prefix_length
+
+		# stations
+		# ========
+		# station id => (rank key, name, words); the words are joined into one
+		# string, each preceded by a space, so a word prefix is a substring test
+		self.stations = {}
+
+		# first & any
+		# ===========
+		# prefix => sorted rank keys of stations whose first word / any word starts with it
+		self.first = {}
+		self.any = {}
+
+		# unsorted
+		# ========
+		# Posting lists appended to since they were last sorted
+		self.unsorted = set()
+
+		# dirty
+		# =====
+		# True if there are stations that have not been saved yet
+		self.dirty = False
+
+		# loaded
+		# ======
+		# True once the saved stations have been loaded
+		self.loaded = False
+
+	# tokenize(text)
+	# ==============
+	# Splits text into lower case words.
+	def tokenize(self, text):
+		return re.findall(r"\w+", text.lower(), re.UNICODE)
+
+	# add(stations)
+	# =============
+	# Indexes stations (dictionaries with an "id" and a "name"); known ones are skipped.
+	def add(self, stations):
+		for station in stations:
+			station_id = station["id"]
+			name = station["name"]
+			if station_id in self.stations:
+				continue
+
+			words = self.tokenize(name)
+			key = (len(name), name.lower(), station_id)
+			self.stations[station_id] = (key, name, "".join(" " + word for word in words))
+			self.dirty = True
+
+			prefixes = set()
+			for i, word in enumerate(words):
+				for n in range(1, min(len(word), self.prefix_length) + 1):
+					if i == 0:
+						self.append(self.first, word[:n], key)
+					prefixes.add(word[:n])
+
+			for prefix in prefixes:
+				self.append(self.any, prefix, key)
+
+	# append(table, prefix, key)
+	# ==========================
+	def append(self, table, prefix, key):
+		postings = table.get(prefix)
+		if postings is None:
+			postings = table[prefix] = []
+
+		postings.append(key)
+		self.unsorted.add(id(postings))
+
+	# postings(table, prefix)
+	# =======================
+	# Returns the posting list for a prefix, in rank order.
+	def postings(self, table, prefix):
+		postings = table.get(prefix, [])
+		if id(postings) in self.unsorted:
+			postings.sort()
+			self.unsorted.discard(id(postings))
+
+		return postings
+
+	# matches(words, query_words)
+	# ===========================
+	# True if every query word is a prefix of a word in the name.
+	def matches(self, words, query_words):
+		for query_word in query_words:
+			if " " + query_word not in words:
+				return False
+
+		return True
+
+	# suggest(query, limit)
+	# =====================
+	# Returns up to `limit` known stations matching the query, best first, as
+	# dictionaries with an "id" and a "name". Every word of the query must be a
+	# prefix of a word in the name; names starting with the query come first.
+	def suggest(self, query, limit=10):
+		query_words = self.tokenize(query)
+		if not query_words:
+			return []
+
+		prefixes = [word[:self.prefix_length] for word in query_words]
+
+		# names starting with the first word, then any names with all the words,
+		# walking the shortest posting list; both are in rank order
+		candidates = [
+			self.postings(self.first, prefixes[0]),
+			min((self.postings(self.any, prefix) for prefix in prefixes), key=len)
+		]
+
+		found = []
+		seen = set()
+		for postings in candidates:
+			for key in postings:
+				station_id = key[2]
+				if station_id in seen or not self.matches(self.stations[station_id][2], query_words):
+					continue
+
+				seen.add(station_id)
+				found.append({"id": station_id, "name": self.stations[station_id][1]})
+				if len(found) >= limit:
+					return found
+
+		return found
+
+	# load()
+	# ======
+	# Indexes the stations saved on disk.
+	def load(self):
+		self.loaded = True
+		if self.path is None or not os.path.exists(self.path):
+			return
+
+		try:
+			with open(self.path, "r") as file:
+				saved = json.load(file)
+		except (IOError, ValueError):
+			return
+
+		# stations from disk don't need saving again
+		dirty = self.dirty
+		self.add({"id": station_id, "name": name} for station_id, name in saved)
+		self.dirty = dirty
+
+	# save()
+	# ======
+	# Writes the known stations to disk; the file is replaced atomically.
+	def save(self):
+		if self.path is None or not self.dirty:
+			return
+
+		# don't lose the stations saved earlier
+		if not self.loaded:
+			self.load()
+
+		saved = [[station_id, entry[1]] for station_id, entry in self.stations.items()]
+		temp = "{0}.{1}.tmp".format(self.path, os.getpid())
+		with open(temp, "w") as file:
+			json.dump(saved, file, separators=(",", ":"))
+		os.rename(temp, self.path)
+
+		self.dirty = False
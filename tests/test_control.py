@@ -0,0 +1,137 @@
+import os, shutil, socket, tempfile, time, unittest, urwid
+
+from control import ControlServer, ControlClient
+from daemon import Daemon
+
+
+class StandInJukebox:
+    def __init__(self):
+        self.listeners = []
+        self.commands = []
+        self.track = None
+
+    def listen(self, listener):
+        self.listeners.append(listener)
+
+    def unlisten(self, listener):
+        self.listeners.remove(listener)
+
+    def status(self):
+        return {"track": self.track, "message": "", "paused": False, "remaining": None, "rate": 1}
+
+    def notify(self):
+        for listener in self.listeners:
+            listener(self.status())
+
+    def skip(self):
+        self.commands.append("skip")
+        self.track = {"title": "Next"}
+        self.notify()
+
+    def upvote(self):
+        self.commands.append("upvote")
+
+    def downvote(self):
+        self.commands.append("downvote")
+
+    def change_station(self, name, station_id):
+        self.commands.append(("station", name, station_id))
+
+    def setup(self, player, station, station_id=None):
+        self.commands.append("setup")
+
+    def close(self):
+        self.commands.append("close")
+
+
+class ControlTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".control.sock")
+        self.loop = urwid.SelectEventLoop()
+        self.jukebox = StandInJukebox()
+        self.quit = False
+        self.server = ControlServer(self.jukebox, self.path, self.on_quit)
+        self.server.start(self.loop)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def on_quit(self):
+        self.quit = True
+
+    # runs the loop until the condition holds, or a while has passed
+    def run_until(self, condition, timeout=2):
+        deadline = time.time() + timeout
+
+        def check():
+            if condition() or time.time() > deadline:
+                raise urwid.ExitMainLoop()
+            self.loop.alarm(.01, check)
+
+        self.loop.alarm(0, check)
+        self.loop.run()
+        return condition()
+
+    def client(self):
+        client = ControlClient(self.path)
+        client.connect()
+        client.start(self.loop)
+        client.seen = []
+        client.listen(client.seen.append)
+        return client
+
+    def test_commands_and_pushed_status(self):
+        first, second = self.client(), self.client()
+        assert self.run_until(lambda: first.seen and second.seen)
+        self.assertEqual(first.status()["track"], None)
+
+        first.skip()
+        first.downvote()
+        second.change_station("Jazz", 5)
+        assert self.run_until(lambda: len(self.jukebox.commands) == 3)
+        self.assertEqual(sorted(self.jukebox.commands), sorted(["skip", "downvote", ("station", "Jazz", 5)]))
+
+        # both observe the skip, without asking
+        assert self.run_until(lambda: second.status()["track"] is not None)
+        self.assertEqual(first.status()["track"], {"title": "Next"})
+        first.close()
+        second.close()
+
+    def test_errors_and_quit(self):
+        client = self.client()
+        client.send("rewind")
+        assert self.run_until(lambda: client.status()["message"])
+        self.assertEqual(client.status()["message"], "Unknown command: rewind")
+
+        client.send("quit")
+        assert self.run_until(lambda: self.quit)
+        client.close()
+
+    def test_client_notices_the_server_going_away(self):
+        client = self.client()
+        assert self.run_until(lambda: client.seen)
+        self.server.stop()
+        assert self.run_until(lambda: client.sock is None)
+        assert client.status()["message"].startswith("Disconnected")
+
+    def test_socket_in_use(self):
+        with self.assertRaises(socket.error):
+            ControlServer(StandInJukebox(), self.path).start(self.loop)
+
+    def test_daemon_closes_the_jukebox_if_it_cannot_serve(self):
+        jukebox = StandInJukebox()
+        with self.assertRaises(socket.error):
+            Daemon(jukebox, self.path).run(None, None)
+        self.assertEqual(jukebox.commands, ["setup", "close"])
+
+    def test_stale_socket_is_taken_over(self):
+        self.server.stop()
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.path)
+        stale.close()
+        self.server.start(self.loop)
+        client = self.client()
+        assert self.run_until(lambda: client.seen)
+        client.close()
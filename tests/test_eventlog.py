@@ -0,0 +1,55 @@
+import json, os, shutil, tempfile, unittest
+
+from eventlog import EventLog
+
+
+class EventLogTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".debug.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def records(self, path=None):
+        return [json.loads(line) for line in open(path or self.path)]
+
+    def test_structured_records(self):
+        log = EventLog(self.path)
+        log.logger("station").debug("search", query="jazz", results=3)
+        log.logger("player").error("time_remaining", error="broken pipe")
+        log.close()
+        records = self.records()
+        self.assertEqual([(r["level"], r["source"], r["event"]) for r in records],
+                         [("debug", "station", "search"), ("error", "player", "time_remaining")])
+        self.assertEqual((records[0]["query"], records[0]["results"]), ("jazz", 3))
+
+    def test_disabled_logger_writes_nothing(self):
+        log = EventLog(self.path)
+        log.logger("station", False).debug("search")
+        log.close()
+        assert not os.path.exists(self.path)
+
+    def test_sampling(self):
+        log = EventLog(self.path)
+        log.sample("player.command", 10)
+        logger = log.logger("player")
+        for i in range(25):
+            logger.debug("command", command=i)
+        logger.debug("unparsed")
+        log.close()
+        records = self.records()
+        self.assertEqual([r.get("command") for r in records], [0, 10, 20, None])
+        self.assertEqual(records[0]["sampled"], 10)
+
+    def test_rotation(self):
+        log = EventLog(self.path, max_bytes=500, backups=2)
+        logger = log.logger("station")
+        for i in range(40):
+            logger.debug("next", n=i)
+        log.close()
+        self.assertEqual(sorted(os.listdir(self.dir)), [".debug.log", ".debug.log.1", ".debug.log.2"])
+        for name in os.listdir(self.dir):
+            assert os.path.getsize(os.path.join(self.dir, name)) <= 500
+        self.assertEqual(self.records()[-1]["n"], 39)
+        self.assertEqual(self.records(self.path + ".1")[-1]["n"] + 1, self.records()[0]["n"])
@@ -0,0 +1,36 @@
+import os, shutil, tempfile, unittest
+
+from fake_songza import FakeSongza
+from station import Station
+
+
+class FakeSongzaTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.server = FakeSongza(bitrate=8000)
+        self.server.start()
+        self.station = Station(object(), 1393494, domain=self.server.host)
+
+    def tearDown(self):
+        self.station.close()
+        self.server.stop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_fetch_next(self):
+        progress = []
+        for song in self.server.fixtures["next"][:2]:
+            fetched, filename = self.station.fetch_next(lambda r, t: progress.append((r, t)))
+            self.assertEqual(fetched, song)
+            self.assertEqual(os.path.getsize(filename), song["duration"] * 1000)
+            self.assertEqual(progress[-1], (song["duration"] * 1000,) * 2)
+        self.assertEqual(self.server.requests, {"next": 2, "audio": 2})
+
+    def test_search_and_vote(self):
+        stations = self.station.query_station("rock")
+        self.assertEqual([s["name"] for s in stations],
+            ["Classic Rock Road Trip", "Rock Workout"])
+        self.station.vote(3716371, False)
+        self.assertEqual(self.server.requests["vote"], 1)
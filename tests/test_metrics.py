@@ -0,0 +1,63 @@
+import json, os, random, shutil, tempfile, unittest
+
+from metrics import Histogram, Metrics
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        histogram = Histogram()
+        self.assertEqual(histogram.percentile(50), None)
+        self.assertEqual(histogram.summary()["mean"], None)
+
+    def test_percentiles_are_within_precision(self):
+        histogram = Histogram()
+        values = [random.uniform(.0001, 10) for i in range(10000)]
+        for value in values:
+            histogram.record(value)
+        values.sort()
+        for p in (50, 90, 99, 99.9):
+            exact = values[int(len(values) * p / 100.0) - 1]
+            self.assertAlmostEqual(histogram.percentile(p), exact, delta=exact / 16.0)
+        self.assertEqual(histogram.percentile(100), values[-1])
+
+    def test_zero(self):
+        histogram = Histogram()
+        histogram.record(0)
+        histogram.record(1)
+        self.assertEqual(histogram.percentile(50), 0)
+
+
+class MetricsTest(unittest.TestCase):
+    def test_timer_counts_errors(self):
+        metrics = Metrics()
+        with metrics.timer("op"):
+            pass
+        with self.assertRaises(IOError):
+            with metrics.timer("op"):
+                raise IOError()
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["histograms"]["op"]["count"], 2)
+        self.assertEqual(snapshot["counters"], {"op.errors": 1})
+
+    def test_wrap(self):
+        class Thing:
+            def double(self, x):
+                return x * 2
+
+        metrics = Metrics()
+        thing = Thing()
+        metrics.wrap(thing, "double", "thing.double")
+        self.assertEqual(thing.double(2), 4)
+        self.assertEqual(metrics.snapshot()["histograms"]["thing.double"]["count"], 1)
+
+    def test_dump(self):
+        dir = tempfile.mkdtemp()
+        try:
+            metrics = Metrics()
+            metrics.increment("bytes", 10)
+            path = os.path.join(dir, "metrics.json")
+            metrics.dump(path)
+            self.assertEqual(json.load(open(path))["counters"], {"bytes": 10})
+            self.assertEqual(os.listdir(dir), ["metrics.json"])
+        finally:
+            shutil.rmtree(dir)
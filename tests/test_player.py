@@ -0,0 +1,158 @@
+import json, os, socket, tempfile, threading, time, unittest
+
+from fake_player import FakePlayer, SimulatedClock
+from mpv_player import MpvPlayer
+from player import VlcStatus
+
+
+# steps the wall clock an hour ahead, like a time sync would
+class ClockStep:
+    def __enter__(self):
+        self.time = time.time
+        time.time = lambda: self.time() + 3600
+
+    def __exit__(self, *args):
+        time.time = self.time
+
+
+class StandInVlc:
+    is_paused = False
+
+
+class FakePlayerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = SimulatedClock(speed=0)
+        self.player = FakePlayer(self.clock, track_length=100)
+
+    def test_play_through_queue(self):
+        p = self.player
+        assert not p.is_open()
+        p.play("a")
+        p.play("b")
+        self.assertEqual(p.time_remaining(), 100)
+        self.clock.advance(130)
+        self.assertEqual(p.get_time(), 30)
+        self.assertEqual(p.played, [(0, "a"), (100, "b")])
+        self.clock.advance(100)
+        self.assertEqual(p.time_remaining(), -1)
+
+        # like VLC, enqueueing doesn't restart a stopped player
+        p.enqueue("c")
+        self.assertEqual(p.time_remaining(), -1)
+        p.skip()
+        self.assertEqual(p.time_remaining(), 100)
+
+    def test_pause_seek(self):
+        p = self.player
+        p.play("a")
+        self.clock.advance(10)
+        p.pause()
+        self.clock.advance(50)
+        self.assertEqual(p.get_time(), 10)
+        p.seek(20)
+        p.pause()
+        self.clock.advance(5)
+        status = p.get_status()
+        self.assertEqual((status["time"], status["length"], status["paused"]),
+            (25, 100, False))
+
+    def test_faster_than_real_time(self):
+        p = FakePlayer(SimulatedClock(speed=1000), track_length=1)
+        p.play("a")
+        p.enqueue("b")
+        time.sleep(.01)
+        self.assertEqual(p.time_remaining(), -1)
+        self.assertEqual(len(p.played), 2)
+
+
+class VlcStatusTest(unittest.TestCase):
+    def test_wall_clock_step(self):
+        status = VlcStatus(StandInVlc())
+        status.set_time(30)
+        with ClockStep():
+            self.assertEqual(status.get_time(), 30)
+
+
+class MpvStatusTest(unittest.TestCase):
+    def test_wall_clock_step(self):
+        p = MpvPlayer(spawn=False)
+        p.parse({"event": "property-change", "name": "time-pos", "data": 30.0})
+        with ClockStep():
+            self.assertEqual(p.get_time(), 30)
+
+
+class StandInMpv(threading.Thread):
+    """Accepts one IPC connection, records commands and pushes events."""
+    def __init__(self, path):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.commands = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+
+    def run(self):
+        self.conn, addr = self.server.accept()
+        buf = ""
+        while True:
+            data = self.conn.recv(4096)
+            if not data:
+                return
+            buf += data
+            while "\n" in buf:
+                line, buf = buf.split("\n", 1)
+                self.commands.append(json.loads(line)["command"])
+
+    def push(self, name, data):
+        self.conn.sendall(json.dumps({"event": "property-change",
+            "id": 1, "name": name, "data": data}) + "\n")
+
+
+class MpvPlayerTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "mpv.sock")
+        self.mpv = StandInMpv(self.path)
+        self.mpv.start()
+
+    def tearDown(self):
+        self.mpv.server.close()
+        os.remove(self.path)
+        os.rmdir(self.dir)
+
+    def wait_for(self, count):
+        for i in range(200):
+            if len(self.mpv.commands) >= count:
+                return
+            time.sleep(.005)
+
+    def test_commands_and_events(self):
+        p = MpvPlayer(socket_path=self.path, spawn=False)
+        self.assertEqual(p.time_remaining(), -1)
+        p.play("a-side.mp4")
+        p.enqueue("b-side.mp4")
+        p.skip()
+        p.volume_up()
+        p.pause()
+        self.wait_for(9)
+        self.assertEqual(self.mpv.commands[4:], [
+            ["loadfile", "a-side.mp4", "append-play"],
+            ["loadfile", "b-side.mp4", "append"],
+            ["playlist-next", "force"],
+            ["add", "volume", 5],
+            ["set_property", "pause", True]])
+
+        self.mpv.push("duration", 200.5)
+        self.mpv.push("time-pos", 42.0)
+        self.mpv.push("volume", 80)
+        for i in range(200):
+            if p.get_volume() is not None:
+                break
+            time.sleep(.005)
+        self.assertEqual(p.get_status()["time"], 42)
+        self.assertEqual(p.time_remaining(), 158)
+        self.assertEqual(p.get_volume(), 80)
+
+        p.stop()
+        self.wait_for(10)
+        self.assertEqual(self.mpv.commands[-1], ["quit"])
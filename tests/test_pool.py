@@ -0,0 +1,131 @@
+import BaseHTTPServer, httplib, json, socket, threading, time, unittest
+
+from pool import ConnectionPool
+from station import Station
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def respond(self):
+        self.server.requests += 1
+        if self.path.startswith("/hangup"):
+            # acted on the request, but hung up before answering
+            self.close_connection = 1
+            return
+
+        if self.path.startswith("/missing"):
+            status, body = 404, ""
+        else:
+            status, body = 200, json.dumps({"path": self.path})
+            if self.path.startswith("/api/1/search"):
+                body = "[" + body + "]"
+
+        length = int(self.headers.getheader("Content-Length") or 0)
+        self.rfile.read(length)
+
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        # hang up without telling the client, like a server timing out keep-alive
+        if self.server.drop:
+            self.close_connection = 1
+
+    do_GET = respond
+    do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), StandInHandler)
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.drop = False
+
+        # count the connections the server has closed
+        self.server.hangups = 0
+        shutdown_request = self.server.shutdown_request
+        def counting_shutdown_request(request):
+            shutdown_request(request)
+            self.server.hangups += 1
+        self.server.shutdown_request = counting_shutdown_request
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.host = "127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def wait_for_hangups(self, count, timeout=2):
+        deadline = time.time() + timeout
+        while self.server.hangups < count and time.time() < deadline:
+            time.sleep(.001)
+
+    def test_keep_alive_reuse(self):
+        pool = ConnectionPool(self.host, backoff=0)
+        for i in range(3):
+            status, data = pool.request("GET", "/a")
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(data), {"path": "/a"})
+        pool.close()
+        self.assertEqual(self.server.connections, 1)
+
+    def test_retry_dropped_connection(self):
+        self.server.drop = True
+        pool = ConnectionPool(self.host, backoff=0)
+        for i in range(3):
+            status, data = pool.request("POST", "/b", "x=1")
+            self.assertEqual(status, 200)
+            self.wait_for_hangups(i + 1)
+        pool.close()
+        self.assertEqual(self.server.connections, 3)
+        self.assertEqual(self.server.requests, 3)
+
+    def test_no_retry_once_sent(self):
+        pool = ConnectionPool(self.host, backoff=0)
+        self.assertRaises(httplib.HTTPException, pool.request, "POST", "/hangup/next")
+        self.assertEqual(self.server.requests, 1)
+
+        # sending it again does no harm
+        self.assertRaises(httplib.HTTPException, pool.request, "GET", "/hangup")
+        self.assertEqual(self.server.requests, 4)
+
+    def test_bounded_retries(self):
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        host = "127.0.0.1:%d" % sock.getsockname()[1]
+        sock.close()
+
+        pool = ConnectionPool(host, retries=2, backoff=0)
+        attempts = []
+        connect = pool.connect
+        def counting_connect():
+            attempts.append(1)
+            return connect()
+        pool.connect = counting_connect
+
+        self.assertRaises(socket.error, pool.request, "GET", "/")
+        self.assertEqual(len(attempts), 3)
+
+    def test_station_requests(self):
+        station = Station(object(), 1393494, domain=self.host)
+        station.pool.backoff = 0
+
+        self.assertEqual(station.query_station(u"rock & roll"),
+            [{"path": "/api/1/search/station?query=rock+%26+roll"}])
+        self.assertEqual(station.next()["path"], "/api/1/station/1393494/next")
+        station.vote(1, True)
+        self.assertRaises(httplib.HTTPException, station.request, "GET", "/missing")
+        station.close()
+        self.assertEqual(self.server.connections, 1)
@@ -0,0 +1,116 @@
+import threading, time, unittest, urwid
+
+from daemon import HeadlessScreen
+from prefetch import Prefetcher
+
+
+class StandInFiles:
+    def __init__(self):
+        self.released = []
+
+    def release(self, filename):
+        self.released.append(filename)
+
+
+class StandInStation:
+    def __init__(self):
+        self.files = StandInFiles()
+        self.fetches = 0
+        self.finished = 0
+        self.go = threading.Event()
+        self.error = None
+
+    # blocks until let go, like a slow download
+    def fetch_next(self, progress=None):
+        self.fetches += 1
+        progress(5, 10)
+        self.go.wait()
+        self.go.clear()
+        if self.error is not None:
+            raise self.error
+        progress(10, 10)
+        self.finished += 1
+        return ({"id": self.fetches}, "%d.mp4" % self.fetches)
+
+
+class PrefetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.station = StandInStation()
+        self.results = []
+        self.prefetcher = Prefetcher(self.station, self.on_track)
+        screen = HeadlessScreen()
+        screen.start()
+        self.loop = urwid.MainLoop(urwid.SolidFill(), screen=screen, handle_mouse=False)
+        self.prefetcher.start(self.loop)
+
+    def tearDown(self):
+        self.station.go.set()
+        self.prefetcher.stop()
+
+    def on_track(self, song, filename, error):
+        self.results.append((song, filename, error, threading.current_thread().name))
+
+    # runs the loop until the condition holds, or a while has passed
+    def run_until(self, condition, timeout=2):
+        deadline = time.time() + timeout
+
+        def check():
+            if condition() or time.time() > deadline:
+                raise urwid.ExitMainLoop()
+            self.loop.event_loop.alarm(.01, check)
+
+        self.loop.event_loop.alarm(0, check)
+        self.loop.run()
+        return condition()
+
+    def test_fetched_in_the_background(self):
+        self.prefetcher.request()
+        self.prefetcher.request()
+        self.assertEqual(self.prefetcher.pending, 2)
+
+        # the main loop keeps running while the download is in flight
+        assert self.run_until(lambda: self.prefetcher.progress == (5, 10))
+        self.assertEqual(self.results, [])
+
+        self.station.go.set()
+        assert self.run_until(lambda: len(self.results) == 1)
+        main = threading.current_thread().name
+        self.assertEqual(self.results, [({"id": 1}, "1.mp4", None, main)])
+        self.assertEqual(self.prefetcher.pending, 1)
+
+        self.station.go.set()
+        assert self.run_until(lambda: len(self.results) == 2)
+        self.assertEqual(self.results[1][:2], ({"id": 2}, "2.mp4"))
+        self.assertEqual(self.prefetcher.pending, 0)
+        self.assertEqual(self.prefetcher.progress, None)
+
+    def test_cancelled_fetch_is_dropped(self):
+        self.prefetcher.request()
+        assert self.run_until(lambda: self.station.fetches == 1)
+        self.prefetcher.cancel()
+        self.station.go.set()
+        assert self.run_until(lambda: self.station.files.released)
+        self.assertEqual(self.station.files.released, ["1.mp4"])
+        self.assertEqual(self.results, [])
+        self.assertEqual(self.prefetcher.pending, 0)
+
+    def test_stop_abandons_the_download(self):
+        self.prefetcher.request()
+        self.prefetcher.request()
+        assert self.run_until(lambda: self.prefetcher.progress == (5, 10))
+        thread = self.prefetcher.thread
+        threading.Timer(.05, self.station.go.set).start()
+        self.prefetcher.stop()
+        assert not thread.is_alive()
+        self.assertEqual(self.prefetcher.pipe, None)
+        self.assertEqual((self.station.fetches, self.station.finished), (1, 0))
+
+    def test_errors_handed_back(self):
+        self.station.error = IOError("connection reset")
+        self.prefetcher.request()
+        self.station.go.set()
+        assert self.run_until(lambda: self.results)
+        song, filename, error, thread = self.results[0]
+        self.assertEqual((song, filename), (None, None))
+        self.assertEqual(error, self.station.error)
+        self.assertEqual(self.prefetcher.pending, 0)
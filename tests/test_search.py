@@ -0,0 +1,71 @@
+import threading, time, unittest, urwid
+
+from daemon import HeadlessScreen
+from search import StationSearch
+
+
+class StandInStation:
+    def __init__(self):
+        self.go = threading.Event()
+        self.batches = 0
+
+    # streams two batches of stations, the second one slowly
+    def iter_query_station(self, query, cancelled=None):
+        self.batches += 1
+        yield [{"name": query + " 1"}]
+        self.go.wait()
+        if cancelled is not None and cancelled():
+            return
+        self.batches += 1
+        yield [{"name": query + " 2"}]
+
+
+class StationSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.station = StandInStation()
+        self.results = []
+        self.searcher = StationSearch(self.station, self.on_stations)
+        screen = HeadlessScreen()
+        screen.start()
+        self.loop = urwid.MainLoop(urwid.SolidFill(), screen=screen, handle_mouse=False)
+        self.searcher.start(self.loop)
+
+    def tearDown(self):
+        self.station.go.set()
+        self.searcher.stop()
+
+    def on_stations(self, query, stations, done, error):
+        self.results.append((query, [s["name"] for s in stations], done, error))
+
+    # runs the loop until the condition holds, or a while has passed
+    def run_until(self, condition, timeout=2):
+        deadline = time.time() + timeout
+
+        def check():
+            if condition() or time.time() > deadline:
+                raise urwid.ExitMainLoop()
+            self.loop.event_loop.alarm(.01, check)
+
+        self.loop.event_loop.alarm(0, check)
+        self.loop.run()
+        return condition()
+
+    def test_batches_as_they_arrive(self):
+        self.searcher.search("rock")
+        assert self.run_until(lambda: self.results)
+        self.assertEqual(self.results, [("rock", ["rock 1"], False, None)])
+
+        self.station.go.set()
+        assert self.run_until(lambda: len(self.results) == 3)
+        self.assertEqual(self.results[1:], [("rock", ["rock 2"], False, None), ("rock", [], True, None)])
+        self.assertEqual([s["name"] for s in self.searcher.found], ["rock 1", "rock 2"])
+
+    def test_stop_abandons_the_search(self):
+        self.searcher.search("rock")
+        assert self.run_until(lambda: self.results)
+        thread = self.searcher.thread
+        threading.Timer(.05, self.station.go.set).start()
+        self.searcher.stop()
+        assert not thread.is_alive()
+        self.assertEqual(self.searcher.pipe, None)
+        self.assertEqual(self.station.batches, 1)
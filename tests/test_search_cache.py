@@ -0,0 +1,61 @@
+import os, shutil, tempfile, time, unittest
+
+from search_cache import SearchCache
+
+
+def stations(*names):
+    return [{"id": i, "name": name, "description": "..."} for i, name in enumerate(names)]
+
+
+class SearchCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".search_cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_normalized_hit(self):
+        cache = SearchCache()
+        cache.put("Rock", stations("Rock Workout"))
+        self.assertEqual(cache.get("  rock "), [{"id": 0, "name": "Rock Workout"}])
+        self.assertEqual(cache.get("jazz"), None)
+
+    def test_lru_eviction(self):
+        cache = SearchCache(size=2)
+        cache.put("a", [])
+        cache.put("b", [])
+        cache.get("a")
+        cache.put("c", [])
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), [])
+
+    def test_ttl(self):
+        cache = SearchCache(ttl=60)
+        cache.put("old", [], time.time() - 61)
+        cache.put("new", [], time.time() - 59)
+        self.assertEqual(cache.get("old"), None)
+        self.assertEqual(cache.get("new"), [])
+
+    def test_prefix(self):
+        cache = SearchCache()
+        cache.put("ro", stations("Rock Workout", "Road Trip", "Classic Rock"))
+        self.assertEqual([s["name"] for s in cache.get_prefix("Rock")],
+            ["Rock Workout", "Classic Rock"])
+        self.assertEqual(cache.get_prefix("jazz"), None)
+
+    def test_persistence(self):
+        first = SearchCache(self.path)
+        second = SearchCache(self.path)
+        first.put("rock", stations("Rock Workout"))
+        first.save()
+
+        # picked up by another client without a restart
+        self.assertEqual(second.get("rock"), [{"id": 0, "name": "Rock Workout"}])
+        second.put("jazz", stations("Late Night Jazz"))
+        second.save()
+
+        third = SearchCache(self.path)
+        third.load()
+        self.assertEqual(sorted(third.entries.keys()), ["jazz", "rock"])
+        self.assertEqual(os.listdir(self.dir), [".search_cache"])
@@ -0,0 +1,122 @@
+import json, os, shutil, tempfile, unittest
+
+import state
+from state import StateStore
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".save")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def reopen(self):
+        store = StateStore(self.path)
+        assert store.load()
+        return store
+
+    def test_changes_coalesce_into_one_flush(self):
+        store = StateStore(self.path)
+        for i in range(10):
+            store.set("station_id", i)
+        store.set("station_name", "Rock")
+        store.flush()
+        store.flush()
+        self.assertEqual(len(open(store.journal).readlines()), 2)
+        assert not os.path.exists(self.path)
+        self.assertEqual(self.reopen().data, {"station_id": 9, "station_name": "Rock"})
+
+    def test_unflushed_changes_are_not_written(self):
+        store = StateStore(self.path)
+        store.set("station_id", 1)
+        self.assertEqual(self.reopen().data, {})
+
+    def test_history_is_bounded(self):
+        store = StateStore(self.path)
+        for i in range(5):
+            store.push("history", i, 3)
+        store.flush()
+        self.assertEqual(store.get("history"), [2, 3, 4])
+        self.assertEqual(self.reopen().get("history"), [2, 3, 4])
+
+    def test_compaction(self):
+        store = StateStore(self.path, journal_limit=3)
+        for i in range(4):
+            store.push("history", i)
+            store.flush()
+        self.assertEqual(json.load(open(self.path))["version"], StateStore.version)
+        self.assertEqual(len(open(store.journal).readlines()), 1)
+        self.assertEqual(self.reopen().get("history"), [0, 1, 2, 3])
+
+    def test_crash_between_snapshot_and_journal_truncate(self):
+        store = StateStore(self.path)
+        store.push("history", 1)
+        store.flush()
+        journal = open(store.journal).read()
+        store.close()
+        open(store.journal, "w").write(journal)
+        self.assertEqual(self.reopen().get("history"), [1])
+
+    def test_torn_journal_write(self):
+        store = StateStore(self.path)
+        store.set("a", 1)
+        store.flush()
+        store.set("b", 2)
+        store.flush()
+        data = open(store.journal).read()
+        open(store.journal, "w").write(data[:-5])
+        self.assertEqual(self.reopen().data, {"a": 1})
+
+    def test_old_save_file(self):
+        open(self.path, "w").write(json.dumps({"station_id": 5, "station_name": "Jazz"}))
+        self.assertEqual(self.reopen().get("station_id"), 5)
+
+    def test_unreadable_snapshot(self):
+        open(self.path, "w").write("{not json")
+        store = StateStore(self.path)
+        assert not store.load()
+        self.assertEqual(store.data, {})
+
+    def test_unknown_snapshot_version(self):
+        open(self.path, "w").write(json.dumps({"version": 2, "seq": 3, "state": {"station_id": 5}}))
+        open(self.path + ".journal", "w").write('{"op":"set","key":"station_id","value":6,"seq":4}\n')
+        store = StateStore(self.path)
+        assert not store.load()
+        self.assertEqual(store.data, {})
+        self.assertEqual(os.path.getsize(store.journal), 0)
+
+    def test_partial_writes_and_sync(self):
+        calls = []
+        write, fsync = os.write, os.fsync
+        def partial_write(fd, data):
+            calls.append("write")
+            return write(fd, data[:7])
+        def counting_fsync(fd):
+            calls.append("fsync")
+            fsync(fd)
+        state.os.write, state.os.fsync = partial_write, counting_fsync
+        try:
+            store = StateStore(self.path)
+            store.set("station_name", "Classic Rock Road Trip")
+            store.flush()
+        finally:
+            state.os.write, state.os.fsync = write, fsync
+        self.assertEqual(calls[-1], "fsync")
+        assert calls.count("write") > 1
+        self.assertEqual(self.reopen().get("station_name"), "Classic Rock Road Trip")
+
+    def test_torn_journal_line_is_cut_off(self):
+        store = StateStore(self.path)
+        store.push("history", 1)
+        store.flush()
+        with open(store.journal, "a") as file:
+            file.write('{"op":"push","key":"hist')
+
+        store = self.reopen()
+        store.push("history", 2)
+        store.flush()
+        store.push("history", 3)
+        store.flush()
+        self.assertEqual(self.reopen().get("history"), [1, 2, 3])
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import json, os, shutil, tempfile, unittest, urllib
+
+from metrics import metrics
+from station import JsonArrayParser, Station
+
+
+class JsonArrayParserTest(unittest.TestCase):
+    def test_pieces(self):
+        data = json.dumps([{"name": "a ] b", "id": 1}, {"name": u"\xe9"}, 12345, "s", [4]])
+        for size in (1, 2, 3, 7, len(data)):
+            parser = JsonArrayParser()
+            items = []
+            for i in range(0, len(data), size):
+                items += parser.feed(data[i:i + size])
+            self.assertEqual(items, json.loads(data), "piece size %d" % size)
+            assert parser.done
+
+    def test_items_as_they_complete(self):
+        parser = JsonArrayParser()
+        self.assertEqual(parser.feed('[{"id": 1}, {"id"'), [{"id": 1}])
+        self.assertEqual(parser.feed(': 2}'), [{"id": 2}])
+        assert not parser.done
+        self.assertEqual(parser.feed(']'), [])
+        assert parser.done
+
+    def test_not_an_array(self):
+        self.assertRaises(ValueError, JsonArrayParser().feed, '{"id": 1}')
+
+
+class DownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.station = Station(object())
+        self.station.chunk_size = 4
+
+    def tearDown(self):
+        self.station.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def url(self, data):
+        with open("source", "wb") as source:
+            source.write(data)
+        return "file:" + urllib.pathname2url(os.path.abspath("source"))
+
+    def test_streamed_in_chunks(self):
+        data = "\x00\xff\r\n" * 2 + "ab"
+        url = self.url(data)
+        downloaded = metrics.counters.get("station.download.bytes", 0)
+
+        progress = []
+        read = self.station.download(url, "track", lambda r, t: progress.append((r, t)))
+        self.assertEqual(read, 10)
+        self.assertEqual(progress, [(4, 10), (8, 10), (10, 10)])
+        with open("track", "rb") as track:
+            self.assertEqual(track.read(), data)
+        self.assertEqual(metrics.counters["station.download.bytes"], downloaded + 10)
+
+    def test_empty(self):
+        progress = []
+        self.assertEqual(self.station.download(self.url(""), "track", progress.append), 0)
+        self.assertEqual(progress, [])
+        self.assertEqual(os.path.getsize("track"), 0)
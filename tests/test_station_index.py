@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import os, shutil, tempfile, unittest
+
+from station_index import StationIndex
+
+
+STATIONS = [
+    {"id": 1, "name": "Classic Rock Road Trip"},
+    {"id": 2, "name": "Rock Workout"},
+    {"id": 3, "name": "Indie Rock Essentials"},
+    {"id": 4, "name": "Rockabilly"},
+    {"id": 5, "name": "Late Night Jazz"},
+    {"id": 6, "name": u"Caf\xe9 Jazz"},
+]
+
+
+class StationIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = StationIndex()
+        self.index.add(STATIONS)
+
+    def names(self, query, limit=10):
+        return [s["name"] for s in self.index.suggest(query, limit)]
+
+    def test_ranking(self):
+        # names starting with the query first, then shorter names
+        self.assertEqual(self.names("rock"), ["Rockabilly", "Rock Workout",
+            "Indie Rock Essentials", "Classic Rock Road Trip"])
+        self.assertEqual(self.names("ROCK", 2), ["Rockabilly", "Rock Workout"])
+
+    def test_word_prefixes(self):
+        self.assertEqual(self.names("road rock"), ["Classic Rock Road Trip"])
+        self.assertEqual(self.names("jazz"), [u"Caf\xe9 Jazz", "Late Night Jazz"])
+        self.assertEqual(self.names(u"caf\xe9"), [u"Caf\xe9 Jazz"])
+        self.assertEqual(self.names("essentials"), ["Indie Rock Essentials"])
+        self.assertEqual(self.names("ock"), [])
+        self.assertEqual(self.names(" "), [])
+
+    def test_add_after_lookup(self):
+        self.names("rock")
+        self.index.add([{"id": 7, "name": "Rock"}, {"id": 2, "name": "Duplicate"}])
+        self.assertEqual(self.names("rock", 2), ["Rock", "Rockabilly"])
+
+    def test_persistence(self):
+        dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(dir, ".station_index")
+            self.index.path = path
+            self.index.save()
+
+            index = StationIndex(path)
+            index.add([{"id": 8, "name": "Folk Mornings"}])
+            index.save()
+
+            index = StationIndex(path)
+            index.load()
+            self.assertEqual(len(index.stations), 7)
+            self.assertEqual(index.suggest("folk"), [{"id": 8, "name": "Folk Mornings"}])
+        finally:
+            shutil.rmtree(dir)
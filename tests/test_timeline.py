@@ -0,0 +1,78 @@
+import unittest
+
+from metrics import metrics
+from timeline import Timeline, monotonic
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TimelineTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.timeline = Timeline(self.clock)
+
+    # reports whole seconds of a track started at `start`, like the players do
+    def report(self, start, length=180):
+        position = int(self.clock.now - start)
+        return self.timeline.sample(position, length - position)
+
+    def test_monotonic(self):
+        assert monotonic() <= monotonic()
+
+    def test_unknown_until_reported(self):
+        self.assertEqual(self.timeline.remaining(), None)
+        self.timeline.sample(0, -1)
+        self.assertEqual(self.timeline.remaining(), None)
+
+    def test_reports_narrow_the_end_down(self):
+        start = 1000.0 - 10.37
+        for step in (0, .5, .25, .2, .6):
+            self.clock.now += step
+            self.report(start)
+        self.assertAlmostEqual(self.timeline.end(), start + 180, delta=.1)
+        self.clock.now = start + 179
+        self.assertAlmostEqual(self.timeline.remaining(), 1, delta=.1)
+
+    def test_seek_starts_over(self):
+        self.report(900)
+        self.clock.now += 1
+        self.report(880)
+        self.assertAlmostEqual(self.timeline.position(), 121, delta=.5)
+
+    def test_next_track_and_gap(self):
+        start = 1000.0 - 179.5
+        self.report(start)
+        self.clock.now += .3
+        self.report(start)
+        end = self.timeline.end()
+
+        # switched a little early; the player is still on the last track
+        self.timeline.begin(end)
+        self.clock.now = end - .05
+        self.report(start)
+        self.assertEqual(self.timeline.remaining(), None)
+
+        # the next track started .2 seconds late
+        gaps = metrics.histograms.get("player.gap")
+        recorded = gaps.count if gaps else 0
+        for step in (.3, 1.19, 1.21):
+            self.clock.now = end + step
+            self.report(end + .2, 200)
+        self.assertAlmostEqual(self.timeline.gaps[0], .2, delta=.1)
+        self.assertEqual(metrics.histograms["player.gap"].count, recorded + 1)
+        self.assertAlmostEqual(self.timeline.remaining(), 199, delta=.1)
+
+    def test_player_moved_on_first(self):
+        start = 1000.0 - 178
+        self.report(start)
+        self.clock.now = start + 180.5
+        assert not self.report(start + 180, 200)
+        self.timeline.begin(self.timeline.end())
+        assert self.report(start + 180, 200)
+        self.assertAlmostEqual(self.timeline.remaining(), 199.5, delta=.5)
@@ -0,0 +1,131 @@
+import os, shutil, tempfile, unittest
+
+from fake_player import FakePlayer, SimulatedClock
+from station import Station
+from tracks import TrackFiles
+
+
+class TrackFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.files = TrackFiles(os.path.join(self.dir, "tracks"), max_bytes=10, max_entries=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def store(self, song_id, data="audio"):
+        filename, complete = self.files.acquire({"id": song_id})
+        if not complete:
+            self.files.store(filename, lambda temp: open(temp, "wb").write(data))
+        return filename, complete
+
+    def test_content_addressed(self):
+        first, complete = self.store(1)
+        assert not complete
+        second, complete = self.store(1, "other")
+        assert complete
+        self.assertEqual(first, second)
+        self.assertEqual(open(first, "rb").read(), "audio")
+        self.assertNotEqual(self.store(2)[0], first)
+
+    def test_lru_eviction(self):
+        self.files.max_bytes = 100
+        files = [self.store(i)[0] for i in range(3)]
+        for filename in files:
+            self.files.release(filename)
+        self.files.touch(files[0])
+        self.store(3)
+        self.assertEqual([os.path.exists(f) for f in files], [True, False, True])
+
+    def test_byte_limit(self):
+        first = self.store(1)[0]
+        self.files.release(first)
+        self.store(2, "x" * 6)
+        assert not os.path.exists(first)
+        self.assertEqual(self.files.size, 6)
+
+    def test_held_files_not_evicted(self):
+        self.files.max_bytes = 100
+        files = [self.store(i)[0] for i in range(5)]
+        assert all(os.path.exists(f) for f in files)
+        for filename in files:
+            self.files.release(filename)
+        self.assertEqual(len(self.files.entries), 3)
+        self.assertEqual(self.files.entries.keys(), files[2:])
+
+    def test_failed_download_leaves_nothing(self):
+        filename, complete = self.files.acquire({"id": 1})
+
+        def write(temp):
+            open(temp, "wb").write("partial")
+            raise IOError("connection reset")
+
+        self.assertRaises(IOError, self.files.store, filename, write)
+        self.files.release(filename)
+        self.assertEqual(os.listdir(self.files.path), [])
+
+    def test_load(self):
+        for i in range(2):
+            self.files.release(self.store(i)[0])
+        os.utime(self.files.filename({"id": 0}), (2e9, 2e9))
+        open(self.files.filename({"id": 2}) + ".123.part", "wb").close()
+
+        files = TrackFiles(self.files.path, max_bytes=10, max_entries=3)
+        files.load()
+        self.assertEqual(files.entries.keys(), [files.filename({"id": i}) for i in (1, 0)])
+        self.assertEqual(files.size, 10)
+        self.assertEqual(len(os.listdir(files.path)), 2)
+        self.assertEqual(files.acquire({"id": 1}), (files.filename({"id": 1}), True))
+
+    def test_load_index(self):
+        for i in range(3):
+            self.files.release(self.store(i, "a")[0])
+        self.files.touch(self.files.filename({"id": 0}))
+        index = self.files.index()
+        self.assertEqual([name for name, size in index], ["1.mp4", "2.mp4", "0.mp4"])
+
+        os.remove(self.files.filename({"id": 1}))
+        files = TrackFiles(self.files.path)
+        files.load(index)
+        self.assertEqual(files.index(), index[1:])
+
+
+class StationQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+        self.player = FakePlayer(SimulatedClock())
+        self.station = Station(self.player)
+        self.station.files.max_entries = 2
+
+    def tearDown(self):
+        self.station.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def buffer(self, song_id):
+        song = {"id": song_id}
+        filename = self.station.files.acquire(song)[0]
+        self.station.files.store(filename, lambda temp: open(temp, "wb").close())
+        self.station.buffer_track(song, filename)
+        return filename
+
+    def test_files_released_as_tracks_move_on(self):
+        files = [self.buffer(i) for i in range(4)]
+        for i in range(4):
+            assert self.station.queue_next()
+            self.station.update_track_info()
+            self.assertEqual(self.station.current_track, {"id": i})
+        assert not self.station.queue_next()
+
+        # only the previous and current tracks are held, so the rest are evicted
+        self.assertEqual([os.path.exists(f) for f in files], [False, False, True, True])
+
+    def test_requeue_from_cache(self):
+        self.buffer(1)
+        self.station.queue_next()
+        self.station.update_track_info()
+        assert self.station.requeue(self.station.current_track)
+        assert not self.station.requeue({"id": 2})
+        self.assertEqual([song for song, filename in self.station.upcoming], [{"id": 1}])
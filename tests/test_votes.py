@@ -0,0 +1,123 @@
+import os, shutil, tempfile, threading, time, unittest
+
+from state import StateStore
+from votes import VoteQueue
+
+
+class StandInStation:
+    def __init__(self, failures=0):
+        self.station_id = 7
+        self.failures = failures
+        self.sent = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def vote(self, song_id, up, station_id):
+        self.gate.wait()
+        if self.failures:
+            self.failures -= 1
+            raise IOError("connection refused")
+        self.sent.append((station_id, song_id, up))
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(.01)
+    return condition()
+
+
+class VoteQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, ".votes")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_coalesces_votes_on_the_same_song(self):
+        station = StandInStation()
+        station.gate.clear()
+        votes = VoteQueue(station)
+        votes.start()
+        votes.vote(1, True)
+        assert wait_for(lambda: not station.gate.is_set() and votes.pending)
+        votes.vote(2, True)
+        votes.vote(2, False)
+        votes.vote(2, True)
+        station.gate.set()
+        assert wait_for(lambda: not votes.pending)
+        votes.stop()
+        self.assertEqual(station.sent, [(7, 1, True), (7, 2, True)])
+
+    def test_retries_with_backoff(self):
+        station = StandInStation(failures=2)
+        votes = VoteQueue(station, backoff=.01)
+        votes.start()
+        votes.vote(1, False)
+        assert wait_for(lambda: not votes.pending)
+        votes.stop()
+        self.assertEqual(station.sent, [(7, 1, False)])
+
+    def test_gives_up(self):
+        station = StandInStation(failures=10)
+        votes = VoteQueue(station, attempts=3, backoff=.01)
+        votes.start()
+        votes.vote(1, False)
+        assert wait_for(lambda: not votes.pending)
+        votes.stop()
+        self.assertEqual((station.sent, station.failures), ([], 7))
+
+    def test_pending_votes_survive_restart(self):
+        station = StandInStation()
+        store = StateStore(self.path)
+        votes = VoteQueue(station, store)
+        votes.vote(1, True)
+        votes.vote(2, False)
+        votes.stop()
+        store.close()
+
+        station.station_id = 8
+        store = StateStore(self.path)
+        store.load()
+        votes = VoteQueue(station, store)
+        votes.load()
+        votes.start()
+        assert wait_for(lambda: len(station.sent) == 2)
+        votes.stop()
+        self.assertEqual(station.sent, [(7, 1, True), (7, 2, False)])
+
+    def test_stop_waits_for_the_vote_being_sent(self):
+        station = StandInStation()
+        station.gate.clear()
+        store = StateStore(self.path)
+        votes = VoteQueue(station, store)
+        votes.start()
+        votes.vote(1, True)
+        assert wait_for(lambda: votes.sending)
+        threading.Timer(.05, station.gate.set).start()
+        votes.stop()
+        self.assertEqual(station.sent, [(7, 1, True)])
+        self.assertEqual(store.get("votes"), [])
+
+    def test_vote_in_flight_not_saved(self):
+        station = StandInStation()
+        station.gate.clear()
+        store = StateStore(self.path)
+        votes = VoteQueue(station, store, timeout=.05)
+        votes.start()
+        votes.vote(1, True)
+        assert wait_for(lambda: votes.sending)
+        votes.vote(2, False)
+        thread = votes.thread
+        votes.stop()
+        self.assertEqual(store.get("votes"), [[7, 2, False]])
+
+        # the worker finishes without touching the store again
+        saves = []
+        store.set = lambda key, value: saves.append(value)
+        station.gate.set()
+        thread.join(5)
+        assert not thread.is_alive()
+        self.assertEqual(station.sent, [(7, 1, True)])
+        self.assertEqual(saves, [])
@@ -0,0 +1,181 @@
+import collections, ctypes, ctypes.util, sys, time
+
+# monotonic()
+# ===========
+# Seconds on a clock that only moves forward, unaffected by changes to the
+# system time; falls back to `time.time()` where there is no such clock.
+class timespec(ctypes.Structure):
+	_fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+CLOCK_MONOTONIC = {"linux2": 1, "linux": 1, "darwin": 6}.get(sys.platform)
+
+try:
+	clock_gettime = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).clock_gettime
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+except (OSError, AttributeError, TypeError):
+	clock_gettime = None
+
+def monotonic():
+	if clock_gettime is None or CLOCK_MONOTONIC is None:
+		return time.time()
+
+	t = timespec()
+	if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+		return time.time()
+
+	return t.tv_sec + t.tv_nsec * 1e-9
+
+# Timeline
+# ========
+# Predicts where playback is in the current track, and when it ends, more
+# precisely than the players report it. Players only report whole seconds, so
+# every report only says the track started somewhere within a second; each
+# report narrows that window down further, and between reports the position is
+# worked out from the clock. A report outside the window means the player
+# skipped or stalled, and starts a new window.
+#
+# It also measures the gap between the end of one track and the start of the
+# next, as a listener hears it.
+class Timeline:
+	# constructor
+	# * clock: function returning the current time in seconds of playback
+	# * resolution: seconds between the positions the player can report
+	# * slack: seconds a report may be off before it is taken as a new track
+	# * jitter: seconds a report may be off before it is taken as a skip or stall
+	def __init__(self, clock=monotonic, resolution=1, slack=1, jitter=.05):
+		self.clock = clock
+		self.resolution = resolution
+		self.slack = slack
+		self.jitter = jitter
+
+		# earliest & latest
+		# =================
+		# Bounds on the clock time the current track started, or None if unknown
+		self.earliest = None
+		self.latest = None
+
+		# length
+		# ======
+		# Length of the current track, as last reported
+		self.length = None
+
+		# began_at
+		# ========
+		# Clock time the current track was expected to begin, until a report for it comes in;
+		# reports that must still be about the previous track are ignored until then
+		self.began_at = None
+
+		# ended_at
+		# ========
+		# Clock time the previous track ended, until the gap after it has been measured
+		self.ended_at = None
+
+		# gaps
+		# ====
+		# Seconds of silence between recent tracks
+		self.gaps = collections.deque(maxlen=100)
+
+	# reset()
+	# =======
+	# Forgets where playback is, e.g. after pausing or seeking.
+	def reset(self):
+		self.measure_gap()
+		self.earliest = self.latest = None
+
+	# begin(ended_at)
+	# ===============
+	# Moves on to the next track.
+	# * ended_at: clock time the previous track ended, to measure the gap after it;
+	#   None if it was cut short (e.g. skipped)
+	def begin(self, ended_at=None):
+		self.reset()
+		self.ended_at = ended_at
+		self.began_at = ended_at if ended_at is not None else self.clock()
+
+	# sample(position, remaining)
+	# ===========================
+	# Takes in a position report from the player. Returns False if the player has
+	# evidently moved on to a new track, in which case the report is not used;
+	# call `begin()` and report it again.
+	def sample(self, position, remaining):
+		if remaining < 0:
+			return True
+
+		now = self.clock()
+
+		# still the previous track; it is longer in than the current one can be
+		if self.began_at is not None and position > now - self.began_at + self.resolution + self.slack:
+			return True
+
+		earliest, latest = now - position - self.resolution, now - position
+
+		if self.earliest is not None:
+			# went back to about the start, right as the track was due to end
+			if earliest > self.latest + self.slack and position <= max(now - self.end(), 0) + self.resolution + self.slack:
+				return False
+
+			# narrow the window down, allowing for a little jitter in the reports
+			if earliest <= self.latest + self.jitter and latest >= self.earliest - self.jitter:
+				earliest = max(earliest, self.earliest)
+				latest = min(latest, self.latest)
+				if earliest > latest:
+					earliest = latest = (earliest + latest) / 2
+
+		self.earliest, self.latest = earliest, latest
+		self.length = position + remaining
+		self.began_at = None
+
+		# once the start is known well enough, so is the gap before it
+		if self.latest - self.earliest <= .1:
+			self.measure_gap()
+
+		return True
+
+	# measure_gap()
+	# =============
+	# Records the gap between the previous track's end and this one's start, if pending.
+	def measure_gap(self):
+		if self.ended_at is not None and self.earliest is not None:
+			# here, as metrics needs monotonic() from this module
+			from metrics import metrics
+
+			gap = max(self.start() - self.ended_at, 0)
+			self.gaps.append(gap)
+			metrics.record("player.gap", gap)
+			self.ended_at = None
+
+	# start()
+	# =======
+	# Best guess of the clock time the current track started, or None if unknown.
+	def start(self):
+		if self.earliest is None:
+			return None
+
+		return (self.earliest + self.latest) / 2
+
+	# position()
+	# ==========
+	# Seconds into the current track, or None if unknown.
+	def position(self):
+		if self.earliest is None:
+			return None
+
+		return self.clock() - self.start()
+
+	# end()
+	# =====
+	# Clock time the current track will end, or None if unknown.
+	def end(self):
+		if self.earliest is None:
+			return None
+
+		return self.start() + self.length
+
+	# remaining()
+	# ===========
+	# Seconds left in the current track, or None if unknown.
+	def remaining(self):
+		if self.earliest is None:
+			return None
+
+		return self.end() - self.clock()
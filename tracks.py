@@ -0,0 +1,175 @@
+import collections, os, threading
+
+# TrackFiles
+# ==========
+# A cache of downloaded track audio on disk, one file per song, named after the
+# song id. A file is never rewritten once complete, so the player can keep
+# reading it while later tracks download, and a song heard before doesn't need
+# downloading again.
+#
+# Every holder of a file (the lookahead queue, the player's next/current/previous
+# track) takes a reference to it. Files nothing holds stay cached until the cache
+# grows past `max_bytes` or `max_entries`, then the least recently used go first.
+# The order is saved with the app state (see `index()`), so it survives restarts.
+# Safe to share between the UI thread and the prefetch thread.
+class TrackFiles:
+	# constructor
+	# * path: directory the track files are kept in
+	# * max_bytes: size the cache is trimmed down to
+	# * max_entries: number of files the cache is trimmed down to
+	def __init__(self, path="./.tracks", max_bytes=256 * 1024 * 1024, max_entries=100):
+		self.path = path
+		self.max_bytes = max_bytes
+		self.max_entries = max_entries
+
+		# entries
+		# =======
+		# filename => size of every complete file, least recently used first
+		self.entries = collections.OrderedDict()
+
+		# size
+		# ====
+		# Total size of the entries, in bytes
+		self.size = 0
+
+		# refs
+		# ====
+		# filename => number of holders
+		self.refs = {}
+		self.lock = threading.Lock()
+
+	# filename(song)
+	# ==============
+	# Returns the file the song's audio is kept in.
+	def filename(self, song):
+		return os.path.join(self.path, "{0}.mp4".format(song["id"]))
+
+	# load(index)
+	# ===========
+	# Picks up the files cached by earlier runs, and deletes any left half written by a crash.
+	# * index: the result of `index()` from an earlier run, if saved
+	def load(self, index=None):
+		if not os.path.isdir(self.path):
+			return
+
+		with self.lock:
+			found = {}
+			for name in os.listdir(self.path):
+				filename = os.path.join(self.path, name)
+				try:
+					if not name.endswith(".mp4"):
+						os.remove(filename)
+					elif filename not in self.entries:
+						found[name] = filename
+				except OSError:
+					pass
+
+			# files in the index keep their order; any others were added since it was
+			# saved, so they come after it, in the order they were written
+			for name, size in index or []:
+				filename = found.pop(name, None)
+				if filename is not None:
+					self.add(filename, size)
+
+			for mtime, filename in sorted((os.path.getmtime(f), f) for f in found.values()):
+				self.add(filename, os.path.getsize(filename))
+
+			self.evict()
+
+	# index()
+	# =======
+	# Returns the cached files as [name, size] pairs, least recently used first.
+	def index(self):
+		with self.lock:
+			return [[os.path.basename(filename), size] for filename, size in self.entries.items()]
+
+	# acquire(song)
+	# =============
+	# Takes a reference to the song's file, and returns a tuple of the filename and
+	# whether the file is already complete on disk. If it isn't, the caller should
+	# download it with `store()`, or give the reference back with `release()`.
+	def acquire(self, song):
+		filename = self.filename(song)
+
+		with self.lock:
+			self.refs[filename] = self.refs.get(filename, 0) + 1
+			complete = filename in self.entries
+			if complete:
+				self.use(filename)
+
+			return (filename, complete)
+
+	# touch(filename)
+	# ===============
+	# Marks the file as most recently used, so it is kept the longest.
+	def touch(self, filename):
+		with self.lock:
+			if filename in self.entries:
+				self.use(filename)
+
+	# store(filename, write)
+	# ======================
+	# Creates a track file by calling write(temp_filename), then moving the
+	# result into place; the file appears complete or not at all.
+	def store(self, filename, write):
+		if not os.path.isdir(self.path):
+			os.makedirs(self.path)
+
+		temp = "{0}.{1}.part".format(filename, os.getpid())
+		try:
+			write(temp)
+			os.rename(temp, filename)
+		finally:
+			if os.path.exists(temp):
+				os.remove(temp)
+
+		with self.lock:
+			self.add(filename, os.path.getsize(filename))
+			self.evict()
+
+	# release(filename)
+	# =================
+	# Drops a reference to the file; it stays cached until evicted.
+	def release(self, filename):
+		if not filename:
+			return
+
+		with self.lock:
+			count = self.refs.get(filename, 0) - 1
+			if count > 0:
+				self.refs[filename] = count
+			else:
+				self.refs.pop(filename, None)
+				self.evict()
+
+	# add(filename, size)
+	# ===================
+	# Adds a complete file to the entries, as the most recently used; call with the lock held.
+	def add(self, filename, size):
+		self.size -= self.entries.pop(filename, 0)
+		self.entries[filename] = size
+		self.size += size
+
+	# use(filename)
+	# ============
+	# Moves an entry to the most recently used end; call with the lock held.
+	def use(self, filename):
+		self.entries[filename] = self.entries.pop(filename)
+
+	# evict()
+	# =======
+	# Deletes the least recently used files nothing holds, until the cache is
+	# within its limits; call with the lock held.
+	def evict(self):
+		for filename in self.entries.keys():
+			if self.size <= self.max_bytes and len(self.entries) <= self.max_entries:
+				return
+
+			if filename in self.refs:
+				continue
+
+			self.size -= self.entries.pop(filename)
+			try:
+				os.remove(filename)
+			except OSError:
+				pass
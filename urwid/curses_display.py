@@ -27,9 +27,10 @@ import curses
 import _curses
 
 from urwid import escape
+from urwid import signals
 
 from urwid.display_common import BaseScreen, RealTerminal, AttrSpec, \
-    UNPRINTABLE_TRANS_TABLE
+    AttrMemo, UPDATE_PALETTE_ENTRY, UNPRINTABLE_TRANS_TABLE
 from urwid.compat import bytes, PYTHON3
 
 KEY_RESIZE = 410 # curses.KEY_RESIZE (sometimes not defined)
@@ -70,9 +71,15 @@ class Screen(BaseScreen, RealTerminal):
         self.prev_input_resize = 0
         self.set_input_timeouts()
         self.last_bstate = 0
+        self._curses_attr = AttrMemo(self._attr_to_curses)
+        signals.connect_signal(self, UPDATE_PALETTE_ENTRY,
+            self._on_update_palette_entry)
 
         self.register_palette_entry(None, 'default','default')
 
+    def _on_update_palette_entry(self, name, *attrspecs):
+        self._curses_attr.clear()
+
     def set_mouse_tracking(self):
         """
         Enable mouse tracking.
@@ -108,6 +115,8 @@ class Screen(BaseScreen, RealTerminal):
             except _curses.error:
                 self.has_default_colors=False
         self._setup_colour_pairs()
+        # colour pairs are only known now
+        self._curses_attr.clear()
         curses.noecho()
         curses.meta(1)
         curses.halfdelay(10) # use set_input_timeouts to adjust
@@ -431,9 +440,15 @@ class Screen(BaseScreen, RealTerminal):
         
 
     def _setattr(self, a):
+        self.s.attrset(self._curses_attr[a])
+
+    def _attr_to_curses(self, a):
+        """
+        Return the curses attribute for a palette entry name or AttrSpec.
+        Called through the self._curses_attr memo.
+        """
         if a is None:
-            self.s.attrset(0)
-            return
+            return 0
         elif not isinstance(a, AttrSpec):
             p = self._palette.get(a, (AttrSpec('default', 'default'),))
             a = p[0]
@@ -465,7 +480,7 @@ class Screen(BaseScreen, RealTerminal):
         if a.blink:
             attr |= curses.A_BLINK
 
-        self.s.attrset(attr)
+        return attr
 
     def draw_screen(self, (cols, rows), r ):
         """Paint screen with rendered canvas."""
@@ -643,6 +643,56 @@ class AttrSpec(object):
             return vals + _COLOR_VALUES_256[self.background_number]
 
 
+class AttrMemo(object):
+    """
+    Bounded memo of what display attributes translate to on a screen,
+    eg. the escape sequence that selects them.  Attributes are palette
+    entry names or AttrSpec instances; AttrSpecs are looked up by value,
+    so equal specs share an entry.  Once full the memo starts over.
+
+    Screens must clear() the memo whenever a translation would change,
+    eg. when a palette entry is updated.
+
+    >>> calls = []
+    >>> memo = AttrMemo(lambda a: calls.append(a) or len(calls), size=2)
+    >>> memo['bold'], memo[AttrSpec('yellow', 'dark blue')]
+    (1, 2)
+    >>> memo['bold'], memo[AttrSpec('yellow', 'dark blue')]
+    (1, 2)
+    >>> memo[AttrSpec('yellow', 'black')], memo['bold']
+    (3, 4)
+    >>> memo.clear()
+    >>> memo['bold']
+    5
+    """
+    def __init__(self, translate, size=256):
+        """
+        translate -- function returning the translation of an attribute
+        size -- number of translations to keep
+        """
+        self._translate = translate
+        self._size = size
+        self._memo = {}
+
+    def __getitem__(self, a):
+        if isinstance(a, AttrSpec):
+            key = (AttrSpec, a._value)
+        else:
+            key = a
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        if len(self._memo) >= self._size:
+            self._memo.clear()
+        value = self._memo[key] = self._translate(a)
+        return value
+
+    def clear(self):
+        """Forget every translation."""
+        self._memo.clear()
+
+
 
 class RealTerminal(object):
     def __init__(self):
@@ -417,6 +417,11 @@ def move_cursor_down(x):
 HIDE_CURSOR = ESC+"[?25l"
 SHOW_CURSOR = ESC+"[?25h"
 
+# terminals that support it hold off showing what is written between these
+# until the end, so a frame never appears half drawn
+SYNCHRONIZED_UPDATE_BEGIN = ESC+"[?2026h"
+SYNCHRONIZED_UPDATE_END = ESC+"[?2026l"
+
 MOUSE_TRACKING_ON = ESC+"[?1000h"+ESC+"[?1002h"
 MOUSE_TRACKING_OFF = ESC+"[?1002l"+ESC+"[?1000l"
 
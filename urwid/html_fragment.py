@@ -24,8 +24,10 @@ HTML PRE-based UI implementation
 """
 
 from urwid import util
+from urwid import signals
 from urwid.main_loop import ExitMainLoop
-from urwid.display_common import AttrSpec, BaseScreen
+from urwid.display_common import AttrSpec, AttrMemo, BaseScreen, \
+    UPDATE_PALETTE_ENTRY
 
 
 # replace control characters with ?'s
@@ -49,6 +51,9 @@ class HtmlGenerator(BaseScreen):
         self.colors = 16
         self.bright_is_bold = False # ignored
         self.has_underline = True # ignored
+        self._html_style = AttrMemo(self._attr_to_style)
+        signals.connect_signal(self, UPDATE_PALETTE_ENTRY,
+            self._on_update_palette_entry)
         self.register_palette_entry(None, 
             _default_foreground, _default_background)
 
@@ -65,6 +70,20 @@ class HtmlGenerator(BaseScreen):
         self.colors = colors
         self.bright_is_bold = bright_is_bold
         self.has_underline = has_underline
+        self._html_style.clear()
+
+    def _on_update_palette_entry(self, name, *attrspecs):
+        self._html_style.clear()
+
+    def _attr_to_style(self, a):
+        """
+        Return the html_style() of a palette entry name or AttrSpec.
+        Called through the self._html_style memo.
+        """
+        if isinstance(a, AttrSpec):
+            return html_style(a)
+        return html_style(self._palette[a][
+            {1: 1, 16: 0, 88:2, 256:3}[self.colors]])
 
     def set_mouse_tracking(self):
         """Not yet implemented"""
@@ -107,23 +126,19 @@ class HtmlGenerator(BaseScreen):
             
             for a, cs, run in row:
                 run = run.translate(_trans_table)
-                if isinstance(a, AttrSpec):
-                    aspec = a
-                else:
-                    aspec = self._palette[a][
-                        {1: 1, 16: 0, 88:2, 256:3}[self.colors]]
+                style = self._html_style[a]
 
                 if y == cy and col <= cx:
                     run_width = util.calc_width(run, 0,
                         len(run))
                     if col+run_width > cx:
-                        l.append(html_span(run,
-                            aspec, cx-col))
+                        l.append(_html_span(run,
+                            style, cx-col))
                     else:
-                        l.append(html_span(run, aspec))
+                        l.append(_html_span(run, style))
                     col += run_width
                 else:
-                    l.append(html_span(run, aspec))
+                    l.append(_html_span(run, style))
 
             l.append("\n")
                         
@@ -157,7 +172,14 @@ _default_aspec = AttrSpec(_default_foreground, _default_background)
 (_d_fg_r, _d_fg_g, _d_fg_b, _d_bg_r, _d_bg_g, _d_bg_b) = (
     _default_aspec.get_rgb_values())
 
-def html_span(s, aspec, cursor = -1):
+def html_style(aspec):
+    """
+    Return the (foreground, background, extra CSS) used to show text with
+    an AttrSpec.
+
+    >>> html_style(AttrSpec('yellow,bold', 'dark blue'))
+    ('#ffff00', '#0000ee', ';font-weight:bold')
+    """
     fg_r, fg_g, fg_b, bg_r, bg_g, bg_b = aspec.get_rgb_values()
     # use real colours instead of default fg/bg
     if fg_r is None:
@@ -170,6 +192,13 @@ def html_span(s, aspec, cursor = -1):
         html_fg, html_bg = html_bg, html_fg
     extra = (";text-decoration:underline" * aspec.underline +
         ";font-weight:bold" * aspec.bold)
+    return html_fg, html_bg, extra
+
+def html_span(s, aspec, cursor = -1):
+    return _html_span(s, html_style(aspec), cursor)
+
+def _html_span(s, style, cursor = -1):
+    html_fg, html_bg, extra = style
     def html_span(fg, bg, s):
         if not s: return ""
         return ('<span style="color:%s;'
@@ -27,6 +27,9 @@ import heapq
 import select
 import fcntl
 import os
+import sys
+import errno
+import math
 
 from urwid.util import is_mouse_event
 from urwid.compat import PYTHON3
@@ -72,7 +75,9 @@ class MainLoop(object):
     :type unhandled_input: callable
 
     :param event_loop: if :attr:`.screen` supports external an event loop it may be
-                       given here, default is a new :class:`SelectEventLoop` instance;
+                       given here, default is a new :class:`PollEventLoop` instance
+                       where the platform has a usable poller, or a new
+                       :class:`SelectEventLoop` instance otherwise;
                        stored as :attr:`.event_loop`
     :type event_loop: event loop instance
 
@@ -115,7 +120,10 @@ class MainLoop(object):
             raise NotImplementedError("screen object passed "
                 "%r does not support external event loops" % (screen,))
         if event_loop is None:
-            event_loop = SelectEventLoop()
+            if PollEventLoop.supported():
+                event_loop = PollEventLoop()
+            else:
+                event_loop = SelectEventLoop()
         self.event_loop = event_loop
 
         self._input_timeout = None
@@ -706,8 +714,8 @@ class SelectEventLoop(object):
             while True:
                 try:
                     self._loop()
-                except select.error, e:
-                    if e.args[0] != 4:
+                except (select.error, IOError), e:
+                    if e.args[0] != errno.EINTR:
                         # not just something we need to retry
                         raise
         except ExitMainLoop:
@@ -759,7 +767,6 @@ class SelectEventLoop(object):
         """
         A single iteration of the event loop
         """
-        fds = self._watch_files.keys()
         if self._alarms or self._did_something:
             if self._alarms:
                 tm = self._alarms[0][0]
@@ -768,10 +775,10 @@ class SelectEventLoop(object):
                     (self._alarms and timeout > 0)):
                 timeout = 0
                 tm = 'idle'
-            ready, w, err = select.select(fds, [], fds, timeout)
+            ready = self._wait(timeout)
         else:
             tm = None
-            ready, w, err = select.select(fds, [], fds)
+            ready = self._wait(None)
 
         if not ready:
             if tm == 'idle':
@@ -779,13 +786,167 @@ class SelectEventLoop(object):
                 self._did_something = False
             elif tm is not None:
                 # must have been a timeout
-                tm, alarm_callback = self._alarms.pop(0)
+                tm, alarm_callback = heapq.heappop(self._alarms)
                 alarm_callback()
                 self._did_something = True
 
         for fd in ready:
-            self._watch_files[fd]()
-            self._did_something = True
+            # an earlier callback may have stopped watching it
+            if fd in self._watch_files:
+                self._watch_files[fd]()
+                self._did_something = True
+
+    def _wait(self, timeout):
+        """
+        Wait until some of the watched files have data to read, or for
+        timeout seconds (forever if None), and return those files.
+        """
+        fds = self._watch_files.keys()
+        if timeout is None:
+            ready, w, err = select.select(fds, [], fds)
+        else:
+            ready, w, err = select.select(fds, [], fds, timeout)
+        return ready
+
+
+class PollEventLoop(SelectEventLoop):
+    """
+    Event loop based on :func:`select.epoll` on Linux, or :func:`select.poll`
+    elsewhere.
+
+    Files are registered with the poller as they are watched, instead of all
+    being passed in on every iteration as with :func:`select.select`, so a
+    wakeup costs the same however many files are watched, and there is no
+    ``FD_SETSIZE`` limit on their numbers.
+
+    epoll refuses regular files and devices like ``/dev/null``; these are
+    always ready to read, so they are reported on every iteration, as
+    :func:`select.select` does.
+    """
+
+    def __init__(self):
+        super(PollEventLoop, self).__init__()
+        self._epoll = hasattr(select, 'epoll')
+        if self._epoll:
+            self._poller = select.epoll()
+            self._poll_events = select.EPOLLIN | select.EPOLLPRI
+            self._hup_events = select.EPOLLHUP | select.EPOLLERR
+        else:
+            self._poller = select.poll()
+            self._poll_events = select.POLLIN | select.POLLPRI
+            self._hup_events = select.POLLHUP | select.POLLERR
+        self._always_ready = []
+
+    @staticmethod
+    def supported():
+        """
+        Return True if the platform has a poller that works with any file;
+        poll() on OS X can't wait on terminals.
+        """
+        return hasattr(select, 'epoll') or (hasattr(select, 'poll')
+            and sys.platform != 'darwin')
+
+    def _test_event_loop(self):
+        """
+        >>> import os
+        >>> rd, wr = os.pipe()
+        >>> evl = PollEventLoop()
+        >>> def step1():
+        ...     print "writing"
+        ...     os.write(wr, "hi".encode('ascii'))
+        >>> def step2():
+        ...     print os.read(rd, 2).decode('ascii')
+        ...     raise ExitMainLoop
+        >>> handle = evl.alarm(0, step1)
+        >>> handle = evl.watch_file(rd, step2)
+        >>> evl.run()
+        writing
+        hi
+        """
+
+    def watch_file(self, fd, callback):
+        """
+        Call callback() when fd has some data to read.  No parameters
+        are passed to callback.
+
+        Returns a handle that may be passed to remove_watch_file()
+
+        fd -- file descriptor to watch for input
+        callback -- function to call when input is available
+        """
+        if fd not in self._watch_files:
+            try:
+                self._poller.register(fd, self._poll_events)
+            except (IOError, OSError), e:
+                if e.errno != errno.EPERM:
+                    raise
+                self._always_ready.append(fd)
+        self._watch_files[fd] = callback
+        return fd
+
+    def remove_watch_file(self, handle):
+        """
+        Remove an input file.
+
+        Returns True if the input file exists, False otherwise
+        """
+        if handle not in self._watch_files:
+            return False
+        del self._watch_files[handle]
+        if handle in self._always_ready:
+            self._always_ready.remove(handle)
+            return True
+        try:
+            self._poller.unregister(handle)
+        except (IOError, OSError, KeyError, ValueError):
+            # already closed, which takes it out of an epoll set
+            pass
+        return True
+
+    def _test_remove_watch_file(self):
+        """
+        >>> import os
+        >>> rd, wr = os.pipe()
+        >>> evl = PollEventLoop()
+        >>> handle = evl.watch_file(rd, lambda: None)
+        >>> evl.remove_watch_file(handle)
+        True
+        >>> evl.remove_watch_file(handle)
+        False
+        """
+
+    def _wait(self, timeout):
+        """
+        Wait until some of the watched files have data to read (or are
+        closed), or for timeout seconds (forever if None), and return
+        those files.
+        """
+        if self._always_ready:
+            timeout = 0
+        if timeout is None:
+            events = self._poller.poll(-1)
+        else:
+            # pollers count whole milliseconds; round up so alarms
+            # never fire early
+            ms = int(math.ceil(timeout * 1000))
+            if self._epoll:
+                events = self._poller.poll(ms / 1000.0 + 1e-4)
+            else:
+                events = self._poller.poll(ms)
+        ready = list(self._always_ready)
+        for fd, event in events:
+            if not self._epoll and event & select.POLLNVAL:
+                # closed without being removed; poll() would keep
+                # reporting it
+                self._poller.unregister(fd)
+            elif event & self._hup_events and not event & self._poll_events:
+                # hung up with nothing left to read: report the end of
+                # file once, then stop polling so the loop doesn't spin
+                self._poller.unregister(fd)
+                ready.append(fd)
+            else:
+                ready.append(fd)
+        return ready
 
 
 if not PYTHON3:
@@ -1269,6 +1430,251 @@ if not PYTHON3:
 
 
 
+class AsyncioEventLoop(object):
+    """
+    Event loop based on the asyncio_ module (Python 3.4+), or its Python 2
+    port trollius_, so that coroutines and the screen can share one loop.
+
+    Like :class:`GLibEventLoop`, idle callbacks are run once after each batch
+    of alarms and input callbacks rather than by polling, so an idle program
+    doesn't wake up.
+
+    .. _asyncio: https://docs.python.org/3/library/asyncio.html
+    .. _trollius: https://pypi.python.org/pypi/trollius
+    """
+
+    def __init__(self, loop=None):
+        """
+        :param loop: asyncio event loop to use; defaults to the one returned
+                     by :func:`asyncio.get_event_loop`
+        """
+        if loop is None:
+            try:
+                import asyncio
+            except ImportError:
+                import trollius as asyncio
+            loop = asyncio.get_event_loop()
+        self._loop = loop
+        self._alarms = set()
+        self._watch_files = {}
+        self._idle_handle = 0
+        self._idle_callbacks = {}
+        self._idle_scheduled = False
+        self._exc_info = None
+
+    def _test_event_loop(self):
+        """
+        >>> import os
+        >>> rd, wr = os.pipe()
+        >>> evl = AsyncioEventLoop()
+        >>> def step1():
+        ...     print "writing"
+        ...     os.write(wr, "hi".encode('ascii'))
+        >>> def step2():
+        ...     print os.read(rd, 2).decode('ascii')
+        ...     raise ExitMainLoop
+        >>> handle = evl.alarm(0, step1)
+        >>> handle = evl.watch_file(rd, step2)
+        >>> evl.run()
+        writing
+        hi
+        """
+
+    def alarm(self, seconds, callback):
+        """
+        Call callback() given time from from now.  No parameters are
+        passed to callback.
+
+        Returns a handle that may be passed to remove_alarm()
+
+        seconds -- floating point time to wait before calling callback
+        callback -- function to call from event loop
+        """
+        def alarm_callback():
+            self._alarms.discard(handle)
+            callback()
+        handle = self._loop.call_later(max(seconds, 0),
+            self.handle_exit(alarm_callback))
+        self._alarms.add(handle)
+        return handle
+
+    def remove_alarm(self, handle):
+        """
+        Remove an alarm.
+
+        Returns True if the alarm exists, False otherwise
+        """
+        if handle not in self._alarms:
+            return False
+        self._alarms.discard(handle)
+        handle.cancel()
+        return True
+
+    def _test_remove_alarm(self):
+        """
+        >>> evl = AsyncioEventLoop()
+        >>> handle = evl.alarm(50, lambda: None)
+        >>> evl.remove_alarm(handle)
+        True
+        >>> evl.remove_alarm(handle)
+        False
+        """
+
+    def watch_file(self, fd, callback):
+        """
+        Call callback() when fd has some data to read.  No parameters
+        are passed to callback.
+
+        Returns a handle that may be passed to remove_watch_file()
+
+        fd -- file descriptor to watch for input
+        callback -- function to call when input is available
+        """
+        self._loop.add_reader(fd, self.handle_exit(callback))
+        self._watch_files[fd] = callback
+        return fd
+
+    def remove_watch_file(self, handle):
+        """
+        Remove an input file.
+
+        Returns True if the input file exists, False otherwise
+        """
+        if handle in self._watch_files:
+            self._loop.remove_reader(handle)
+            del self._watch_files[handle]
+            return True
+        return False
+
+    def _test_remove_watch_file(self):
+        """
+        >>> import os
+        >>> rd, wr = os.pipe()
+        >>> evl = AsyncioEventLoop()
+        >>> handle = evl.watch_file(rd, lambda: None)
+        >>> evl.remove_watch_file(handle)
+        True
+        >>> evl.remove_watch_file(handle)
+        False
+        """
+
+    def enter_idle(self, callback):
+        """
+        Add a callback for entering idle.
+
+        Returns a handle that may be passed to remove_enter_idle()
+        """
+        self._idle_handle += 1
+        self._idle_callbacks[self._idle_handle] = callback
+        self._enable_idle()
+        return self._idle_handle
+
+    def _enable_idle(self):
+        """
+        Run the idle callbacks once the callbacks that are ready now have run.
+        """
+        if self._idle_scheduled:
+            return
+        self._loop.call_soon(self.handle_exit(self._idle_callback,
+            enable_idle=False))
+        self._idle_scheduled = True
+
+    def _idle_callback(self):
+        self._idle_scheduled = False
+        for callback in self._idle_callbacks.values():
+            callback()
+
+    def remove_enter_idle(self, handle):
+        """
+        Remove an idle callback.
+
+        Returns True if the handle was removed.
+        """
+        try:
+            del self._idle_callbacks[handle]
+        except KeyError:
+            return False
+        return True
+
+    def run(self):
+        """
+        Start the event loop.  Exit the loop when any callback raises
+        an exception.  If ExitMainLoop is raised, exit cleanly.
+        """
+        self._loop.run_forever()
+        if self._exc_info:
+            # An exception caused us to exit, raise it now
+            exc_info = self._exc_info
+            self._exc_info = None
+            raise exc_info[0], exc_info[1], exc_info[2]
+
+    def _test_run(self):
+        """
+        >>> import os
+        >>> rd, wr = os.pipe()
+        >>> os.write(wr, "data".encode('ascii')) # something to read from rd
+        4
+        >>> evl = AsyncioEventLoop()
+        >>> def say_hello():
+        ...     print "hello"
+        >>> def say_waiting():
+        ...     print "waiting"
+        >>> def exit_clean():
+        ...     print "clean exit"
+        ...     raise ExitMainLoop
+        >>> def exit_error():
+        ...     1/0
+        >>> handle = evl.alarm(0.01, exit_clean)
+        >>> handle = evl.alarm(0.005, say_hello)
+        >>> evl.enter_idle(say_waiting)
+        1
+        >>> evl.run()
+        waiting
+        hello
+        waiting
+        clean exit
+        >>> handle = evl.watch_file(rd, exit_clean)
+        >>> evl.run()
+        clean exit
+        >>> evl.remove_watch_file(handle)
+        True
+        >>> handle = evl.alarm(0, exit_error)
+        >>> evl.run()
+        Traceback (most recent call last):
+           ...
+        ZeroDivisionError: integer division or modulo by zero
+        >>> handle = evl.watch_file(rd, exit_error)
+        >>> evl.run()
+        Traceback (most recent call last):
+           ...
+        ZeroDivisionError: integer division or modulo by zero
+        """
+
+    def handle_exit(self, f, enable_idle=True):
+        """
+        Decorator that cleanly stops the asyncio loop if :exc:`ExitMainLoop`
+        is thrown inside of the wrapped function. Store the exception info if
+        some other exception occurs, it will be reraised after the loop stops.
+
+        *f* -- function to be wrapped
+        """
+        def wrapper(*args, **kargs):
+            try:
+                rval = f(*args, **kargs)
+            except ExitMainLoop:
+                self._loop.stop()
+            except:
+                import sys
+                self._exc_info = sys.exc_info()
+                self._loop.stop()
+            else:
+                if enable_idle:
+                    self._enable_idle()
+                return rval
+        return wrapper
+
+
+
 def _refl(name, rval=None, exit=False):
     """
     This function is used to test the main loop classes.
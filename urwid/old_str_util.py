@@ -21,11 +21,16 @@
 # Urwid web site: http://excess.org/urwid/
 
 import re
+from array import array
+from bisect import bisect_left
 
 from urwid.compat import bytes, B, ord2
 
 SAFE_ASCII_RE = re.compile(u"^[ -~]*$")
 SAFE_ASCII_BYTES_RE = re.compile(B("^[ -~]*$"))
+# a run of printable ASCII, one column per character
+_ascii_run = re.compile(u"[ -~]*").match
+_ascii_run_bytes = re.compile(B("[ -~]*")).match
 
 _byte_encoding = None
 
@@ -74,16 +79,36 @@ widths = [
     (1114109, 1),
 ]
 
+# LOOKUP TABLES
+
+def _bmp_width_table():
+    """
+    Return an array of the widths of all ordinals below 0x10000, so
+    these can be looked up directly.
+    """
+    table = array('b')
+    for num, wid in widths:
+        end = min(num, 0xffff) + 1
+        table.extend(array('b', [wid]) * (end - len(table)))
+        if end > 0xffff:
+            break
+    table.extend(array('b', [1]) * (0x10000 - len(table)))
+    table[0xe] = table[0xf] = 0
+    return table
+
+_bmp_widths = _bmp_width_table()
+# the last ordinal of each range in widths, to bisect for higher ordinals
+_width_ends = [num for num, wid in widths]
+
 # ACCESSOR FUNCTIONS
 
 def get_width( o ):
     """Return the screen column width for unicode ordinal o."""
-    global widths
-    if o == 0xe or o == 0xf:
-        return 0
-    for num, wid in widths:
-        if o <= num:
-            return wid
+    if o < 0x10000:
+        return _bmp_widths[o]
+    i = bisect_left(_width_ends, o)
+    if i < len(widths):
+        return widths[i][1]
     return 1
 
 def decode_one( text, pos ):
@@ -182,13 +207,20 @@ def calc_text_pos(text, start_offs, end_offs, pref_col):
     utfs = isinstance(text, bytes) and _byte_encoding == "utf8"
     unis = not isinstance(text, bytes)
     if unis or utfs:
+        # skip over printable ASCII, one column per character
+        end = min(end_offs, start_offs + max(pref_col, 0))
+        i = [_ascii_run_bytes, _ascii_run][unis](text, start_offs, end).end()
+        sc = i - start_offs
+        if i == end_offs:
+            return i, sc
         decode = [decode_one, decode_one_uni][unis]
-        i = start_offs
-        sc = 0
         n = 1 # number to advance by
         while i < end_offs:
             o, n = decode(text, i)
-            w = get_width(o)
+            if o < 0x10000:
+                w = _bmp_widths[o]
+            else:
+                w = get_width(o)
             if w+sc > pref_col: 
                 return i, sc
             i = n
@@ -219,19 +251,29 @@ def calc_width(text, start_offs, end_offs):
 
     utfs = isinstance(text, bytes) and _byte_encoding == "utf8"
     unis = not isinstance(text, bytes)
-    if (unis and not SAFE_ASCII_RE.match(text)
-            ) or (utfs and not SAFE_ASCII_BYTES_RE.match(text)):
-        decode = [decode_one, decode_one_uni][unis]
-        i = start_offs
-        sc = 0
+    if unis or utfs:
+        # skip over printable ASCII, one column per character
+        i = [_ascii_run_bytes, _ascii_run][unis](text, start_offs,
+            end_offs).end()
+        sc = i - start_offs
+        if unis:
+            for c in text[i:end_offs]:
+                o = ord(c)
+                if o < 0x10000:
+                    sc += _bmp_widths[o]
+                else:
+                    sc += get_width(o)
+            return sc
         n = 1 # number to advance by
         while i < end_offs:
-            o, n = decode(text, i)
-            w = get_width(o)
+            o, n = decode_one(text, i)
+            if o < 0x10000:
+                sc += _bmp_widths[o]
+            else:
+                sc += get_width(o)
             i = n
-            sc += w
         return sc
-    # "wide", "narrow" or all printable ASCII, just return the character count
+    # "wide" or "narrow", just return the character count
     return end_offs - start_offs
 
 def is_wide_char(text, offs):
@@ -23,9 +23,11 @@
 Direct terminal UI implementation
 """
 
+import errno
 import fcntl
 import termios
 import os
+import re
 import select
 import struct
 import sys
@@ -35,13 +37,15 @@ import signal
 from urwid import util
 from urwid import escape
 from urwid.display_common import BaseScreen, RealTerminal, \
-    UPDATE_PALETTE_ENTRY, AttrSpec, UNPRINTABLE_TRANS_TABLE, \
+    UPDATE_PALETTE_ENTRY, AttrSpec, AttrMemo, UNPRINTABLE_TRANS_TABLE, \
     INPUT_DESCRIPTORS_CHANGED
 from urwid import signals
 from urwid.compat import PYTHON3, bytes, B
 
 from subprocess import Popen, PIPE
 
+_non_ascii = re.compile(B("[\x80-\xff]"))
+
 
 class Screen(BaseScreen, RealTerminal):
     def __init__(self):
@@ -50,6 +54,7 @@ class Screen(BaseScreen, RealTerminal):
         """
         super(Screen, self).__init__()
         self._pal_escape = {}
+        self._attr_escape = AttrMemo(self._attr_to_escape)
         signals.connect_signal(self, UPDATE_PALETTE_ENTRY, 
             self._on_update_palette_entry)
         self.colors = 16 # FIXME: detect this
@@ -60,6 +65,12 @@ class Screen(BaseScreen, RealTerminal):
         self.set_input_timeouts()
         self.screen_buf = None
         self._screen_buf_canvas = None
+        self._screen_buf_cells = None
+        self._screen_buf_cursor = None
+        # escape sequences last sent for the attribute and character
+        # set, or None if the terminal's state is not known
+        self._term_attr = None
+        self._term_cs = None
         self._resized = False
         self.maxrow = None
         self.gpm_mev = None
@@ -69,6 +80,7 @@ class Screen(BaseScreen, RealTerminal):
         self._rows_used = None
         self._cy = 0
         self.bright_is_bold = os.environ.get('TERM',None) != "xterm"
+        self.synchronized_update = False
         self._next_timeout = None
         self._term_output_file = sys.stdout
         self._term_input_file = sys.stdin
@@ -80,6 +92,9 @@ class Screen(BaseScreen, RealTerminal):
         # copy the attribute to a dictionary containing the escape seqences
         self._pal_escape[name] = self._attrspec_to_escape(
             attrspecs[{16:0,1:1,88:2,256:3}[self.colors]])
+        self._attr_escape.clear()
+        # rows already on screen may use the old escape sequence
+        self.screen_buf = None
 
     def set_input_timeouts(self, max_wait=None, complete_wait=0.125, 
         resize_wait=0.125):
@@ -555,23 +570,27 @@ class Screen(BaseScreen, RealTerminal):
             # handle resize before trying to draw screen
             return
         
-        o = [escape.HIDE_CURSOR, self._attrspec_to_escape(AttrSpec('',''))]
+        o = []
         
         def partial_display():
             # returns True if the screen is in partial display mode
             # ie. only some rows belong to the display
             return self._rows_used is not None
 
-        if not partial_display():
-            o.append(escape.CURSOR_HOME)
-
         if self.screen_buf:
             osb = self.screen_buf
+            ocells = self._screen_buf_cells
         else:
             osb = []
+            ocells = []
         sb = []
+        cells = []
         cy = self._cy
         y = -1
+        # where the cursor is after the last span written, if known;
+        # cx is None just past the edge of a line
+        last_y = None
+        cx = None
 
         def set_cursor_home():
             if not partial_display():
@@ -579,11 +598,6 @@ class Screen(BaseScreen, RealTerminal):
             return (escape.CURSOR_HOME_COL + 
                 escape.move_cursor_up(cy))
         
-        def set_cursor_row(y):
-            if not partial_display():
-                return escape.set_cursor_position(0, y)
-            return escape.move_cursor_down(y - cy)
-
         def set_cursor_position(x, y):
             if not partial_display():
                 return escape.set_cursor_position(x, y)
@@ -594,6 +608,17 @@ class Screen(BaseScreen, RealTerminal):
             return ('\b' + escape.CURSOR_HOME_COL +
                 escape.move_cursor_down(y - cy) +
                 escape.move_cursor_right(x))
+
+        def move_cursor(x, y):
+            # the shortest way from the last span written to (x, y)
+            if partial_display() or last_y is None or y < last_y:
+                return set_cursor_position(x, y)
+            moves = [escape.set_cursor_position(x, y),
+                escape.CURSOR_HOME_COL + "\n" * (y - last_y) +
+                escape.move_cursor_right(x)]
+            if y == last_y and cx is not None and x >= cx:
+                moves.append(escape.move_cursor_right(x - cx))
+            return min(moves, key=len)
         
         def is_blank_row(row):
             if len(row) > 1:
@@ -602,28 +627,38 @@ class Screen(BaseScreen, RealTerminal):
                 return False
             return True
 
-        def attr_to_escape(a):
-            if a in self._pal_escape:
-                return self._pal_escape[a]
-            elif isinstance(a, AttrSpec):
-                return self._attrspec_to_escape(a)
-            # undefined attributes use default/default
-            # TODO: track and report these
-            return self._attrspec_to_escape(
-                AttrSpec('default','default'))
-
-        ins = None
-        o.append(set_cursor_home())
-        cy = 0
+        attr_to_escape = self._attr_escape.__getitem__
+
+        def set_attr_cs(a, cs):
+            # send only what differs from the terminal's current state
+            assert cs in [None, "0", "U"], repr(cs)
+            ae = attr_to_escape(a)
+            if ae != self._term_attr:
+                o.append(ae)
+                self._term_attr = ae
+            cse = {None: escape.SI, "0": escape.SO,
+                "U": escape.IBMPC_ON}[cs]
+            if cse != self._term_cs:
+                if self._term_cs == escape.IBMPC_ON:
+                    o.append( escape.IBMPC_OFF )
+                o.append(cse)
+                self._term_cs = cse
+
+        if partial_display():
+            o.append(set_cursor_home())
+            cy = 0
         for row in r.content():
             y += 1
-            if False and osb and osb[y] == row:
+            if y < len(osb) and osb[y] == row:
                 # this row of the screen buffer matches what is
                 # currently displayed, so we can skip this line
                 sb.append( osb[y] )
+                cells.append( ocells[y] )
                 continue
 
             sb.append(row)
+            rcells = self._row_cells(row)
+            cells.append(rcells)
 
             # leave blank lines off display when we are using
             # the default screen buffer (allows partial screen)
@@ -632,87 +667,242 @@ class Screen(BaseScreen, RealTerminal):
                     continue
                 self._rows_used = y
 
-            if y or partial_display():
-                o.append(set_cursor_position(0, y))
-            # after updating the line we will be just over the
-            # edge, but terminals still treat this as being
-            # on the same line
-            cy = y
-
-            whitespace_at_end = False
-            if row and row[-1][2][-1:] == B(' '):
-                whitespace_at_end = True
-                a, cs, run = row[-1]
-                row = row[:-1] + [(a, cs, run.rstrip(B(' ')))]
-            elif y == maxrow-1 and maxcol>1:
-                row, back, ins = self._last_row(row)
-
-            first = True
-            lasta = lastcs = None
-            for (a,cs, run) in row:
-                assert isinstance(run, bytes) # canvases should render with bytes
-                if cs != 'U':
-                    run = run.translate(UNPRINTABLE_TRANS_TABLE)
-                if first or lasta != a:
-                    o.append(attr_to_escape(a))
-                    lasta = a
-                if first or lastcs != cs:
-                    assert cs in [None, "0", "U"], repr(cs)
-                    if lastcs == "U":
-                        o.append( escape.IBMPC_OFF )
-
+            if y < len(ocells):
+                spans = self._changed_spans(ocells[y], rcells)
+            else:
+                spans = [(0, len(rcells))]
+
+            for start, end in spans:
+                if y == maxrow-1 and end == maxcol and maxcol > 1:
+                    # the last row needs two characters to slide the
+                    # bottom right one into place
+                    chars = len([c for c in rcells[start:end]
+                        if c[2] is not None])
+                    while chars < 2 and start:
+                        start -= 1
+                        if rcells[start][2] is not None:
+                            chars += 1
+
+                o.append(move_cursor(start, y))
+                # after updating the line we will be just over the
+                # edge, but terminals still treat this as being
+                # on the same line
+                cy = last_y = y
+                cx = end if end < maxcol else None
+
+                span = self._cells_to_row(rcells[start:end])
+                ins = None
+                whitespace_at_end = False
+                if end < maxcol:
+                    pass
+                elif span[-1][2][-1:] == B(' '):
+                    whitespace_at_end = True
+                    a, cs, run = span[-1]
+                    span = span[:-1] + [(a, cs, run.rstrip(B(' ')))]
+                elif y == maxrow-1 and maxcol>1:
+                    span, back, ins = self._last_row(span)
+
+                for (a,cs, run) in span:
+                    assert isinstance(run, bytes) # canvases should render with bytes
+                    if cs != 'U':
+                        run = run.translate(UNPRINTABLE_TRANS_TABLE)
+                    set_attr_cs(a, cs)
+                    o.append( run )
+                if ins:
+                    (inserta, insertcs, inserttext) = ins
+                    ias = attr_to_escape(inserta)
+                    assert insertcs in [None, "0", "U"], repr(insertcs)
                     if cs is None:
-                        o.append( escape.SI )
+                        icss = escape.SI
                     elif cs == "U":
-                        o.append( escape.IBMPC_ON )
+                        icss = escape.IBMPC_ON
                     else:
-                        o.append( escape.SO )
-                    lastcs = cs
-                o.append( run )
-                first = False
-            if ins:
-                (inserta, insertcs, inserttext) = ins
-                ias = attr_to_escape(inserta)
-                assert insertcs in [None, "0", "U"], repr(insertcs)
-                if cs is None:
-                    icss = escape.SI
-                elif cs == "U":
-                    icss = escape.IBMPC_ON
-                else:
-                    icss = escape.SO
-                o += [    "\x08"*back, 
-                    ias, icss,
-                    escape.INSERT_ON, inserttext,
-                    escape.INSERT_OFF ]
-
-                if cs == "U":
-                    o.append(escape.IBMPC_OFF)
-            if whitespace_at_end:
-                o.append(escape.ERASE_IN_LINE_RIGHT)
+                        icss = escape.SO
+                    o += [    "\x08"*back, 
+                        ias, icss,
+                        escape.INSERT_ON, inserttext,
+                        escape.INSERT_OFF ]
+
+                    if cs == "U":
+                        o.append(escape.IBMPC_OFF)
+                    self._term_attr = self._term_cs = None
+                if whitespace_at_end:
+                    o.append(escape.ERASE_IN_LINE_RIGHT)
+
+        if last_y is None and r.cursor == self._screen_buf_cursor:
+            # no row has changed and the cursor is where it was, so
+            # there is nothing at all to send
+            self.screen_buf = sb
+            self._screen_buf_cells = cells
+            self._screen_buf_canvas = r
+            return
 
+        if not osb or self._screen_buf_cursor is not None:
+            o.insert(0, escape.HIDE_CURSOR)
         if r.cursor is not None:
             x,y = r.cursor
             o += [set_cursor_position(x, y),
                 escape.SHOW_CURSOR  ]
             self._cy = y
 
+        if self.synchronized_update:
+            o.insert(0, escape.SYNCHRONIZED_UPDATE_BEGIN)
+            o.append(escape.SYNCHRONIZED_UPDATE_END)
+
         if self._resized:
             # handle resize before trying to draw screen
+            self._term_attr = self._term_cs = None
             return
+        if PYTHON3:
+            o = [l if isinstance(l, bytes) else l.encode('utf-8')
+                for l in o]
         try:
-            for l in o:
-                if isinstance(l, bytes) and PYTHON3:
-                    l = l.decode('utf-8')
-                self._term_output_file.write(l)
-            self._term_output_file.flush()
-        except IOError, e:
-            # ignore interrupted syscall
-            if e.args[0] != 4:
-                raise
+            self._write(B('').join(o))
+        except:
+            self._term_attr = self._term_cs = None
+            raise
 
         self.screen_buf = sb
+        self._screen_buf_cells = cells
         self._screen_buf_canvas = r
+        self._screen_buf_cursor = r.cursor
 
+    def _write(self, data):
+        """
+        Write data to the terminal with as few system calls as possible,
+        carrying on after partial writes and interrupted system calls.
+        """
+        out = self._term_output_file
+        try:
+            fd = out.fileno()
+        except (AttributeError, IOError, ValueError):
+            # not a real file, eg. a StringIO
+            if PYTHON3:
+                data = data.decode('utf-8')
+            out.write(data)
+            out.flush()
+            return
+
+        # send anything still held by the file object first
+        while True:
+            try:
+                out.flush()
+                break
+            except IOError, e:
+                if e.args[0] != errno.EINTR:
+                    raise
+
+        data = memoryview(data)
+        while len(data):
+            try:
+                data = data[os.write(fd, data):]
+            except OSError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                if e.errno != errno.EAGAIN:
+                    raise
+                # the terminal is not blocking and can't take more yet
+                select.select([], [fd], [])
+
+    def _row_cells(self, row):
+        """
+        Split a rendered row into one (attr, cs, text) tuple per screen
+        column. The second column of a wide character has None as its
+        text, and zero width characters join the character before them.
+
+        >>> s = Screen()
+        >>> s._row_cells([('a', None, B('ab')), ('b', 'U', B('c'))])
+        [('a', None, 'a'), ('a', None, 'b'), ('b', 'U', 'c')]
+        >>> util.set_encoding('utf8')
+        >>> s._row_cells([('a', None, B('e\\xcc\\x81\\xe4\\xb8\\xad'))])
+        [('a', None, 'e\\xcc\\x81'), ('a', None, '\\xe4\\xb8\\xad'), ('a', None, None)]
+        """
+        cells = []
+        # zero width characters with nothing before them to join
+        pending = B('')
+        narrow = util.get_encoding_mode() == "narrow"
+        for a, cs, run in row:
+            if narrow or cs is not None or not _non_ascii.search(run):
+                # one byte per column
+                cells.extend([(a, cs, run[i:i+1])
+                    for i in range(len(run))])
+                continue
+            i = 0
+            while i < len(run):
+                j = util.move_next_char(run, i, len(run))
+                width = util.calc_width(run, i, j)
+                if width:
+                    cells.append((a, cs, pending + run[i:j]))
+                    cells.extend([(a, cs, None)] * (width - 1))
+                    pending = B('')
+                else:
+                    # combine with the character it belongs to
+                    k = len(cells) - 1
+                    while k >= 0 and cells[k][2] is None:
+                        k -= 1
+                    if k < 0:
+                        pending += run[i:j]
+                    else:
+                        ka, kcs, ktext = cells[k]
+                        cells[k] = (ka, kcs, ktext + run[i:j])
+                i = j
+        return cells
+
+    def _changed_spans(self, old, new):
+        """
+        Return the (start, end) column spans where cells differ between
+        two versions of a row. Spans closer together than it takes to
+        move the cursor between them are joined, and spans never split
+        a wide character.
+
+        >>> s = Screen()
+        >>> old = s._row_cells([(None, None, B('0:00 of 3:45   play'))])
+        >>> new = s._row_cells([(None, None, B('0:01 of 3:45 paused'))])
+        >>> s._changed_spans(old, new)
+        [(3, 4), (13, 19)]
+        >>> s._changed_spans(new, new)
+        []
+        """
+        if len(old) != len(new):
+            return [(0, len(new))]
+        spans = []
+        x = 0
+        while x < len(new):
+            if old[x] == new[x]:
+                x += 1
+                continue
+            start = x
+            while start and (new[start][2] is None or
+                    old[start][2] is None):
+                start -= 1
+            x += 1
+            while x < len(new) and (old[x] != new[x] or
+                    new[x][2] is None or old[x][2] is None):
+                x += 1
+            if spans and (start - spans[-1][1] <
+                    len(escape.move_cursor_right(start - spans[-1][1]))):
+                start = spans.pop()[0]
+            spans.append((start, x))
+        return spans
+
+    def _cells_to_row(self, cells):
+        """
+        Join cells back into (attr, cs, run) segments.
+
+        >>> s = Screen()
+        >>> s._cells_to_row(s._row_cells([('a', None, B('ab')),
+        ...     ('a', None, B('c')), ('b', None, B('d'))]))
+        [('a', None, 'abc'), ('b', None, 'd')]
+        """
+        row = []
+        for a, cs, text in cells:
+            if text is None:
+                continue
+            if row and row[-1][0] == a and row[-1][1] == cs:
+                row[-1][2].append(text)
+            else:
+                row.append((a, cs, [text]))
+        return [(a, cs, B('').join(run)) for a, cs, run in row]
 
     def _last_row(self, row):
         """On the last row we need to slide the bottom right character
@@ -767,9 +957,27 @@ class Screen(BaseScreen, RealTerminal):
         call to draw_screen().
         """
         self.screen_buf = None
+        self._term_attr = self._term_cs = None
         self.setup_G1 = True
 
         
+    def _attr_to_escape(self, a):
+        """
+        Return the escape sequence for a palette entry name or AttrSpec.
+        Called through the self._attr_escape memo.
+
+        >>> s = Screen()
+        >>> s._attr_to_escape('undefined')
+        '\\x1b[0;39;49m'
+        """
+        if a in self._pal_escape:
+            return self._pal_escape[a]
+        elif isinstance(a, AttrSpec):
+            return self._attrspec_to_escape(a)
+        # undefined attributes use default/default
+        # TODO: track and report these
+        return self._attrspec_to_escape(AttrSpec('default','default'))
+
     def _attrspec_to_escape(self, a):
         """
         Convert AttrSpec instance a to an escape sequence for the terminal
@@ -810,7 +1018,7 @@ class Screen(BaseScreen, RealTerminal):
 
 
     def set_terminal_properties(self, colors=None, bright_is_bold=None,
-        has_underline=None):
+        has_underline=None, synchronized_update=None):
         """
         colors -- number of colors terminal supports (1, 16, 88 or 256)
             or None to leave unchanged
@@ -821,7 +1029,14 @@ class Screen(BaseScreen, RealTerminal):
         has_underline -- set to True if this terminal can use the
             underline setting, False if it cannot or None to leave
             unchanged
+        synchronized_update -- set to True to have the terminal show
+            each frame at once (for terminals that support synchronized
+            updates, ignored by the rest), False to stop or None to
+            leave unchanged
         """
+        if synchronized_update is not None:
+            self.synchronized_update = synchronized_update
+
         if colors is None:
             colors = self.colors
         if bright_is_bold is None:
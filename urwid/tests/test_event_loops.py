@@ -0,0 +1,195 @@
+import os
+import select
+import tempfile
+import unittest
+
+import urwid
+from urwid.main_loop import SelectEventLoop, PollEventLoop, \
+    AsyncioEventLoop
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+
+class EventLoopTestMixin(object):
+    def test_alarms_fire_in_order(self):
+        evl = self.evl
+        fired = []
+        for delay in (0.03, 0.01, 0.05, 0.02, 0.04, 0.0):
+            evl.alarm(delay, lambda delay=delay: fired.append(delay))
+        removed = evl.alarm(0.025, lambda: fired.append("removed"))
+        self.assertTrue(evl.remove_alarm(removed))
+        def exit():
+            raise urwid.ExitMainLoop()
+        evl.alarm(0.06, exit)
+        evl.run()
+        self.assertEqual(fired, [0.0, 0.01, 0.02, 0.03, 0.04, 0.05])
+
+    def test_watch_many_files(self):
+        evl = self.evl
+        pipes = [os.pipe() for i in range(200)]
+        seen = []
+        try:
+            for i, (rd, wr) in enumerate(pipes):
+                def read(rd=rd, i=i):
+                    os.read(rd, 1)
+                    seen.append(i)
+                    if len(seen) == 3:
+                        raise urwid.ExitMainLoop()
+                evl.watch_file(rd, read)
+            # stop watching one of the pipes written to
+            self.assertTrue(evl.remove_watch_file(pipes[150][0]))
+            for i in (7, 150, 199, 42):
+                os.write(pipes[i][1], "x".encode('ascii'))
+            evl.run()
+            self.assertEqual(sorted(seen), [7, 42, 199])
+        finally:
+            for rd, wr in pipes:
+                os.close(rd)
+                os.close(wr)
+
+    def test_closed_pipe_is_readable(self):
+        evl = self.evl
+        rd, wr = os.pipe()
+        os.close(wr)
+        def read():
+            self.assertEqual(os.read(rd, 1), "".encode('ascii'))
+            evl.remove_watch_file(rd)
+            raise urwid.ExitMainLoop()
+        evl.watch_file(rd, read)
+        evl.run()
+        os.close(rd)
+
+
+class PollEventLoopTestMixin(EventLoopTestMixin):
+    def exit_after(self, seconds):
+        def exit():
+            raise urwid.ExitMainLoop()
+        self.evl.alarm(seconds, exit)
+
+    def test_files_epoll_refuses(self):
+        evl = self.evl
+        seen = set()
+        with tempfile.TemporaryFile() as regular:
+            with open(os.devnull) as null:
+                def read(f):
+                    seen.add(f)
+                    if len(seen) == 2:
+                        raise urwid.ExitMainLoop()
+                for f in (regular, null):
+                    evl.watch_file(f.fileno(), lambda f=f: read(f))
+                evl.run()
+                self.assertTrue(evl.remove_watch_file(regular.fileno()))
+                self.assertTrue(evl.remove_watch_file(null.fileno()))
+                self.assertFalse(evl.remove_watch_file(null.fileno()))
+
+    def test_hung_up_pipe_reported_once(self):
+        evl = self.evl
+        rd, wr = os.pipe()
+        os.write(wr, "x".encode('ascii'))
+        os.close(wr)
+        reads = []
+        # a callback that doesn't stop watching at the end of file
+        evl.watch_file(rd, lambda: reads.append(os.read(rd, 1)))
+        self.exit_after(0.05)
+        evl.run()
+        self.assertEqual(reads, ["x".encode('ascii'), "".encode('ascii')])
+        self.assertTrue(evl.remove_watch_file(rd))
+        os.close(rd)
+
+    def test_closed_without_removing(self):
+        evl = self.evl
+        rd, wr = os.pipe()
+        calls = []
+        evl.watch_file(rd, lambda: calls.append(rd))
+        os.close(rd)
+        os.close(wr)
+        self.exit_after(0.05)
+        evl.run()
+        self.assertEqual(calls, [])
+        self.assertTrue(evl.remove_watch_file(rd))
+
+
+class SelectEventLoopTest(unittest.TestCase, EventLoopTestMixin):
+    def setUp(self):
+        self.evl = SelectEventLoop()
+
+
+class PollEventLoopTest(unittest.TestCase, PollEventLoopTestMixin):
+    def setUp(self):
+        self.evl = PollEventLoop()
+
+    def test_default_for_main_loop(self):
+        loop = urwid.MainLoop(urwid.SolidFill(), screen=urwid.raw_display.Screen())
+        self.assertTrue(isinstance(loop.event_loop, PollEventLoop))
+
+
+class PollFallbackEventLoopTest(unittest.TestCase, PollEventLoopTestMixin):
+    # poll() where there is no epoll
+    def setUp(self):
+        self.evl = PollEventLoop()
+        self.evl._epoll = False
+        self.evl._poller = select.poll()
+        self.evl._poll_events = select.POLLIN | select.POLLPRI
+
+
+@unittest.skipIf(asyncio is None, "neither asyncio nor trollius is installed")
+class AsyncioEventLoopTest(unittest.TestCase, EventLoopTestMixin):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.evl = AsyncioEventLoop(loop=self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def test_remove_alarm(self):
+        evl = self.evl
+        handle = evl.alarm(50, lambda: None)
+        self.assertTrue(evl.remove_alarm(handle))
+        self.assertFalse(evl.remove_alarm(handle))
+
+    def test_remove_fired_alarm(self):
+        evl = self.evl
+        def exit():
+            raise urwid.ExitMainLoop()
+        handle = evl.alarm(0, lambda: None)
+        evl.alarm(0.01, exit)
+        evl.run()
+        self.assertFalse(evl.remove_alarm(handle))
+
+    def test_enter_idle(self):
+        evl = self.evl
+        events = []
+        def exit():
+            events.append("exit")
+            raise urwid.ExitMainLoop()
+        evl.alarm(0.01, exit)
+        evl.alarm(0.005, lambda: events.append("alarm"))
+        handle = evl.enter_idle(lambda: events.append("idle"))
+        evl.run()
+        self.assertEqual(events, ["idle", "alarm", "idle", "exit"])
+        self.assertTrue(evl.remove_enter_idle(handle))
+        self.assertFalse(evl.remove_enter_idle(handle))
+
+    def test_exception_stops_run(self):
+        evl = self.evl
+        rd, wr = os.pipe()
+        try:
+            os.write(wr, "x".encode('ascii'))
+            evl.alarm(0, lambda: 1/0)
+            self.assertRaises(ZeroDivisionError, evl.run)
+            # the loop can be run again afterwards
+            def exit():
+                raise urwid.ExitMainLoop()
+            handle = evl.watch_file(rd, exit)
+            evl.run()
+            self.assertTrue(evl.remove_watch_file(handle))
+            self.assertFalse(evl.remove_watch_file(handle))
+        finally:
+            os.close(rd)
+            os.close(wr)
@@ -0,0 +1,167 @@
+import errno
+import os
+import unittest
+from StringIO import StringIO
+
+import urwid
+from urwid import escape, raw_display
+
+
+class DrawScreenTest(unittest.TestCase):
+    def setUp(self):
+        self.screen = raw_display.Screen()
+        self.screen.register_palette_entry('bar', 'white', 'dark blue')
+        self.screen._term_output_file = StringIO()
+        self.screen._setup_G1_done = True
+        # draw without taking over the terminal
+        self.screen._started = True
+        self.rows = [urwid.Text(u"row %d" % i) for i in range(5)]
+        self.widget = urwid.Filler(urwid.Pile(self.rows), 'top')
+
+    def draw(self, size=(20, 5)):
+        out = self.screen._term_output_file
+        out.seek(0)
+        out.truncate()
+        canvas = self.widget.render(size)
+        self.screen.draw_screen(size, canvas)
+        return out.getvalue()
+
+    def test_first_frame_draws_every_row(self):
+        out = self.draw()
+        for i in range(5):
+            self.assertTrue("row %d" % i in out)
+
+    def test_unchanged_frame_writes_nothing(self):
+        self.draw()
+        self.assertEqual(self.draw(), "")
+
+    def test_only_changed_rows_are_written(self):
+        self.draw()
+        self.rows[2].set_text(u"changed")
+        out = self.draw()
+        self.assertTrue("changed" in out)
+        self.assertTrue(escape.set_cursor_position(0, 2) in out)
+        for i in (0, 1, 3, 4):
+            self.assertFalse("row %d" % i in out)
+
+    def test_adjacent_rows_move_down_a_line(self):
+        self.draw()
+        self.rows[1].set_text(u"one")
+        self.rows[2].set_text(u"two")
+        out = self.draw()
+        self.assertTrue("one  \r\ntwo" in out)
+        self.assertFalse(escape.set_cursor_position(0, 2) in out)
+
+    def test_only_changed_columns_are_written(self):
+        self.rows[4].set_text(u"1:23 of 3:45")
+        self.draw()
+        self.rows[4].set_text(u"1:24 of 3:45")
+        self.assertEqual(self.draw(), escape.set_cursor_position(3, 4) + "4")
+
+    def test_attributes_are_not_resent(self):
+        self.rows[3] = urwid.AttrMap(self.rows[3], 'bar')
+        self.widget = urwid.Filler(urwid.Pile(self.rows), 'top')
+        self.draw()
+        self.rows[0].set_text(u"row 9")
+        self.rows[1].set_text(u"row 8")
+        self.assertEqual(self.draw(), escape.set_cursor_position(4, 0) +
+            "9" + escape.set_cursor_position(4, 1) + "8")
+        self.rows[3].original_widget.set_text(u"row 7")
+        self.rows[4].set_text(u"row 6")
+        pal = self.screen._pal_escape
+        self.assertEqual(self.draw(), escape.set_cursor_position(4, 3) +
+            pal['bar'] + "7" + escape.set_cursor_position(4, 4) +
+            pal[None] + "6")
+
+    def test_clear_redraws_everything(self):
+        self.draw()
+        self.screen.clear()
+        out = self.draw()
+        for i in range(5):
+            self.assertTrue("row %d" % i in out)
+
+    def test_palette_change_redraws(self):
+        self.rows[3] = urwid.AttrMap(self.rows[3], 'bar')
+        self.widget = urwid.Filler(urwid.Pile(self.rows), 'top')
+        self.draw()
+        self.screen.register_palette_entry('bar', 'black', 'light gray')
+        self.assertTrue("row 3" in self.draw())
+
+    def test_wide_char_in_bottom_right_corner(self):
+        urwid.set_encoding("utf8")
+        text = urwid.Text(u"abcdefgh\u4e2d")
+        self.widget = urwid.Filler(text, 'bottom')
+        self.draw((10, 2))
+        text.set_text(u"abcdefgh\u6587")
+        out = self.draw((10, 2))
+        # the character before slides the wide one into place
+        self.assertTrue(out.startswith(escape.set_cursor_position(7, 1)))
+        self.assertTrue(out.endswith(escape.INSERT_ON + "h" +
+            escape.INSERT_OFF))
+
+    def test_zero_width_chars_share_a_column(self):
+        urwid.set_encoding("utf8")
+        self.rows[0].set_text(u"ae\u0301bc 0:01")
+        self.draw()
+        self.rows[0].set_text(u"ae\u0301bc 0:02")
+        self.assertEqual(self.draw(), escape.set_cursor_position(8, 0) + "2")
+
+    def test_synchronized_update(self):
+        self.screen.set_terminal_properties(synchronized_update=True)
+        out = self.draw()
+        self.assertTrue(out.startswith(escape.SYNCHRONIZED_UPDATE_BEGIN))
+        self.assertTrue(out.endswith(escape.SYNCHRONIZED_UPDATE_END))
+        self.assertEqual(self.draw(), "")
+
+
+class WriteTest(unittest.TestCase):
+    def setUp(self):
+        self.rd, wr = os.pipe()
+        self.screen = raw_display.Screen()
+        self.screen._term_output_file = os.fdopen(wr, 'w')
+        self.writes = []
+        self.os_write = raw_display.os.write
+
+    def tearDown(self):
+        raw_display.os.write = self.os_write
+        self.screen._term_output_file.close()
+        os.close(self.rd)
+
+    def test_partial_and_interrupted_writes(self):
+        def write(fd, data):
+            self.writes.append(len(data))
+            if len(self.writes) == 2:
+                raise OSError(errno.EINTR, "Interrupted system call")
+            return self.os_write(fd, data[:7].tobytes())
+        raw_display.os.write = write
+        self.screen._term_output_file.write("before ")
+        data = "0123456789" * 3
+        self.screen._write(data)
+        self.assertEqual(os.read(self.rd, 100), "before " + data)
+        self.assertEqual(self.writes, [30, 23, 23, 16, 9, 2])
+
+
+class AttrEscapeTest(unittest.TestCase):
+    def setUp(self):
+        self.screen = raw_display.Screen()
+        self.calls = []
+        to_escape = self.screen._attrspec_to_escape
+        def counting(a):
+            self.calls.append(a)
+            return to_escape(a)
+        self.screen._attrspec_to_escape = counting
+
+    def test_translated_once(self):
+        escapes = self.screen._attr_escape
+        for i in range(3):
+            escapes[urwid.AttrSpec('yellow', 'dark blue')]
+            escapes['undefined']
+        self.assertEqual(len(self.calls), 2)
+
+    def test_palette_update_invalidates(self):
+        escapes = self.screen._attr_escape
+        self.screen.register_palette_entry('bar', 'white', 'dark blue')
+        first = escapes['bar']
+        self.screen.register_palette_entry('bar', 'black', 'light gray')
+        self.assertNotEqual(escapes['bar'], first)
+        self.assertEqual(escapes['bar'], self.screen._pal_escape['bar'])
@@ -26,6 +26,21 @@ class CalcWidthTest(unittest.TestCase):
         self.wtest("wide", "\xA1\xA1\xA1\xA1", 4)
         self.wtest("invalid", "\xA1", 1)
 
+    def test3_unicode(self):
+        self.assertEqual(util.calc_width(u"hello", 0, 5), 5)
+        self.assertEqual(util.calc_width(u"ab\u66ffcd\u0300", 0, 6), 6)
+        self.assertEqual(util.calc_width(u"a\U0001d11e\U00020000", 0,
+            len(u"a\U0001d11e\U00020000")), 4)
+        self.assertEqual(util.calc_width(u"a\x0eb\x0f", 0, 4), 2)
+
+    def test4_range(self):
+        util.set_encoding("utf-8")
+        # only the range counts, whatever is around it
+        s = B("\xe6\x9b\xbfhello\xe6\x9b\xbf")
+        self.assertEqual(util.calc_width(s, 3, 8), 5)
+        self.assertEqual(util.calc_width(s, 4, 11), 6)
+        self.assertEqual(util.calc_width(u"\u66ffhello\u66ff", 1, 6), 5)
+
 
 class ConvertDecSpecialTest(unittest.TestCase):
     def ctest(self, desc, s, exp, expcs):
@@ -150,6 +165,18 @@ class CalcTextPosTest(unittest.TestCase):
             ]
         self.ctptest(text, tests)
 
+    def test5_unicode(self):
+        text = u"hello \u66ff\u0300 world"
+        tests = [
+            (0,14,5, (5,5)),
+            (0,14,7, (6,6)),
+            (0,14,8, (8,8)),
+            (7,14,0, (8,0)),
+            (8,14,50, (14,6)),
+            ]
+        for s,e,p, expected in tests:
+            self.assertEqual(util.calc_text_pos(text, s, e, p), expected)
+
 
 class TagMarkupTest(unittest.TestCase):
     mytests = [
@@ -149,18 +149,21 @@ class StandardTextLayout(TextLayout):
             return b
 
 
+        n_cr = -1
         while p<=len(text):
-            # look for next eligible line break
-            n_cr = text.find(nl, p)
-            if n_cr == -1:
-                n_cr = len(text)
-            sc = calc_width(text, p, n_cr)
-            if sc == 0:
+            # look for next eligible line break, unless still before it
+            if n_cr < p:
+                n_cr = text.find(nl, p)
+                if n_cr == -1:
+                    n_cr = len(text)
+            # measure no further than fits, not the rest of the paragraph
+            pos, sc = calc_text_pos( text, p, n_cr, width )
+            if pos == n_cr and sc == 0:
                 # removed character hint
                 b.append([(0,n_cr)])
                 p = n_cr+1
                 continue
-            if sc <= width:
+            if pos == n_cr:
                 # this segment fits
                 b.append([(sc,p,n_cr),
                     # removed character hint
@@ -168,7 +171,6 @@ class StandardTextLayout(TextLayout):
 
                 p = n_cr+1
                 continue
-            pos, sc = calc_text_pos( text, p, n_cr, width )
             if pos == p: # pathological width=1 double-byte case
                 raise CanNotDisplayText(
                     "Wide character will not fit in 1-column width")
@@ -0,0 +1,148 @@
+import threading, collections
+
+# VoteQueue
+# =========
+# Sends votes to Songza on a background thread, so the vote keys answer at once.
+# Voting on a song again before its vote was sent replaces the earlier vote.
+# Votes that fail are retried with exponential backoff, and votes not sent yet
+# are kept in the app's `StateStore`, so they survive restarts.
+class VoteQueue:
+	# constructor
+	# * station: the station used to send votes
+	# * store: StateStore pending votes are persisted to, or None to keep them in memory only
+	# * attempts: number of times a vote is tried before it is dropped
+	# * backoff: seconds to wait after the first failure; doubled on each failure after that
+	# * max_backoff: longest wait between two tries
+	# * timeout: longest wait in `stop()` for the vote being sent, e.g. the request timeout
+	def __init__(self, station, store=None, attempts=8, backoff=1, max_backoff=60, timeout=10):
+		self.station = station
+		self.store = store
+		self.attempts = attempts
+		self.backoff = backoff
+		self.max_backoff = max_backoff
+		self.timeout = timeout
+
+		# pending
+		# =======
+		# (station id, song id) => (up, attempts so far) of the votes not sent yet, oldest first
+		self.pending = collections.OrderedDict()
+
+		# sending
+		# =======
+		# Key of the vote the worker is sending, or None
+		self.sending = None
+
+		# wakes the worker when a vote is added or the queue is stopped
+		self.condition = threading.Condition()
+		self.stopped = False
+		self.thread = None
+
+	# load()
+	# ======
+	# Adds the votes saved by an earlier run to the queue.
+	def load(self):
+		if self.store is None:
+			return
+
+		with self.condition:
+			for station_id, song_id, up in self.store.get("votes", []):
+				self.pending.setdefault((station_id, song_id), (up, 0))
+			self.condition.notify()
+
+	# save()
+	# ======
+	# Hands the pending votes to the store. The vote being sent is left out: Songza
+	# may already have counted it, and votes aren't safe to send twice.
+	def save(self):
+		if self.store is None:
+			return
+
+		with self.condition:
+			saved = [[station_id, song_id, vote[0]] for (station_id, song_id), vote in self.pending.items()
+				if (station_id, song_id) != self.sending]
+
+		self.store.set("votes", saved)
+
+	# start()
+	# =======
+	# Starts the worker thread.
+	def start(self):
+		self.stopped = False
+		self.thread = threading.Thread(target=self.run, name="votes")
+		self.thread.daemon = True
+		self.thread.start()
+
+	# stop()
+	# ======
+	# Stops the worker thread, and saves the votes it didn't get to. Waits up to
+	# `timeout` seconds for the vote being sent, so it is only saved if it failed.
+	def stop(self):
+		if self.thread is not None:
+			with self.condition:
+				self.stopped = True
+				self.condition.notify()
+			self.thread.join(self.timeout)
+			self.thread = None
+
+		self.save()
+
+	# vote(song_id, up)
+	# =================
+	# Queues a vote on the song, for the current station.
+	def vote(self, song_id, up):
+		key = (self.station.station_id, song_id)
+
+		with self.condition:
+			# the latest vote on a song wins, and waits its turn again
+			self.pending.pop(key, None)
+			self.pending[key] = (up, 0)
+			self.condition.notify()
+
+		self.save()
+
+	# run()
+	# =====
+	# The worker thread; sends the oldest pending vote, backing off while they fail.
+	def run(self):
+		delay = 0
+
+		while True:
+			with self.condition:
+				# wait for a vote, or out the backoff after a failure
+				if delay:
+					self.condition.wait(delay)
+				while not self.pending and not self.stopped:
+					self.condition.wait()
+
+				if self.stopped:
+					return
+
+				key, (up, attempts) = self.pending.items()[0]
+				self.sending = key
+
+			try:
+				self.station.vote(key[1], up, key[0])
+				error = None
+			except Exception as ex:
+				error = ex
+
+			with self.condition:
+				self.sending = None
+
+				# the user may have voted on the song again meanwhile
+				if self.pending.get(key, (None,))[0] != up:
+					delay = 0
+					continue
+
+				if error is None or attempts + 1 >= self.attempts:
+					del self.pending[key]
+					delay = 0
+				else:
+					self.pending[key] = (up, attempts + 1)
+					delay = min(self.backoff * (2 ** attempts), self.max_backoff)
+
+				# stop() saves what is left, before the store is closed
+				if self.stopped:
+					return
+
+			self.save()